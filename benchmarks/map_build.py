@@ -0,0 +1,140 @@
+"""
+Benchmark: map build suite
+==========================
+
+For every registered map layer (the layers get_map_layer_data serves) and each
+max_points setting, measures:
+
+    load_s          reading the layer's source file and preparing it (read_layer_data)
+    build_s         building the folium map from the loaded data (build_map)
+    render_s        serializing the map to HTML
+    html_bytes      size of the serialized HTML
+    load_peak_mb    peak Python memory allocated while loading (tracemalloc)
+    build_peak_mb   peak Python memory allocated while building and serializing
+
+Times are the best of --repeat runs (Heatmap builds reuse the registry's heat data
+cache after the first run); memory is measured in a separate traced run so
+tracemalloc does not inflate the timings. Runs headless and writes JSON, so results
+from two commits can be diffed:
+
+    python benchmarks/map_build.py [--max-points 6000 9000 13000] [--styles Standard Heatmap]
+                                   [--layers "Total Score" ...] [--repeat 3] [--out results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from map_layers.registry import LAYER_REGISTRY, MAP_STYLES, build_map, read_layer_data  # noqa: E402
+
+MAX_POINTS = [6000, 9000, 13000]
+
+
+def best_time(func, repeat):
+    """(best wall time over repeat calls, result of the last call)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def peak_memory_mb(func):
+    """Peak Python memory allocated by func(), in MB."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_layer(layer_name, max_points_values, styles, repeat):
+    load_s, gdf = best_time(lambda: read_layer_data(layer_name), repeat)
+    result = {
+        "features": len(gdf),
+        "load_s": load_s,
+        "load_peak_mb": peak_memory_mb(lambda: read_layer_data(layer_name)),
+        "builds": {},
+    }
+
+    def build(max_points, display):
+        # Surface layers read their own input grids (and cache the computed surface)
+        if "surface" in LAYER_REGISTRY[layer_name]:
+            return build_map([layer_name], read_layer_data, max_points, display)
+        return build_map([layer_name], lambda _: gdf, max_points, display)
+
+    for display in styles:
+        for max_points in max_points_values:
+            build_s, m = best_time(lambda: build(max_points, display), repeat)
+            render_s, html = best_time(lambda: m.get_root().render(), repeat)
+            result["builds"][f"{display}/{max_points}"] = {
+                "display": display,
+                "max_points": max_points,
+                "build_s": build_s,
+                "render_s": render_s,
+                "html_bytes": len(html.encode("utf-8")),
+                "build_peak_mb": peak_memory_mb(lambda: build(max_points, display).get_root().render()),
+            }
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-points", type=int, nargs="+", default=MAX_POINTS)
+    parser.add_argument("--styles", nargs="+", choices=MAP_STYLES, default=["Standard"])
+    parser.add_argument("--layers", nargs="+", choices=list(LAYER_REGISTRY), default=list(LAYER_REGISTRY))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+    out = Path(args.out).resolve() if args.out else None
+
+    # Layer sources are relative to the repository root, as in the app
+    os.chdir(ROOT)
+
+    layers = {}
+    for layer_name in args.layers:
+        source = LAYER_REGISTRY[layer_name]["source"]
+        if not Path(source).exists():
+            layers[layer_name] = {"skipped": f"missing source {source}"}
+            continue
+        print(f"Benchmarking {layer_name}...", file=sys.stderr)
+        layers[layer_name] = benchmark_layer(layer_name, args.max_points, args.styles, args.repeat)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "layers": layers,
+    }
+
+    output = json.dumps(results, indent=2)
+    if out:
+        out.write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
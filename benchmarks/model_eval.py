@@ -0,0 +1,203 @@
+"""
+Benchmark: selection model evaluation
+=====================================
+
+Rebuilds the model inputs for every past application, runs each model artifact on them
+and reports, as JSON:
+
+    features        how the inputs were built and how fast (sites_per_second for the
+                    location scores, which come from the scoring engine)
+    models          per artifact: file hash, load time, accuracy / Brier score / log loss /
+                    expected calibration error / Spearman correlation with dca_score
+                    overall, per year and per geographic pool, a calibration table, and
+                    batch inference latency at several batch sizes
+
+The applicant list has locations, status (Select / Non-Select) and dca_score but not the
+deal inputs (extended affordability, mixed income, ...). Pass them with --features, a CSV
+keyed by development_id whose columns are named like the prediction page inputs; any
+input it lacks is set from --deal (default 0). Location inputs the CSV lacks are scored
+by the engine, which needs the scoring data.
+
+    python benchmarks/model_eval.py [--features deal_inputs.csv] [--deal mixed_income=1 ...] [--workers 4]
+                                    [--models final_model.pkl xgb_model.joblib trees]
+                                    [--batch-sizes 1 1000 10000] [--repeat 5] [--out results.json]
+
+Artifacts whose input width differs from the seven prediction inputs are timed on zeros
+of their width but not scored.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lihtc.train import build_features, load_applicants, parse_deal  # noqa: E402
+from lihtc.trees import TREES_PATH, load_trees  # noqa: E402
+
+MODELS_DIR = "pages/models"
+MODELS = ["final_model.pkl", "final_model.joblib", "xgb_model.joblib", "trees"]
+BATCH_SIZES = [1, 1000, 10000]
+CALIBRATION_BINS = 10
+
+
+def best_time(func, repeat):
+    """(best wall time over repeat calls, result of the last call)"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+#################################################################################################
+# Models
+def load_artifact(name):
+    """(model, predict_proba function returning P(selected) per row, input width)"""
+    if name == "trees":
+        model = load_trees(TREES_PATH)
+        return model, lambda X: model.predict_proba(X)[:, 1], model.n_features_in_
+
+    path = ROOT / MODELS_DIR / name
+    if path.suffix == ".pkl":
+        import pickle
+        with open(path, "rb") as f:
+            model = pickle.load(f)
+    else:
+        import joblib
+        model = joblib.load(path)
+
+    if hasattr(model, "predict_proba"):
+        return model, lambda X: model.predict_proba(X)[:, 1], model.n_features_in_
+
+    # A bare xgboost Booster; binary:logistic predicts probabilities
+    import xgboost
+    return model, lambda X: model.predict(xgboost.DMatrix(X)), model.num_features()
+
+
+def calibration(y, p, bins=CALIBRATION_BINS):
+    """(expected calibration error, per-bin table) over equal-width probability bins."""
+    edges = np.linspace(0.0, 1.0, bins + 1)
+    index = np.clip(np.digitize(p, edges[1:-1]), 0, bins - 1)
+    table, ece = [], 0.0
+    for b in range(bins):
+        in_bin = index == b
+        if not in_bin.any():
+            continue
+        mean_p, observed = float(p[in_bin].mean()), float(y[in_bin].mean())
+        ece += in_bin.mean() * abs(mean_p - observed)
+        table.append({"bin": [float(edges[b]), float(edges[b + 1])], "count": int(in_bin.sum()), "mean_predicted": mean_p, "observed": observed})
+    return float(ece), table
+
+
+def metrics(y, p, dca_score):
+    p_clipped = np.clip(p, 1e-7, 1 - 1e-7)
+    ece, _ = calibration(y, p)
+    return {
+        "n": int(len(y)),
+        "selected": int(y.sum()),
+        "accuracy": float(((p >= 0.5) == y).mean()),
+        "brier": float(np.mean((p - y) ** 2)),
+        "log_loss": float(-np.mean(y * np.log(p_clipped) + (1 - y) * np.log(1 - p_clipped))),
+        "ece": ece,
+        "mean_predicted": float(p.mean()),
+        "observed_rate": float(y.mean()),
+        "dca_score_spearman": float(pd.Series(p).corr(pd.Series(dca_score), method="spearman")) if len(y) > 2 else None,
+    }
+
+
+def evaluate(predict, X, df):
+    valid = ~np.isnan(X).any(axis=1)
+    X, df = X[valid], df[valid].reset_index(drop=True)
+    y, p = df["selected"].to_numpy(), predict(X)
+    dca = pd.to_numeric(df["dca_score"], errors="coerce").to_numpy()
+    result = {"overall": metrics(y, p, dca), "calibration": calibration(y, p)[1]}
+    for column in ["year", "geographic_pool"]:
+        result[f"by_{column}"] = {
+            str(value): metrics(y[rows], p[rows], dca[rows])
+            for value, rows in ((value, (df[column] == value).to_numpy()) for value in sorted(df[column].unique()))
+        }
+    return result
+
+
+def latency(predict, X, batch_sizes, repeat):
+    results = {}
+    for size in batch_sizes:
+        batch = np.resize(X, (size, X.shape[1])).astype(np.float32)
+        seconds, _ = best_time(lambda: predict(batch), repeat)
+        results[str(size)] = {"seconds": seconds, "us_per_row": seconds / size * 1e6}
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", help="CSV of model inputs keyed by development_id")
+    parser.add_argument("--deal", nargs="+", default=[], metavar="KEY=VALUE", help="Deal inputs missing from --features")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for location scoring")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+    out = Path(args.out).resolve() if args.out else None
+    features_csv = Path(args.features).resolve() if args.features else None
+
+    # Data paths are relative to the repository root, as in the app
+    os.chdir(ROOT)
+
+    applicants = load_applicants()
+    print(f"Building inputs for {len(applicants)} applications...", file=sys.stderr)
+    X, feature_stats = build_features(applicants, features_csv, parse_deal(args.deal), args.workers)
+
+    models = {}
+    for name in args.models:
+        print(f"Evaluating {name}...", file=sys.stderr)
+        load_s, (model, predict, width) = best_time(lambda: load_artifact(name), 1)
+        path = ROOT / (TREES_PATH if name == "trees" else f"{MODELS_DIR}/{name}")
+        result = {"sha1": hashlib.sha1(path.read_bytes()).hexdigest()[:12], "load_s": load_s, "n_features": width}
+        if width == X.shape[1]:
+            result.update(evaluate(predict, X, applicants))
+            result["latency"] = latency(predict, X[~np.isnan(X).any(axis=1)], args.batch_sizes + [len(X)], args.repeat)
+        else:
+            result["skipped_evaluation"] = f"expects {width} inputs, the selection model has {X.shape[1]}"
+            result["latency"] = latency(predict, np.zeros((1, width)), args.batch_sizes, args.repeat)
+        models[name] = result
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "features": feature_stats,
+        "models": models,
+    }
+
+    output = json.dumps(results, indent=2)
+    if out:
+        out.write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
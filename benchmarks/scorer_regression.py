@@ -0,0 +1,276 @@
+"""
+Benchmark: scorer regression suite
+==================================
+
+Runs each of the four scorers (CommunityTransportationOptions, DesirableUndesirableActivities,
+QualityEducation, StableCommunities) over a fixed golden set of sites - the past applicant
+locations plus a seeded sample of score grid points - and compares against the golden file:
+
+    scores          every site's score from every scorer must equal the recorded value
+                    (within --tolerance, default exact)
+    latency_ms      per-call latency (construct + calculate_score; best of --repeat per
+                    site), p50/p95/mean over the sites
+    sites_per_second  throughput of one pass over all sites
+
+Exits 1 if any score drifted, if a scorer's p50 latency or throughput is more than
+--max-slowdown worse than recorded (timings only compare on the machine that recorded
+them; --max-slowdown 0 skips the check), or if a scorer's data changed since its scores
+were recorded. A deliberate change is accepted by re-recording:
+
+    python benchmarks/scorer_regression.py [--scorers du_score ...] [--repeat 3]
+                                           [--max-slowdown 0.5] [--tolerance 0] [--out results.json]
+    python benchmarks/scorer_regression.py --update [--grid-sample 200]
+
+The site set is chosen once, by --update with no golden file present, and then read from
+the golden file, so later edits to the applicant list or grid do not change it.
+
+Scorers are checked independently. One whose data files are not all on disk, or that has no
+golden scores yet, fails the run; with --allow-skip (a checkout with part of the data) it is
+only reported under "skipped" and the others are still checked. --update records every
+scorer that can run.
+
+The golden file holds only what the comparison needs (sites, scores, timings, per-scorer data
+hashes, Python version and repeat count), so re-recording does not churn it.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lihtc import engine  # noqa: E402
+from lihtc.search import GRID_PATH  # noqa: E402
+from lihtc.train import load_applicants  # noqa: E402
+
+GOLDEN_PATH = ROOT / "benchmarks/golden/scorer_sites.json"
+GRID_SAMPLE = 200
+SEED = 0
+
+# Data each scorer reads: engine.CORE_DATA_PATHS keys, and "school_boundaries" for
+# engine.SCHOOL_BOUNDARY_PATHS
+SCORER_DATA = {
+    "ct_score": ["df_transit", "rural_gdf"],
+    "du_score": ["csv_desirable", "csv_undesirable", "csv_usda", "tract_shape", "rural_gdf"],
+    "qe_score": ["df_school", "school_boundaries"],
+    "sc_score": ["df_indicators", "tract_shape"],
+}
+
+
+def golden_sites(grid_sample=GRID_SAMPLE, seed=SEED):
+    """Past applicant locations, then a seeded sample of score grid points."""
+    applicants = load_applicants()
+    sites = [
+        {"id": f"applicant:{dev_id}", "lat": float(lat), "lon": float(lon)}
+        for dev_id, lat, lon in zip(applicants["development_id"], applicants["lat"], applicants["lon"])
+    ]
+    grid = gpd.read_file(ROOT / GRID_PATH).to_crs("EPSG:4326")
+    grid = grid[grid["score"].notnull()]
+    rows = np.sort(np.random.default_rng(seed).choice(len(grid), size=min(grid_sample, len(grid)), replace=False))
+    sites += [
+        {"id": f"grid:{row}", "lat": float(grid["lat"].iloc[row]), "lon": float(grid["lon"].iloc[row])}
+        for row in rows
+    ]
+    return sites
+
+
+def scorer_files(key):
+    """Repository-relative paths of the data files a scorer reads."""
+    paths = []
+    for name in SCORER_DATA[key]:
+        paths += engine.SCHOOL_BOUNDARY_PATHS if name == "school_boundaries" else [engine.CORE_DATA_PATHS[name]]
+    return paths
+
+
+def data_hashes(key):
+    """Content hash of each of a scorer's data files, None if missing (modification times change on checkout)."""
+    return {
+        path: hashlib.sha1((ROOT / path).read_bytes()).hexdigest()[:12] if (ROOT / path).exists() else None
+        for path in scorer_files(key)
+    }
+
+
+def run_scorer(scorer, sites, kwargs, repeat):
+    """
+    Returns:
+        (scores, stats): score per site id, and latency percentiles and throughput.
+    """
+    scores, latencies = {}, []
+    pass_start = time.perf_counter()
+    for site in sites:
+        best = math.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            score = scorer(site["lat"], site["lon"], **kwargs).calculate_score()
+            best = min(best, time.perf_counter() - start)
+        scores[site["id"]] = float(score)
+        latencies.append(best * 1000)
+    # Throughput of one pass: the whole loop divided by the repeats it made
+    seconds = (time.perf_counter() - pass_start) / repeat
+    return scores, {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+        "sites_per_second": len(sites) / seconds if seconds > 0 else None,
+    }
+
+
+def same_score(expected, actual, tolerance):
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    if math.isnan(expected) or math.isnan(actual):
+        return math.isnan(expected) and math.isnan(actual)
+    return abs(expected - actual) <= tolerance
+
+
+def compare(golden, scores, timings, max_slowdown, tolerance):
+    """
+    Returns:
+        list of failure messages (empty if everything matches).
+    """
+    failures = []
+    for key, actual in scores.items():
+        expected = golden["scores"][key]
+        drifted = [
+            (site_id, expected.get(site_id), score) for site_id, score in actual.items()
+            if not same_score(_nan(expected.get(site_id)), score, tolerance)
+        ]
+        for site_id, was, now in drifted[:10]:
+            failures.append(f"{key} at {site_id}: {was} -> {now}")
+        if len(drifted) > 10:
+            failures.append(f"{key}: {len(drifted) - 10} more sites drifted")
+
+        recorded = golden["timings"].get(key)
+        if max_slowdown and recorded:
+            if timings[key]["p50_ms"] > recorded["p50_ms"] * (1 + max_slowdown):
+                failures.append(f"{key}: p50 latency {recorded['p50_ms']:.3f} -> {timings[key]['p50_ms']:.3f} ms")
+            if recorded["sites_per_second"] and timings[key]["sites_per_second"] < recorded["sites_per_second"] / (1 + max_slowdown):
+                failures.append(
+                    f"{key}: throughput {recorded['sites_per_second']:.1f} -> {timings[key]['sites_per_second']:.1f} sites/s"
+                )
+    return failures
+
+
+def _nan(value):
+    # JSON has no NaN; golden files store it as null
+    return math.nan if value is None else value
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scorers", nargs="+", default=list(engine.SCORERS), choices=list(engine.SCORERS))
+    parser.add_argument("--repeat", type=int, default=3, help="Timed calls per site and scorer (best is kept)")
+    parser.add_argument("--max-slowdown", type=float, default=0.5, help="Allowed fractional slowdown; 0 skips timing checks")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed absolute score difference")
+    parser.add_argument("--update", action="store_true", help="Record the current scores and timings as golden")
+    parser.add_argument("--allow-skip", action="store_true", help="Report scorers that cannot be checked instead of failing")
+    parser.add_argument("--grid-sample", type=int, default=GRID_SAMPLE, help="Grid points in a new site set")
+    parser.add_argument("--golden", default=str(GOLDEN_PATH))
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+    golden_path = Path(args.golden).resolve()
+    out = Path(args.out).resolve() if args.out else None
+
+    # Data paths are relative to the repository root, as in the app
+    os.chdir(ROOT)
+
+    if golden_path.exists():
+        golden = json.loads(golden_path.read_text())
+    else:
+        print(f"No golden file at {golden_path}; record one with --update", file=sys.stderr)
+        golden = {"sites": golden_sites(args.grid_sample), "scores": {}, "timings": {}, "data": {}}
+    sites = golden["sites"]
+
+    # A scorer runs only with all of its data on disk and, unless recording, golden scores to compare with
+    skipped, current_data = {}, {}
+    for key in args.scorers:
+        current_data[key] = data_hashes(key)
+        missing = [path for path, digest in current_data[key].items() if digest is None]
+        if missing:
+            skipped[key] = f"missing data: {', '.join(missing)}"
+        elif key not in golden["scores"] and not args.update:
+            skipped[key] = "no golden scores; record them with --update"
+    run = [key for key in args.scorers if key not in skipped]
+
+    load_s = None
+    if run:
+        start = time.perf_counter()
+        kwargs = engine.get_scorer_kwargs()
+        load_s = time.perf_counter() - start
+
+    scores, timings = {}, {}
+    for key in run:
+        print(f"Scoring {len(sites)} sites with {engine.SCORERS[key].__name__}...", file=sys.stderr)
+        scores[key], timings[key] = run_scorer(engine.SCORERS[key], sites, kwargs, args.repeat)
+    for key, reason in skipped.items():
+        print(f"Skipping {key}: {reason}", file=sys.stderr)
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "data_load_s": load_s,
+        "sites": len(sites),
+        "repeat": args.repeat,
+        "timings": timings,
+        "skipped": skipped,
+    }
+
+    if args.update:
+        golden.update({key: results[key] for key in ["python", "repeat"]})
+        for key in run:
+            golden["scores"][key] = {site_id: None if math.isnan(v) else v for site_id, v in scores[key].items()}
+            golden["timings"][key] = timings[key]
+            golden["data"][key] = current_data[key]
+        golden_path.parent.mkdir(parents=True, exist_ok=True)
+        golden_path.write_text(json.dumps(golden, indent=1))
+        results["updated"] = str(golden_path.relative_to(ROOT) if golden_path.is_relative_to(ROOT) else golden_path)
+        failures = []
+    else:
+        failures = compare(golden, scores, timings, args.max_slowdown, args.tolerance)
+        for key in run:
+            changed = [path for path, digest in current_data[key].items() if golden["data"][key].get(path) != digest]
+            if changed:
+                failures.insert(0, f"{key}: data changed since its golden scores ({', '.join(changed)})")
+        results["golden_timings"] = {key: golden["timings"].get(key) for key in run}
+    if not args.allow_skip:
+        failures += [f"{key}: not checked, {reason} (--allow-skip to accept)" for key, reason in skipped.items()]
+    results["failures"] = failures
+
+    output = json.dumps(results, indent=2)
+    if out:
+        out.write_text(output)
+    else:
+        print(output)
+
+    if failures:
+        print(f"FAILED: {len(failures)} checks", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
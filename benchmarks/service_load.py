@@ -0,0 +1,131 @@
+"""
+Load test: local scoring service
+================================
+
+Sends concurrent requests to a running scoring service (python -m lihtc.service) and
+reports throughput, latency percentiles and errors as JSON. Sites are the past applicant
+locations, cycled as needed.
+
+    python benchmarks/service_load.py [--url http://127.0.0.1:8765] [--concurrency 8]
+                                      [--requests 200] [--batch-size 0]
+
+--batch-size 0 calls /score once per site; a positive size posts that many sites per
+/score/batch request.
+"""
+
+import argparse
+import itertools
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from pathlib import Path
+from urllib.parse import urlsplit
+
+import geopandas as gpd
+
+ROOT = Path(__file__).resolve().parent.parent
+SITES_PATH = ROOT / "data/maps/application_list_2022_2023_2024_metro_atl.geojson"
+
+
+def load_sites():
+    gdf = gpd.read_file(SITES_PATH)
+    gdf = gdf[gdf["lat"].notnull() & gdf["lon"].notnull()]
+    return [{"id": str(i), "lat": float(lat), "lon": float(lon)} for i, (lat, lon) in enumerate(zip(gdf["lat"], gdf["lon"]))]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def wait_until_ready(url, timeout):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = HTTPConnection(parts.hostname, parts.port, timeout=5)
+            conn.request("GET", "/ready")
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+            if response.status == 200:
+                return payload
+            if payload.get("error"):
+                sys.exit(f"Service failed to start: {payload['error']}")
+        except OSError:
+            pass
+        time.sleep(1)
+    sys.exit(f"Service at {url} not ready after {timeout}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=0)
+    parser.add_argument("--ready-timeout", type=int, default=300)
+    args = parser.parse_args()
+
+    ready = wait_until_ready(args.url, args.ready_timeout)
+    parts = urlsplit(args.url)
+    sites = itertools.cycle(load_sites())
+    sites_lock = threading.Lock()
+    local = threading.local()
+
+    def next_request():
+        with sites_lock:
+            if args.batch_size:
+                return "/score/batch", {"sites": [next(sites) for _ in range(args.batch_size)]}
+            return "/score", next(sites)
+
+    def send(_):
+        # One keep-alive connection per client thread
+        if not hasattr(local, "conn"):
+            local.conn = HTTPConnection(parts.hostname, parts.port, timeout=300)
+        path, body = next_request()
+        start = time.perf_counter()
+        try:
+            local.conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+            response = local.conn.getresponse()
+            payload = json.loads(response.read())
+            ok = response.status == 200
+            if ok:
+                results = payload["results"] if args.batch_size else [payload]
+                ok = not any("error" in result for result in results)
+        except (OSError, ValueError):
+            local.__dict__.pop("conn", None)
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        outcomes = list(pool.map(send, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = [latency * 1000 for latency, _ in outcomes]
+    sites_scored = args.requests * max(args.batch_size, 1)
+    print(json.dumps({
+        "workers": ready.get("workers"),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "batch_size": args.batch_size,
+        "errors": sum(1 for _, ok in outcomes if not ok),
+        "elapsed_s": elapsed,
+        "requests_per_s": args.requests / elapsed,
+        "sites_per_s": sites_scored / elapsed,
+        "latency_ms": {
+            "mean": statistics.mean(latencies_ms),
+            "p50": percentile(latencies_ms, 50),
+            "p95": percentile(latencies_ms, 95),
+            "p99": percentile(latencies_ms, 99),
+            "max": max(latencies_ms),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
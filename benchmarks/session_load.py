@@ -0,0 +1,391 @@
+"""
+Load test: concurrent app sessions
+==================================
+
+Starts the app with `streamlit run` and drives it from simulated browser sessions over
+Streamlit's websocket protocol, the same messages the frontend sends, so reruns from
+different sessions overlap on the server as they do in production. Each session loads the
+page, then alternates between submitting a past applicant's coordinates ("score") and
+switching the location map to another score layer ("layer"), pausing up to --think
+seconds between actions. Each --sessions value is one stage, run in order against the
+same server, so `--sessions 1 4 8 16` shows how latency grows with concurrent analysts.
+
+Per stage, as JSON:
+
+    rerun_ms        latency from sending a rerun to the script finishing, as a session
+                    sees it: p50/p95/max overall and per action
+    server_ms       the app's own rerun traces (LIHTC_LOG_LEVEL=INFO span log), p50/p95
+    cpu_percent     server process CPU over the stage (100 = one core)
+    rss_mb          server resident memory at the start and end of the stage
+    map_cache       rendered-map cache entries and MB before and after the stage, and the
+                    growth per session
+    session_mb      session state per session as the app measures it, median and max
+    timeline        one sample every --interval seconds: elapsed seconds, CPU %, RSS MB,
+                    map cache MB and entries, reruns completed
+
+    python benchmarks/session_load.py [--sessions 1 4 8] [--actions 10] [--think 1.0]
+                                      [--app scoring_tool.py] [--port 8599] [--out results.json]
+
+Linux only (server CPU and memory are read from /proc). The server is stopped afterwards;
+its log is kept with --server-log.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.request import urlopen
+
+import geopandas as gpd
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from websockets.asyncio.client import connect
+
+ROOT = Path(__file__).resolve().parent.parent
+SITES_PATH = ROOT / "data/maps/application_list_2022_2023_2024_metro_atl.geojson"
+
+# Script run statuses that end a rerun (an early finish is followed by another run)
+FINISHED = {
+    ForwardMsg.FINISHED_SUCCESSFULLY,
+    ForwardMsg.FINISHED_WITH_COMPILE_ERROR,
+    ForwardMsg.FINISHED_FRAGMENT_RUN_SUCCESSFULLY,
+}
+
+
+def load_sites():
+    gdf = gpd.read_file(SITES_PATH)
+    gdf = gdf[gdf["lat"].notnull() & gdf["lon"].notnull()]
+    return [(float(lat), float(lon)) for lat, lon in zip(gdf["lat"], gdf["lon"])]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def latency_summary(values_ms):
+    return {
+        "count": len(values_ms),
+        "p50": percentile(values_ms, 50),
+        "p95": percentile(values_ms, 95),
+        "max": max(values_ms, default=None),
+    }
+
+#################################################################################################
+# Server process: CPU, memory and the app's JSON log
+class Server:
+    """
+    `streamlit run` in a subprocess with the span and memory logs on, parsed as they arrive.
+
+    Args:
+        app (str): Script to serve, relative to the repository root.
+        port (int): Port to listen on.
+        log_path (str): Optional file to copy the server's stderr to.
+    """
+
+    def __init__(self, app, port, log_path=None):
+        self.url = f"http://127.0.0.1:{port}"
+        self.events = []
+        self._lock = threading.Lock()
+        self._log = open(log_path, "w") if log_path else None
+        env = dict(os.environ, LIHTC_LOG_LEVEL="INFO")
+        self.process = subprocess.Popen(
+            [
+                sys.executable, "-m", "streamlit", "run", app,
+                "--server.headless=true", f"--server.port={port}", "--server.address=127.0.0.1",
+                "--server.fileWatcherType=none", "--browser.gatherUsageStats=false",
+            ],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        threading.Thread(target=self._read_log, daemon=True).start()
+
+    def _read_log(self):
+        for line in self.process.stderr:
+            if self._log:
+                self._log.write(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(entry, dict) and "event" in entry:
+                entry["received"] = time.perf_counter()
+                with self._lock:
+                    self.events.append(entry)
+
+    def wait_until_healthy(self, timeout):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                sys.exit(f"Server exited with status {self.process.returncode}")
+            try:
+                with urlopen(f"{self.url}/_stcore/health", timeout=5) as response:
+                    if response.status == 200:
+                        return
+            except OSError:
+                pass
+            time.sleep(0.5)
+        sys.exit(f"Server at {self.url} not healthy after {timeout}s")
+
+    def sample(self):
+        """CPU seconds used so far and resident bytes, from /proc."""
+        with open(f"/proc/{self.process.pid}/stat") as f:
+            # Fields after the parenthesised command name; utime and stime are 14th and 15th
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{self.process.pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        return cpu_seconds, rss_pages * os.sysconf("SC_PAGE_SIZE")
+
+    def log_events(self, since=None, message=None, event=None):
+        with self._lock:
+            return [
+                entry for entry in self.events
+                if (since is None or entry["received"] >= since)
+                and (message is None or entry.get("message") == message)
+                and (event is None or entry.get("event") == event)
+            ]
+
+    def map_cache(self):
+        """The latest map cache size the app logged, or zeros before the first rerun."""
+        logged = self.log_events(message="map_cache")
+        latest = logged[-1] if logged else {}
+        return {"entries": latest.get("entries", 0), "bytes": latest.get("bytes", 0)}
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        if self._log:
+            self._log.close()
+
+#################################################################################################
+# Simulated browser session
+class Session:
+    """
+    One websocket session. Widgets are found by the key (or the form and label, for form
+    submit buttons) in the elements the server sends, and their values are sent back on each
+    rerun the way the frontend does.
+    """
+
+    def __init__(self, url, timeout):
+        self.url = url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.timeout = timeout
+        self.session_id = None
+        self.widgets = {}
+        self.values = {}
+        self.errors = []
+        self._finished = None
+
+    async def __aenter__(self):
+        self._websocket = await connect(self.url, subprotocols=["streamlit"], max_size=None)
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._reader.cancel()
+        await self._websocket.close()
+
+    async def _read(self):
+        async for data in self._websocket:
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.session_id = msg.new_session.initialize.session_id
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                self._element(msg.delta.new_element)
+            elif kind == "script_finished" and msg.script_finished in FINISHED:
+                if self._finished is not None and not self._finished.done():
+                    self._finished.set_result(msg.script_finished)
+
+    def _element(self, element):
+        kind = element.WhichOneof("type")
+        if kind == "exception":
+            self.errors.append(f"{element.exception.type}: {element.exception.message}")
+            return
+        proto = getattr(element, kind, None)
+        widget_id = getattr(proto, "id", "")
+        if not widget_id:
+            return
+        # Widget ids end in the user key ("$$ID-<hash>-<key>"); form buttons have none
+        key = widget_id.split("-", 2)[-1]
+        if kind == "button" and proto.is_form_submitter:
+            key = f"{proto.form_id}/{proto.label}"
+        self.widgets[key] = proto
+
+    async def rerun(self, triggers=()):
+        """
+        Rerun the script with the current widget values, pressing the given buttons.
+
+        Returns:
+            Seconds until the script finished.
+        """
+        back = BackMsg()
+        states = list(self.values.values())
+        for key in triggers:
+            states.append(WidgetState(id=self.widget(key).id, trigger_value=True))
+        back.rerun_script.widget_states.widgets.extend(states)
+        self._finished = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self._websocket.send(back.SerializeToString())
+        await asyncio.wait_for(self._finished, self.timeout)
+        return time.perf_counter() - start
+
+    def widget(self, key):
+        if key not in self.widgets:
+            raise RuntimeError(f"No widget {key!r} on the page; app errors: {self.errors or 'none'}")
+        return self.widgets[key]
+
+    def set_value(self, key, value):
+        self.values[key] = WidgetState(id=self.widget(key).id, string_value=value)
+
+
+async def analyst(url, index, actions, think, sites, seed, timeout, results):
+    """Load the page, then alternate scoring a site and switching the map layer."""
+    rng = random.Random(seed + index)
+    async with Session(url, timeout) as session:
+        results.append({"action": "load", "seconds": await session.rerun(), "session": index})
+        for step in range(actions):
+            await asyncio.sleep(rng.uniform(0, think))
+            if step % 2 == 0:
+                lat, lon = rng.choice(sites)
+                session.set_value("lat_main", str(lat))
+                session.set_value("lon_main", str(lon))
+                action, triggers = "score", ["latlon_form/Calculate Scores"]
+            else:
+                layers = list(session.widget("score_layer_selection").options)
+                session.set_value("score_layer_selection", rng.choice(layers))
+                action, triggers = "layer", ["map_layer_form/Update Map"]
+            results.append({"action": action, "seconds": await session.rerun(triggers), "session": index})
+        return {"session_id": session.session_id, "errors": session.errors}
+
+
+async def run_stage(server, sessions, args, sites):
+    """
+    Returns:
+        dict: the stage's latencies, server resources and cache growth.
+    """
+    results, timeline = [], []
+    start = time.perf_counter()
+    cpu_start, rss_start = server.sample()
+    cache_start = server.map_cache()
+
+    async def sample():
+        last_cpu, last_time = cpu_start, start
+        while True:
+            await asyncio.sleep(args.interval)
+            cpu, rss = server.sample()
+            now = time.perf_counter()
+            cache = server.map_cache()
+            timeline.append({
+                "elapsed_s": round(now - start, 2),
+                "cpu_percent": round(100 * (cpu - last_cpu) / (now - last_time), 1),
+                "rss_mb": round(rss / 1024 ** 2, 1),
+                "map_cache_mb": round(cache["bytes"] / 1024 ** 2, 2),
+                "map_cache_entries": cache["entries"],
+                "reruns": len(results),
+            })
+            last_cpu, last_time = cpu, now
+
+    sampler = asyncio.create_task(sample())
+    try:
+        clients = await asyncio.gather(*[
+            analyst(server.url, i, args.actions, args.think, sites, args.seed, args.timeout, results)
+            for i in range(sessions)
+        ])
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - start
+    cpu_end, rss_end = server.sample()
+
+    # Let the log reader catch up with the last reruns' lines
+    await asyncio.sleep(0.5)
+    cache_end = server.map_cache()
+    session_ids = {client["session_id"] for client in clients}
+    session_bytes = {}
+    for entry in server.log_events(since=start, message="session"):
+        if entry.get("session") in session_ids:
+            session_bytes[entry["session"]] = entry["bytes"]
+    traces_ms = [entry["ms"] for entry in server.log_events(since=start, event="trace")]
+
+    rerun_ms = [result["seconds"] * 1000 for result in results]
+    return {
+        "sessions": sessions,
+        "reruns": len(results),
+        "errors": sum(len(client["errors"]) for client in clients),
+        "error_messages": sorted({message for client in clients for message in client["errors"]})[:10],
+        "elapsed_s": elapsed,
+        "reruns_per_s": len(results) / elapsed,
+        "rerun_ms": dict(latency_summary(rerun_ms), by_action={
+            action: latency_summary([r["seconds"] * 1000 for r in results if r["action"] == action])
+            for action in ["load", "score", "layer"]
+        }),
+        "server_ms": latency_summary(traces_ms),
+        "cpu_percent": round(100 * (cpu_end - cpu_start) / elapsed, 1),
+        "rss_mb": {"start": rss_start / 1024 ** 2, "end": rss_end / 1024 ** 2},
+        "map_cache": {
+            "entries": {"start": cache_start["entries"], "end": cache_end["entries"]},
+            "mb": {"start": cache_start["bytes"] / 1024 ** 2, "end": cache_end["bytes"] / 1024 ** 2},
+            "growth_mb_per_session": (cache_end["bytes"] - cache_start["bytes"]) / 1024 ** 2 / sessions,
+        },
+        "session_mb": {
+            "median": statistics.median(session_bytes.values()) / 1024 ** 2 if session_bytes else None,
+            "max": max(session_bytes.values()) / 1024 ** 2 if session_bytes else None,
+        },
+        "timeline": timeline,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8], help="Concurrent sessions, one stage each")
+    parser.add_argument("--actions", type=int, default=10, help="Actions per session after the first page load")
+    parser.add_argument("--think", type=float, default=1.0, help="Longest pause between a session's actions (s)")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between resource samples")
+    parser.add_argument("--app", default="scoring_tool.py")
+    parser.add_argument("--port", type=int, default=8599)
+    parser.add_argument("--timeout", type=float, default=600, help="Longest wait for one rerun (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--server-log", help="Keep the server's log in this file")
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+    out = Path(args.out).resolve() if args.out else None
+
+    sites = load_sites()
+    server = Server(args.app, args.port, args.server_log)
+    try:
+        server.wait_until_healthy(args.timeout)
+        stages = []
+        for sessions in args.sessions:
+            print(f"Running {sessions} sessions...", file=sys.stderr)
+            stages.append(asyncio.run(run_stage(server, sessions, args, sites)))
+    finally:
+        server.stop()
+
+    output = json.dumps({
+        "app": args.app,
+        "actions": args.actions,
+        "think_s": args.think,
+        "cpus": os.cpu_count(),
+        "stages": stages,
+    }, indent=2)
+    if out:
+        out.write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark: exported trees against the pickled selection model
+=============================================================
+
+Runs lihtc.trees.check_parity at several batch sizes and reports, as JSON, per size:
+
+    max_abs_diff        largest difference in selection probability (must stay within
+                        lihtc.trees.PARITY_TOLERANCE)
+    model_us_per_row    XGBoost predict_proba latency per row (best of --repeat)
+    trees_us_per_row    TreeEnsemble predict_proba latency per row (best of --repeat)
+
+and the crossover: the smallest batch at which XGBoost was faster. Exits 1 if the arrays
+disagree with the model at any size. Needs xgboost (the app does not).
+
+    python benchmarks/tree_parity.py [--batch-sizes 1 100 1000 10000 100000] [--repeat 3]
+                                     [--model pages/models/final_model.pkl]
+                                     [--trees pages/models/final_model_trees.npz] [--out results.json]
+"""
+
+import argparse
+import json
+import platform
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from lihtc.prediction import load_model  # noqa: E402
+from lihtc.trees import MODEL_PATH, PARITY_TOLERANCE, TREES_PATH, check_parity, load_trees  # noqa: E402
+
+BATCH_SIZES = [1, 100, 1000, 10000, 100000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=BATCH_SIZES)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per batch size (best is kept)")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--trees", default=TREES_PATH)
+    parser.add_argument("--out", help="Write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    model, ensemble = load_model(args.model), load_trees(args.trees)
+
+    batches = []
+    for rows in args.batch_sizes:
+        runs = [check_parity(model, ensemble, rows=rows) for _ in range(args.repeat)]
+        batches.append({
+            "rows": rows,
+            "max_abs_diff": max(run["max_abs_diff"] for run in runs),
+            "model_us_per_row": min(run["model_us_per_row"] for run in runs),
+            "trees_us_per_row": min(run["trees_us_per_row"] for run in runs),
+        })
+    crossover = next((b["rows"] for b in batches if b["model_us_per_row"] < b["trees_us_per_row"]), None)
+    failures = [
+        f"{b['rows']} rows: probabilities differ by {b['max_abs_diff']:.2e}"
+        for b in batches if b["max_abs_diff"] > PARITY_TOLERANCE
+    ]
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.node(),
+        "tolerance": PARITY_TOLERANCE,
+        "batches": batches,
+        "model_faster_from_rows": crossover,
+        "failures": failures,
+    }
+    output = json.dumps(results, indent=2)
+    if args.out:
+        Path(args.out).write_text(output)
+    else:
+        print(output)
+
+    if failures:
+        print(f"FAILED: exported trees disagree with {args.model}", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,10 @@ This file contains reference code for implementing smoothed gradient heatmap
 visualizations instead of polygon-based choropleth maps for Stable Communities
 indicators. This code is for reference only and not actively used.
 
+The production version is the "Heatmap" map style: compute_heat_data() and
+add_heatmap_layer() in map_layers/build_layers.py, with these gradients in
+map_layers/colours.py (heatmap_gradients).
+
 Author: Emory Center for AI
 Date: July 2025
 Purpose: Convert polygon-based tract maps to heatmap-style visualizations
@@ -0,0 +1,6 @@
+"""
+Streamlit-free LIHTC location scoring.
+
+The Streamlit pages are clients of this package; batch jobs, worker processes and
+services import it directly without starting a Streamlit runtime.
+"""
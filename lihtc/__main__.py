@@ -0,0 +1,60 @@
+"""
+Command-line entry point.
+
+    python -m lihtc score sites.csv --out scores.parquet [--workers 8] [--chunk 1000]
+                                    [--lat-col lat] [--lon-col lon]
+    python -m lihtc search --lat 33.749 --lon -84.388 [--radius 0.5] [--top 5] [--step 0.05]
+                           [--workers 4]
+"""
+
+import argparse
+import json
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lihtc", description="LIHTC location scoring")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    score = commands.add_parser("score", help="Score every site in a CSV")
+    score.add_argument("input", help="CSV with one site per row")
+    score.add_argument("--out", required=True, help="Output file; .parquet writes Parquet, anything else CSV")
+    score.add_argument("--workers", type=int, default=None, help="Worker processes (default: all CPUs)")
+    score.add_argument("--chunk", type=int, default=1000, help="Rows per chunk")
+    score.add_argument("--lat-col", default=None, help="Latitude column (default: detected)")
+    score.add_argument("--lon-col", default=None, help="Longitude column (default: detected)")
+    score.add_argument("--quiet", action="store_true", help="No progress output")
+
+    search = commands.add_parser("search", help="Find the highest-scoring points near a site")
+    search.add_argument("--lat", type=float, required=True)
+    search.add_argument("--lon", type=float, required=True)
+    search.add_argument("--radius", type=float, default=0.5, help="Search radius in miles")
+    search.add_argument("--top", type=int, default=5, help="Number of locations to return")
+    search.add_argument("--step", type=float, default=0.05, help="Lattice spacing in miles")
+    search.add_argument("--workers", type=int, default=1, help="Worker processes")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "score":
+        from lihtc.batch import score_file
+
+        summary = score_file(
+            args.input,
+            args.out,
+            workers=args.workers,
+            chunk=args.chunk,
+            lat_col=args.lat_col,
+            lon_col=args.lon_col,
+            progress=None if args.quiet else sys.stderr
+        )
+        print(json.dumps(summary, indent=2))
+
+    elif args.command == "search":
+        from lihtc.search import find_best_sites
+
+        result = find_best_sites(args.lat, args.lon, args.radius, args.top, args.step, args.workers)
+        print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import multiprocessing
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from lihtc import engine
+
+#################################################################################################
+# Streaming batch scoring
+#
+# Input rows are read in chunks and scored by a process pool; workers are forked after the
+# datasets are loaded, so they share the parent's copy instead of each reading the files.
+# At most a few chunks are in flight and each is written as soon as it is done (in input
+# order), so memory stays flat however large the input is.
+LAT_COLUMNS = ["lat", "latitude", "Latitude", "LAT", "y"]
+LON_COLUMNS = ["lon", "lng", "long", "longitude", "Longitude", "LON", "x"]
+
+SCORE_COLUMNS = list(engine.SCORERS) + ["total_score"]
+
+
+def find_column(columns, candidates, name):
+    for candidate in candidates:
+        if candidate in columns:
+            return candidate
+    raise ValueError(f"No {name} column found; expected one of {candidates} (or pass --{name}-col)")
+
+
+def score_frame(frame, lat_col, lon_col):
+    """
+    Args:
+        frame (DataFrame): One chunk of input rows.
+        lat_col, lon_col (str): Coordinate columns.
+
+    Returns:
+        The chunk with the score columns and an "error" column appended; rows that could
+        not be scored have empty scores and the reason in "error".
+    """
+    kwargs = engine.get_scorer_kwargs()
+    latitudes = pd.to_numeric(frame[lat_col], errors="coerce")
+    longitudes = pd.to_numeric(frame[lon_col], errors="coerce")
+
+    rows = []
+    for lat, lon in zip(latitudes, longitudes):
+        if pd.isna(lat) or pd.isna(lon):
+            rows.append({"error": "missing or non-numeric coordinates"})
+            continue
+        try:
+            rows.append(dict(engine.score_site(lat, lon, kwargs), error=None))
+        except Exception as e:
+            rows.append({"error": f"{type(e).__name__}: {e}"})
+
+    scores = pd.DataFrame(rows, index=frame.index, columns=SCORE_COLUMNS + ["error"])
+    scores[SCORE_COLUMNS] = scores[SCORE_COLUMNS].astype(float)
+    scores["error"] = scores["error"].astype("string")
+    return pd.concat([frame, scores], axis=1)
+
+
+class ResultWriter:
+    """Appends scored chunks to a CSV or Parquet file (chosen by the output suffix)."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.parquet = self.path.suffix.lower() in (".parquet", ".pq")
+        self._writer = None
+        self._schema = None
+        self._header = True
+
+    def write(self, frame):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._writer is None:
+                self._schema = table.schema
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            # Keep every row group on the first chunk's schema (e.g. an all-empty column)
+            self._writer.write_table(table.cast(self._schema))
+        else:
+            frame.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+            self._header = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def count_rows(path):
+    """Data rows in a CSV (for progress reporting); cheap next to scoring them."""
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+def score_file(input_path, out_path, workers=None, chunk=1000, lat_col=None, lon_col=None, progress=sys.stderr):
+    """
+    Score every row of a CSV of sites and write the rows with their scores.
+
+    Args:
+        input_path (str): CSV with one site per row.
+        out_path (str): Output file; .parquet/.pq writes Parquet (needs pyarrow), anything else CSV.
+        workers (int): Worker processes (default: all CPUs).
+        chunk (int): Rows per chunk read, scored and written together.
+        lat_col, lon_col (str): Coordinate columns (default: detected from common names).
+        progress: Stream for progress lines, or None for silence.
+
+    Returns:
+        dict with rows, errors, elapsed_s and rows_per_s.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    total_rows = count_rows(input_path)
+
+    def report(message):
+        if progress is not None:
+            print(message, file=progress, flush=True)
+
+    # Load once here; forked workers inherit the loaded datasets
+    start = time.perf_counter()
+    engine.get_scorer_kwargs()
+    report(f"Loaded scoring data in {time.perf_counter() - start:.1f}s; scoring {total_rows:,} rows with {workers} workers")
+
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    writer = ResultWriter(out_path)
+    done = errors = 0
+    start = time.perf_counter()
+
+    def write_oldest(pending):
+        nonlocal done, errors
+        scored = pending.popleft().result()
+        writer.write(scored)
+        done += len(scored)
+        errors += int(scored["error"].notna().sum())
+        elapsed = time.perf_counter() - start
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total_rows - done) / rate if rate else 0.0
+        report(f"{done:,}/{total_rows:,} rows ({done / max(total_rows, 1):.0%}), {rate:,.1f} rows/s, {errors:,} errors, ETA {eta:,.0f}s")
+
+    try:
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            pending = deque()
+            for frame in pd.read_csv(input_path, chunksize=chunk):
+                if lat_col is None or lon_col is None:
+                    lat_col = lat_col or find_column(frame.columns, LAT_COLUMNS, "lat")
+                    lon_col = lon_col or find_column(frame.columns, LON_COLUMNS, "lon")
+                pending.append(pool.submit(score_frame, frame, lat_col, lon_col))
+                # Bound the chunks held in memory to two per worker
+                while len(pending) >= 2 * workers:
+                    write_oldest(pending)
+            while pending:
+                write_oldest(pending)
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {"rows": done, "errors": errors, "elapsed_s": elapsed, "rows_per_s": done / elapsed if elapsed else 0.0}
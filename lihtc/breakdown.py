@@ -0,0 +1,189 @@
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+import shapely
+
+from lihtc import engine
+from lihtc.timing import span
+
+#################################################################################################
+# Itemized score breakdown
+#
+# The scorers only return a number, but while scoring each one keeps what it matched: the
+# points of each component of its category, the amenities and hazards inside the QAP radii,
+# the transit stop, the attendance zone schools, the census tract and its indicators. The
+# breakdown reads those named results off the scorer instances after calculate_score(), so it
+# costs no further query.
+#
+# The scorers come from the external aggregate_scoring package, so the names below are a
+# contract this module cannot enforce. An attribute a scorer does not have is listed under
+# "not_reported" in the breakdown (the page says so instead of implying the site is outside
+# the data) and logged as a warning once per scorer class, so a renamed attribute shows up in
+# the log rather than as silently empty details.
+
+# Largest list/table copied from a scorer into the breakdown
+MAX_DETAIL_ROWS = 50
+
+CATEGORY_LABELS = {
+    "ct_score": "Community Transportation Options",
+    "du_score": "Desirable/Undesirable Activities",
+    "qe_score": "Quality Education Areas",
+    "sc_score": "Stable Communities",
+}
+
+# Point components of each category: (scorer attribute, label), in QAP order
+COMPONENTS = {
+    "ct_score": [
+        ("tod_points", "Transit-oriented development points"),
+        ("fixed_route_points", "Fixed-route transit points"),
+        ("nearest_stop", "Transit stop"),
+        ("stop_distance_miles", "Distance to stop (miles)"),
+    ],
+    "du_score": [
+        ("desirable_points", "Desirable activity points"),
+        ("undesirable_points", "Undesirable activity deductions"),
+        ("food_desert_points", "Food desert points"),
+        ("desirable_activities", "Desirable activities counted"),
+        ("undesirable_activities", "Undesirable activities deducted"),
+    ],
+    "qe_score": [
+        ("ccrpi_points", "CCRPI points"),
+        ("bto_points", "Beat the Odds points"),
+    ],
+    "sc_score": [
+        ("indicator_points", "Indicator points"),
+        ("indicators_met", "Indicators met"),
+    ],
+}
+
+# Where the census tract and attendance zones are kept: (category, scorer attribute)
+TRACT_GEOID = ("sc_score", "tract_geoid")
+TRACT_INDICATORS = ("sc_score", "tract_indicators")
+FOOD_ACCESS = ("du_score", "food_access")
+ATTENDANCE_ZONES = ("qe_score", "attendance_zones")
+
+TRACT_LABEL = "Census Tract"
+ZONES_LABEL = "School Attendance Zones"
+
+# Attendance zone columns that are map/GIS bookkeeping rather than school details
+ZONE_SKIP_PREFIXES = ("Shape", "OBJECTID", "FID", "DDP_", "Port_", "ColorNum", "ES_Color", "Area")
+
+
+def to_plain(value):
+    """JSON-friendly copy of a scorer result, or None if it is not small and plain."""
+    if isinstance(value, (np.generic,)):
+        value = value.item()
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    if value is None or isinstance(value, (str, bool, int, float)):
+        return value
+    if isinstance(value, shapely.Geometry):
+        return None
+    if isinstance(value, pd.DataFrame):
+        if len(value) > MAX_DETAIL_ROWS:
+            return None
+        frame = value.drop(columns=[c for c in value.columns if c == "geometry"])
+        return [{k: to_plain(v) for k, v in row.items()} for row in frame.to_dict("records")]
+    if isinstance(value, pd.Series):
+        value = value.to_dict() if len(value) <= MAX_DETAIL_ROWS else None
+    if isinstance(value, dict):
+        return {str(k): to_plain(v) for k, v in value.items()} if len(value) <= MAX_DETAIL_ROWS else None
+    if isinstance(value, (list, tuple, set)):
+        return [to_plain(v) for v in value] if len(value) <= MAX_DETAIL_ROWS else None
+    return None
+
+
+logger = logging.getLogger("lihtc.breakdown")
+
+# (scorer class, attribute) pairs already warned about
+_WARNED = set()
+_WARNED_LOCK = threading.Lock()
+
+
+def warn_not_reported(scorer, name):
+    """Log, once per scorer class, a breakdown attribute the scorer does not have."""
+    scorer_name = type(scorer).__name__
+    with _WARNED_LOCK:
+        if (scorer_name, name) in _WARNED:
+            return
+        _WARNED.add((scorer_name, name))
+    logger.warning(
+        "%s has no attribute %s; the score breakdown omits it", scorer_name, name,
+        extra={"fields": {"scorer": scorer_name, "attribute": name}}
+    )
+
+
+class Recorder:
+    """Reads named results off the scorer instances and notes the ones they do not have."""
+
+    def __init__(self, scorers):
+        self.scorers = scorers
+        self.not_reported = {}
+
+    def read(self, key, name, section):
+        """A result scorers[key] kept, as plain data (None if it kept None or is absent)."""
+        scorer = self.scorers.get(key)
+        if scorer is None:
+            return None
+        if not hasattr(scorer, name):
+            self.not_reported.setdefault(section, []).append(name)
+            warn_not_reported(scorer, name)
+            return None
+        return to_plain(getattr(scorer, name))
+
+
+def category_components(recorder, key):
+    """Named point components of one category that the scorer recorded."""
+    components = {}
+    for name, label in COMPONENTS[key]:
+        value = recorder.read(key, name, CATEGORY_LABELS[key])
+        if value is not None:
+            components[label] = value
+    return components
+
+
+def tract_details(recorder):
+    """Census tract the scorers placed the site in, with its indicators and food access flags."""
+    geoid = recorder.read(*TRACT_GEOID, TRACT_LABEL)
+    if geoid is None:
+        return None
+    details = {"GEOID": str(geoid)}
+    for field, location in [("indicators", TRACT_INDICATORS), ("food_access", FOOD_ACCESS)]:
+        value = recorder.read(*location, TRACT_LABEL)
+        if value:
+            details[field] = value
+    return details
+
+
+def attendance_zones(recorder):
+    """Attendance zones the education scorer found the site in, without GIS bookkeeping columns."""
+    return [
+        {k: v for k, v in zone.items() if not k.startswith(ZONE_SKIP_PREFIXES) and v is not None}
+        for zone in recorder.read(*ATTENDANCE_ZONES, ZONES_LABEL) or []
+        if isinstance(zone, dict)
+    ]
+
+#################################################################################################
+def score_site_with_breakdown(latitude, longitude, kwargs=None):
+    """
+    Score a site and itemize what contributed.
+
+    Returns:
+        The engine.score_site dict plus "breakdown": {"categories": {label: {component:
+        value}}, "tract": tract details or None, "attendance_zones": [...], "not_reported":
+        {section label: [scorer attributes missing]}}.
+    """
+    if kwargs is None:
+        kwargs = engine.get_scorer_kwargs()
+    scores, scorers = engine.run_scorers(latitude, longitude, kwargs)
+    with span("breakdown"):
+        recorder = Recorder(scorers)
+        scores["breakdown"] = {
+            "categories": {CATEGORY_LABELS[key]: category_components(recorder, key) for key in scorers},
+            "tract": tract_details(recorder),
+            "attendance_zones": attendance_zones(recorder),
+            "not_reported": recorder.not_reported,
+        }
+    return scores
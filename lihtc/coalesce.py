@@ -0,0 +1,123 @@
+import asyncio
+import copy
+import os
+import threading
+from concurrent.futures import Future
+
+#################################################################################################
+# In-flight request coalescing
+#
+# When several callers ask for the score of the same site while it is still being computed,
+# only the first computes it; the others wait for its result. Nothing is kept once the
+# computation finishes - this collapses concurrent duplicates, it is not a result cache.
+#
+# 6 decimal places is ~0.1 m, so only requests for the same site coalesce.
+COORD_PRECISION = int(os.environ.get("LIHTC_COALESCE_PRECISION", "6"))
+
+
+def site_key(latitude, longitude, data_version, precision=COORD_PRECISION):
+    """Coalescing key: quantized coordinates plus the version of the data scored against."""
+    return (round(float(latitude), precision), round(float(longitude), precision), data_version)
+
+
+class Coalescer:
+    """
+    Thread-based coalescer for synchronous callers (e.g. Streamlit sessions, which each run
+    in their own thread). Every caller gets its own deep copy of the shared result.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.computed = 0
+        self.coalesced = 0
+
+    def run(self, key, func, *args, **kwargs):
+        """
+        Return func(*args, **kwargs), or the result of an identical call already running under
+        key. Calls whose results differ (e.g. scores with and without a breakdown) must not
+        share a key.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = func(*args, **kwargs)
+            future.set_result(result)
+            return copy.deepcopy(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self):
+        with self._lock:
+            return {"computed": self.computed, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+class AsyncCoalescer:
+    """
+    asyncio coalescer for services. run_many coalesces item by item, so a batch request
+    shares sites with other requests in flight (and with itself) while the items it does
+    compute still go to compute() together.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.computed = 0
+        self.coalesced = 0
+
+    async def run_many(self, items, key, compute):
+        """
+        Args:
+            items (list): Work items.
+            key (callable): item -> coalescing key.
+            compute (callable): list of items -> awaitable list of results in the same order.
+
+        Returns:
+            One result per item (deep copies, so callers may modify them).
+        """
+        loop = asyncio.get_running_loop()
+        futures, claimed = [], []
+        for item in items:
+            item_key = key(item)
+            future = self._inflight.get(item_key)
+            if future is None:
+                future = self._inflight[item_key] = loop.create_future()
+                claimed.append((item_key, item, future))
+                self.computed += 1
+            else:
+                self.coalesced += 1
+            futures.append(future)
+
+        if claimed:
+            try:
+                results = await compute([item for _, item, _ in claimed])
+                for (_, _, future), result in zip(claimed, results):
+                    future.set_result(result)
+            except BaseException as e:
+                for _, _, future in claimed:
+                    if not future.done():
+                        future.set_exception(e)
+                        # Waiters re-raise it; don't also log it as never retrieved
+                        future.exception()
+                raise
+            finally:
+                for item_key, _, _ in claimed:
+                    self._inflight.pop(item_key, None)
+
+        return [copy.deepcopy(await future) for future in futures]
+
+    def stats(self):
+        return {"computed": self.computed, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
@@ -0,0 +1,233 @@
+import logging
+import os
+import threading
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+
+from aggregate_scoring import (
+    CommunityTransportationOptions,
+    DesirableUndesirableActivities,
+    QualityEducation,
+    StableCommunities
+)
+from lihtc.memory import deep_size, log_report
+from lihtc.timing import span
+from map_layers.map_cache import data_version
+
+#################################################################################################
+# Scoring data
+#
+# Paths are resolved against the repository root, so the engine works from any working directory.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+CORE_DATA_PATHS = {
+    "df_transit": "data/community_transportation_options/georgia_transit_locations_with_hub.csv",
+    "rural_gdf": "data/shapefiles/usda_rural_tracts.geojson",
+    "csv_desirable": "data/desirable_undesirable_activities/desirable_activities_google_places_v3.csv",
+    "csv_usda": "data/desirable_undesirable_activities/food_access_research_atlas.csv",
+    "tract_shape": "data/shapefiles/tl_2024_13_tract/tl_2024_13_tract.shp",
+    "csv_undesirable": "data/desirable_undesirable_activities/undesirable_hsi_tri_cdr_rcra_frs_google_places.csv",
+    "df_school": "data/quality_education_areas/Option_C_Scores_Eligibility_with_BTO.csv",
+    "df_indicators": "data/stable_communities/stable_communities_2024_processed_v3.csv",
+}
+
+SCHOOL_BOUNDARY_PATHS = [
+    f"data/quality_education_areas/{name}"
+    for name in ["Administrative.geojson", "APSBoundaries.json", "DKE.json", "DKM.json", "DKBHS.json"]
+]
+
+STATE_AVG_BY_YEAR = {
+    "elementary": {2018: 77.8, 2019: 79.9},
+    "middle": {2018: 76.2, 2019: 77},
+    "high": {2018: 75.3, 2019: 78.8}
+}
+
+# Session/result key -> scorer class, in display order
+SCORERS = {
+    "ct_score": CommunityTransportationOptions,
+    "du_score": DesirableUndesirableActivities,
+    "qe_score": QualityEducation,
+    "sc_score": StableCommunities,
+}
+
+
+def load_gdf(path):
+    with span("load_gdf", path=path):
+        return gpd.read_file(REPO_ROOT / path)
+
+
+def load_csv(path, **kwargs):
+    with span("load_csv", path=path):
+        return pd.read_csv(REPO_ROOT / path, **kwargs)
+
+
+def data_files():
+    """Absolute paths of every file the scorers read."""
+    return [REPO_ROOT / path for path in list(CORE_DATA_PATHS.values()) + SCHOOL_BOUNDARY_PATHS]
+
+
+def engine_data_version():
+    """Short hash of the scoring data on disk; changes whenever any source file does."""
+    return data_version(data_files())
+
+#################################################################################################
+# Process-wide caches
+#
+# Entries are keyed by (name, engine_data_version()), so editing a data file reloads it on the
+# next call. Loading happens under one re-entrant lock: concurrent callers wait for the first
+# load instead of repeating it. Cached objects are shared, so callers must not modify them.
+#
+# The datasets are needed for every score, so they are never evicted: their memory is logged
+# after each load (at INFO) and a warning is logged above LIHTC_DATA_MB (0: no limit).
+_CACHE = {}
+_CACHE_LOCK = threading.RLock()
+
+DATA_MB = float(os.environ.get("LIHTC_DATA_MB", "0"))
+
+logger = logging.getLogger(__name__)
+
+
+def cached(name, build):
+    """build() once per version of the scoring data; shared by every caller in the process."""
+    key = (name, engine_data_version())
+    with _CACHE_LOCK:
+        if key not in _CACHE:
+            for stale_key in [k for k in _CACHE if k[0] == name]:
+                del _CACHE[stale_key]
+            _CACHE[key] = build()
+            report_memory()
+        return _CACHE[key]
+
+
+def cache_report():
+    """
+    Estimated memory of everything loaded here, one row per dataset (per item of dict and
+    list entries such as core_data).
+
+    Returns:
+        list of dicts with cache, item and bytes, in load order. Objects shared between
+        entries (scorer_kwargs holds the core datasets) are counted under the first.
+    """
+    with _CACHE_LOCK:
+        entries = [(name, value) for (name, _), value in _CACHE.items()]
+    seen = set()
+    rows = []
+    for name, value in entries:
+        if isinstance(value, dict):
+            items = value.items()
+        elif isinstance(value, list):
+            items = enumerate(value)
+        else:
+            items = [(None, value)]
+        rows += [{"cache": name, "item": item, "bytes": deep_size(v, seen)} for item, v in items]
+    return rows
+
+
+def report_memory():
+    # Measuring walks every dataset, so skip it unless someone is listening
+    if not DATA_MB and not logging.getLogger("lihtc.memory").isEnabledFor(logging.INFO):
+        return
+    rows = cache_report()
+    log_report("engine", rows)
+    total = sum(row["bytes"] for row in rows)
+    if DATA_MB and total > DATA_MB * 1024 ** 2:
+        largest = max(rows, key=lambda row: row["bytes"])
+        logger.warning(
+            "Scoring data uses %.0f MB, over the %.0f MB budget; largest is %s[%s] at %.0f MB",
+            total / 1024 ** 2, DATA_MB, largest["cache"], largest["item"], largest["bytes"] / 1024 ** 2
+        )
+
+
+def clear_caches():
+    with _CACHE_LOCK:
+        _CACHE.clear()
+
+
+def get_core_data():
+    def build():
+        with span("get_core_data"):
+            return {
+                "df_transit": load_csv(CORE_DATA_PATHS["df_transit"]),
+                "rural_gdf": load_gdf(CORE_DATA_PATHS["rural_gdf"]).to_crs("EPSG:4326"),
+                "csv_desirable": load_csv(CORE_DATA_PATHS["csv_desirable"]),
+                "csv_usda": load_csv(CORE_DATA_PATHS["csv_usda"], dtype={"CensusTract": str}),
+                "tract_shape": load_gdf(CORE_DATA_PATHS["tract_shape"]),
+                "csv_undesirable": load_csv(CORE_DATA_PATHS["csv_undesirable"]),
+                "df_school": load_csv(CORE_DATA_PATHS["df_school"]),
+                "df_indicators": load_csv(CORE_DATA_PATHS["df_indicators"]),
+            }
+    return cached("core_data", build)
+
+
+def get_school_boundaries():
+    return cached(
+        "school_boundaries",
+        lambda: [load_gdf(path).to_crs("EPSG:4326") for path in SCHOOL_BOUNDARY_PATHS]
+    )
+
+
+def get_scorer_kwargs():
+    """
+    Returns:
+        The keyword arguments every scorer is constructed with. The rural tract union
+        is computed once here rather than for every site.
+    """
+    def build():
+        core_data = get_core_data()
+        return {
+            # --- CommunityTransportationOptions ---
+            "transit_df": core_data["df_transit"],
+
+            # --- DesirableUndesirableActivities ---
+            "rural_gdf_unary_union": core_data["rural_gdf"].geometry.union_all(),
+            "desirable_csv": core_data["csv_desirable"],
+            "grocery_csv": core_data["csv_desirable"],
+            "usda_csv": core_data["csv_usda"],
+            "tract_shapefile": core_data["tract_shape"],
+            "undesirable_csv": core_data["csv_undesirable"],
+
+            # --- QualityEducation ---
+            "school_df": core_data["df_school"],
+            "school_boundary_gdfs": get_school_boundaries(),
+            "state_avg_by_year": STATE_AVG_BY_YEAR,
+
+            # --- StableCommunities ---
+            "indicators_df": core_data["df_indicators"],
+            "tracts_shp": core_data["tract_shape"],
+        }
+    return cached("scorer_kwargs", build)
+
+#################################################################################################
+# Scoring
+def run_scorers(latitude, longitude, kwargs=None):
+    """
+    Returns:
+        (scores, scorers): the score dict described in score_site, and the scorer
+        instances keyed like it, for callers that read what the scorers found.
+    """
+    if kwargs is None:
+        kwargs = get_scorer_kwargs()
+    scorers, scores = {}, {}
+    for key, scorer in SCORERS.items():
+        with span("scorer", scorer=key):
+            scorers[key] = scorer(latitude, longitude, **kwargs)
+            scores[key] = scorers[key].calculate_score()
+    scores["total_score"] = sum(scores.values())
+    return scores, scorers
+
+
+def score_site(latitude, longitude, kwargs=None):
+    """
+    Score one site on the four location criteria.
+
+    Args:
+        latitude (float): Site latitude (EPSG:4326).
+        longitude (float): Site longitude (EPSG:4326).
+        kwargs (dict): Scorer keyword arguments (default: get_scorer_kwargs()).
+
+    Returns:
+        dict with ct_score, du_score, qe_score, sc_score and their total_score.
+    """
+    return run_scorers(latitude, longitude, kwargs)[0]
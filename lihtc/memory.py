@@ -0,0 +1,239 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+import shapely
+
+#################################################################################################
+# Memory accounting
+#
+# deep_size() estimates what an object keeps alive: pandas and NumPy report their own buffers,
+# containers and plain objects are walked, and shapely geometries (whose GEOS memory Python
+# cannot see) are charged per geometry and per coordinate, as measured for points and lines
+# with shapely 2. Objects reached twice are counted once, so one `seen` set passed through
+# several calls attributes shared data to whichever structure is measured first.
+GEOMETRY_BYTES = 200
+COORDINATE_BYTES = 24
+
+# Budgets (MB) for the caches that grow with use; 0 means unbounded
+LAYER_CACHE_MB = float(os.environ.get("LIHTC_LAYER_CACHE_MB", "128"))
+SESSION_MB = float(os.environ.get("LIHTC_SESSION_MB", "32"))
+
+# Sessions not seen for this long drop out of the session report
+SESSION_IDLE_SECONDS = 3600
+
+logger = logging.getLogger("lihtc.memory")
+
+
+def geometry_size(values):
+    """Estimated bytes of an array of shapely geometries (None entries are free)."""
+    values = np.asarray(values, dtype=object)
+    present = shapely.is_geometry(values)
+    return int(present.sum()) * GEOMETRY_BYTES + int(shapely.get_num_coordinates(values[present]).sum()) * COORDINATE_BYTES
+
+
+def deep_size(obj, seen=None):
+    """
+    Estimated bytes held by obj and everything it references.
+
+    Args:
+        obj: Any object.
+        seen (set): ids already counted; shared across calls to avoid double counting.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        size = int(obj.memory_usage(index=True, deep=True).sum())
+        for position, dtype in enumerate(obj.dtypes):
+            if dtype.name == "geometry":
+                size += geometry_size(obj.iloc[:, position].to_numpy())
+        return size
+    if isinstance(obj, pd.Series):
+        size = int(obj.memory_usage(index=True, deep=True))
+        if obj.dtype.name == "geometry":
+            size += geometry_size(obj.to_numpy())
+        return size
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        if obj.dtype == object:
+            return obj.nbytes + sum(deep_size(item, seen) for item in obj.ravel())
+        return obj.nbytes
+    if isinstance(obj, shapely.Geometry):
+        return geometry_size([obj])
+    if isinstance(obj, shapely.STRtree):
+        return sys.getsizeof(obj) + deep_size(obj.geometries, seen)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def process_memory():
+    """
+    Returns:
+        dict with rss_bytes (current resident set, Linux only, else None) and peak_rss_bytes.
+    """
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        peak = peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        peak = None
+    return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+def log_report(name, entries):
+    """Log one JSON line per measured structure on the lihtc.memory logger."""
+    for entry in entries:
+        logger.info(name, extra={"fields": dict(entry, event="memory")})
+
+
+class SizedCache:
+    """
+    Thread-safe LRU cache bounded by the deep size of its values.
+
+    Values are measured with deep_size when stored. Least recently used entries are evicted
+    once the budget is exceeded, and a value larger than the whole budget is returned
+    without being cached.
+
+    Args:
+        name (str): Name used in reports and logs.
+        max_bytes (int): Budget for all entries (0 or None: unbounded).
+        max_entries (int): Optional cap on the number of entries as well.
+    """
+
+    def __init__(self, name, max_bytes=None, max_entries=None):
+        self.name = name
+        self.max_bytes = max_bytes or None
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_or_build(self, key, build):
+        """Return the cached value for key, storing build() on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+        return self.put(key, build())
+
+    def put(self, key, value):
+        nbytes = deep_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                self.rejected += 1
+                logger.warning(
+                    "%s: not caching a %.1f MB entry (budget %.0f MB)", self.name, nbytes / 1024 ** 2, self.max_bytes / 1024 ** 2
+                )
+                return value
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            while len(self._entries) > 1 and (
+                (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+                or (self.max_entries is not None and len(self._entries) > self.max_entries)
+            ):
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+            }
+
+#################################################################################################
+# Per-session totals
+#
+# Sessions report their own state at the end of each rerun; the registry keeps the latest
+# measurement of every session seen in the last SESSION_IDLE_SECONDS.
+class SessionRegistry:
+    def __init__(self, idle_seconds=SESSION_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def record(self, session_id, state):
+        """
+        Measure one session's state.
+
+        Args:
+            session_id (str): Streamlit session id.
+            state (dict): Session state key -> value.
+
+        Returns:
+            dict with bytes (total) and keys (key -> bytes, largest first).
+        """
+        seen = set()
+        keys = {str(key): deep_size(value, seen) for key, value in state.items()}
+        entry = {
+            "bytes": sum(keys.values()),
+            "keys": dict(sorted(keys.items(), key=lambda item: -item[1])),
+            "updated": time.time(),
+        }
+        with self._lock:
+            self._sessions[session_id] = entry
+            cutoff = time.time() - self.idle_seconds
+            for stale in [sid for sid, e in self._sessions.items() if e["updated"] < cutoff]:
+                del self._sessions[stale]
+        return entry
+
+    def report(self):
+        with self._lock:
+            return {sid: dict(entry) for sid, entry in self._sessions.items()}
+
+
+SESSION_SIZES = SessionRegistry()
@@ -0,0 +1,208 @@
+import pickle
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+#################################################################################################
+# Selection model inputs
+#
+# The model takes the seven criteria as one row each, in this order. A batch CSV may name a
+# column by its key, by the label shown on the prediction page, or by the name the model was
+# trained with.
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+MODEL_PATH = "pages/models/final_model.pkl"
+
+FEATURES = {
+    "extended_affordability": {"label": "Extended Affordability Commitment", "max": 6.0, "step": 1.0},
+    "desirable_undesirable": {"label": "Desirable/Undesirable Activities", "max": 20.0, "step": 1.0},
+    "mixed_income": {"label": "Mixed Income Development", "max": 1.0, "step": 1.0},
+    "revitalization": {"label": "Revitalization/Redevelopment Plans", "max": 10.0, "step": 1.0},
+    "deeper_targeting": {"label": "Deeper Targeting/Rent/Income Restrictions", "max": 3.0, "step": 1.0},
+    "favorable_financing": {"label": "Favorable Financing", "max": 5.0, "step": 0.5},
+    "community_transportation": {"label": "Community Transportation Options", "max": 6.0, "step": 0.5},
+}
+
+# Inputs that are location scores of the site (-> the engine's score key for them); the
+# others describe the deal structure
+LOCATION_SCORE_KEYS = {"desirable_undesirable": "du_score", "community_transportation": "ct_score"}
+LOCATION_FEATURES = list(LOCATION_SCORE_KEYS)
+DEAL_FEATURES = [key for key in FEATURES if key not in LOCATION_FEATURES]
+
+
+def load_model(path=MODEL_PATH):
+    with open(REPO_ROOT / path, "rb") as f:
+        return pickle.load(f)
+
+
+def _normalize(name):
+    return "".join(c for c in str(name).lower() if c.isalnum())
+
+
+def feature_columns(columns, model=None):
+    """
+    Match CSV columns to the model features.
+
+    Returns:
+        (mapping, missing): {feature key: CSV column} and the labels of features with no column.
+    """
+    aliases = {key: {_normalize(key), _normalize(spec["label"])} for key, spec in FEATURES.items()}
+    for key, name in zip(FEATURES, getattr(model, "feature_names_in_", [])):
+        aliases[key].add(_normalize(name))
+
+    by_name = {_normalize(column): column for column in columns}
+    mapping, missing = {}, []
+    for key, names in aliases.items():
+        column = next((by_name[name] for name in names if name in by_name), None)
+        if column is None:
+            missing.append(FEATURES[key]["label"])
+        else:
+            mapping[key] = column
+    return mapping, missing
+
+
+def snap(key, values):
+    """
+    Round values of one input to its step and clip them to [0, max], as the prediction form
+    accepts them (scores below 0, e.g. a net Desirable/Undesirable deduction, become 0).
+    For values the engine computed; values a user supplied are checked by input_errors
+    instead, so a typo is reported rather than silently changed.
+
+    Args:
+        key (str): FEATURES key.
+        values (float or array): Raw values; NaN stays NaN.
+
+    Returns:
+        Snapped values, float for a scalar, an array otherwise.
+    """
+    step, maximum = FEATURES[key]["step"], FEATURES[key]["max"]
+    snapped = np.clip(np.round(np.asarray(values, dtype=float) / step) * step, 0.0, maximum)
+    return float(snapped) if snapped.ndim == 0 else snapped
+
+
+def input_errors(key, values):
+    """
+    Why each value of one input is not one the prediction form accepts.
+
+    Args:
+        key (str): FEATURES key.
+        values (array): Values as read (NaN for missing or non-numeric).
+
+    Returns:
+        Object array of messages, None where the value is accepted.
+    """
+    label, step, maximum = FEATURES[key]["label"], FEATURES[key]["step"], FEATURES[key]["max"]
+    values = np.asarray(values, dtype=float)
+    steps = values / step
+    errors = np.full(len(values), None, dtype=object)
+    off_step = ~np.isclose(steps, np.round(steps))
+    errors[off_step] = [f"{label} {value:g} is not a multiple of {step:g}" for value in values[off_step]]
+    out_of_range = (values < 0) | (values > maximum)
+    errors[out_of_range] = [f"{label} {value:g} is outside 0-{maximum:g}" for value in values[out_of_range]]
+    errors[np.isnan(values)] = f"{label} is missing or non-numeric"
+    return errors
+
+
+def prepare_features(df, mapping):
+    """
+    Build the feature matrix, checking every value against its criterion's step and range.
+
+    Returns:
+        (features, errors): float array of shape (rows, 7), and a string Series on df's
+        index saying why each row cannot be scored (missing, non-numeric, off-step or
+        out-of-range values), empty for rows that can. Rows with an error are left as NaN.
+    """
+    features = np.column_stack([
+        pd.to_numeric(df[mapping[key]], errors="coerce").to_numpy(dtype=float) for key in FEATURES
+    ])
+    messages = np.column_stack([input_errors(key, features[:, i]) for i, key in enumerate(FEATURES)])
+    errors = pd.Series(
+        ["; ".join(m for m in row if m is not None) or None for row in messages], index=df.index, dtype="string"
+    )
+    features[errors.notna().to_numpy()] = np.nan
+    return features, errors
+
+
+def predict_batch(model, features):
+    """
+    Selection probability of every row in one predict_proba call.
+
+    Returns:
+        (probabilities, seconds): probability of selection per row and the model time.
+    """
+    start = time.perf_counter()
+    probabilities = model.predict_proba(features)[:, 1]
+    return probabilities, time.perf_counter() - start
+
+
+def deal_key(deal=None):
+    """
+    Hashable copy of a deal structure, snapped to each input's step and range.
+
+    Args:
+        deal (dict): DEAL_FEATURES key -> value; missing inputs are 0.
+
+    Returns:
+        Tuple of (key, value) pairs in DEAL_FEATURES order.
+    """
+    deal = deal or {}
+    return tuple((key, snap(key, deal.get(key, 0.0))) for key in DEAL_FEATURES)
+
+
+def predict_surface(model, location_scores, deal=None):
+    """
+    Selection probability at many locations for one deal structure, in one model call.
+
+    Args:
+        model: Fitted classifier (XGBClassifier or lihtc.trees.TreeEnsemble).
+        location_scores (dict): LOCATION_FEATURES key -> array of scores, one per location.
+        deal (dict): Values of the deal inputs, as for deal_key.
+
+    Returns:
+        Array of probabilities, one per location.
+    """
+    deal_values = dict(deal_key(deal))
+    n = len(location_scores[LOCATION_FEATURES[0]])
+    features = np.column_stack([
+        np.asarray(location_scores[key], dtype=float) if key in location_scores else np.full(n, deal_values[key])
+        for key in FEATURES
+    ])
+    return predict_batch(model, features)[0]
+
+
+def predict_frame(model, df):
+    """
+    Score a table of applications.
+
+    Returns:
+        (result, stats): df with "probability_of_selection" and "error" columns (for a row
+        that cannot be scored the probability is empty and "error" says why), and rows,
+        scored, errors, seconds and rows_per_second.
+
+    Raises:
+        ValueError: a feature has no matching column.
+    """
+    mapping, missing = feature_columns(df.columns, model)
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    features, errors = prepare_features(df, mapping)
+    valid = errors.isna().to_numpy()
+    probabilities = np.full(len(df), np.nan)
+    seconds = 0.0
+    if valid.any():
+        probabilities[valid], seconds = predict_batch(model, features[valid])
+
+    result = df.copy()
+    result["probability_of_selection"] = probabilities
+    result["error"] = errors
+    scored = int(valid.sum())
+    return result, {
+        "rows": len(df),
+        "scored": scored,
+        "errors": len(df) - scored,
+        "seconds": seconds,
+        "rows_per_second": scored / seconds if seconds > 0 else float("inf"),
+    }
@@ -0,0 +1,195 @@
+import heapq
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from lihtc import engine
+
+#################################################################################################
+# Best-site search
+#
+# Finds the highest-scoring points within a radius of a candidate site in two passes:
+#   1. coarse - the precomputed total score grid ranks the area and gives every lattice
+#      point an estimate (the score of its nearest grid point);
+#   2. refine - a lattice of points at step_miles spacing is scored exactly, best estimates
+#      first. Categories are scored one at a time, and a point is dropped as soon as its
+#      partial score plus the most the remaining categories could add cannot reach the
+#      current k-th best, so most points never run all four scorers.
+# A point whose scoring fails (e.g. just past the edge of a dataset) is skipped and counted,
+# like a failed row in lihtc.batch, and the search goes on.
+GRID_PATH = "data/maps/total_location_score/total_score_metro_atl.geojson"
+
+# QAP maximum points per category, the pruning bound
+MAX_POINTS = {"ct_score": 6, "du_score": 20, "qe_score": 3, "sc_score": 10}
+
+# Score the widest-ranging categories first so the bound tightens fastest
+SCORING_ORDER = ["du_score", "sc_score", "ct_score", "qe_score"]
+
+MILES_PER_DEGREE_LAT = 69.0
+
+
+def miles_between(lat1, lon1, lat2, lon2):
+    """Equirectangular distance in miles; exact enough over a few miles."""
+    dy = (np.asarray(lat2) - lat1) * MILES_PER_DEGREE_LAT
+    dx = (np.asarray(lon2) - lon1) * MILES_PER_DEGREE_LAT * math.cos(math.radians(lat1))
+    return np.hypot(dx, dy)
+
+
+def get_score_grid():
+    def build():
+        grid = gpd.read_file(engine.REPO_ROOT / GRID_PATH).to_crs("EPSG:4326")
+        grid = grid[grid["score"].notnull()]
+        return {
+            "lat": grid["lat"].to_numpy(),
+            "lon": grid["lon"].to_numpy(),
+            "score": grid["score"].to_numpy(dtype=float),
+            "tree": shapely.STRtree(grid.geometry.to_numpy()),
+        }
+    return engine.cached("search_score_grid", build)
+
+
+def lattice(latitude, longitude, radius_miles, step_miles):
+    """(lats, lons) of a square lattice clipped to the disk of radius_miles around the site."""
+    n = int(radius_miles // step_miles)
+    offsets = np.arange(-n, n + 1) * step_miles
+    dy, dx = np.meshgrid(offsets, offsets, indexing="ij")
+    inside = np.hypot(dx, dy) <= radius_miles + 1e-9
+    lats = latitude + dy[inside] / MILES_PER_DEGREE_LAT
+    lons = longitude + dx[inside] / (MILES_PER_DEGREE_LAT * math.cos(math.radians(latitude)))
+    return lats, lons
+
+
+def coarse_candidates(latitude, longitude, radius_miles, step_miles):
+    """
+    Returns:
+        List of (estimate, lat, lon) for the lattice points, the site itself and the grid
+        points inside the radius, sorted best estimate first.
+    """
+    grid = get_score_grid()
+    lats, lons = lattice(latitude, longitude, radius_miles, step_miles)
+
+    # Each lattice point's estimate is the score of its nearest grid point
+    nearest = grid["tree"].query_nearest(shapely.points(lons, lats), return_distance=False)[1]
+    candidates = list(zip(grid["score"][nearest], lats, lons))
+
+    # Grid points inside the radius are candidates too (they are where the grid peaks)
+    in_radius = miles_between(latitude, longitude, grid["lat"], grid["lon"]) <= radius_miles
+    candidates += list(zip(grid["score"][in_radius], grid["lat"][in_radius], grid["lon"][in_radius]))
+    candidates.append((np.inf, latitude, longitude))
+
+    # Drop points that coincide (to ~1 m) with a better-ranked one
+    unique = {}
+    for estimate, lat, lon in sorted(candidates, key=lambda c: -c[0]):
+        unique.setdefault((round(lat, 5), round(lon, 5)), (estimate, float(lat), float(lon)))
+    return list(unique.values())
+
+
+def score_with_pruning(latitude, longitude, threshold, kwargs):
+    """
+    Score categories in SCORING_ORDER, stopping once the site cannot beat threshold.
+
+    Returns:
+        (scores, complete): the categories scored so far (plus total_score if complete).
+    """
+    scores = {}
+    remaining = sum(MAX_POINTS.values())
+    for key in SCORING_ORDER:
+        scores[key] = engine.SCORERS[key](latitude, longitude, **kwargs).calculate_score()
+        remaining -= MAX_POINTS[key]
+        if sum(scores.values()) + remaining <= threshold:
+            return scores, False
+    scores["total_score"] = sum(scores.values())
+    return scores, True
+
+
+def _evaluate_chunk(points, threshold, top_k):
+    """
+    Worker task: exact-score points with pruning.
+
+    Returns:
+        (complete results, pruned count, scorer calls, skipped count, first skip reason or None)
+    """
+    kwargs = engine.get_scorer_kwargs()
+    best = []
+    results, pruned, calls, skipped, error = [], 0, 0, 0, None
+    for lat, lon in points:
+        local_threshold = max(threshold, best[0] if len(best) >= top_k else -np.inf)
+        try:
+            scores, complete = score_with_pruning(lat, lon, local_threshold, kwargs)
+        except Exception as e:
+            skipped += 1
+            error = error or f"{type(e).__name__}: {e}"
+            continue
+        calls += sum(1 for key in SCORING_ORDER if key in scores)
+        if not complete:
+            pruned += 1
+            continue
+        results.append((lat, lon, scores))
+        heapq.heappush(best, scores["total_score"])
+        if len(best) > top_k:
+            heapq.heappop(best)
+    return results, pruned, calls, skipped, error
+
+
+def find_best_sites(latitude, longitude, radius_miles=0.5, top_k=5, step_miles=0.05, workers=1, chunk=32):
+    """
+    Find the top_k highest-scoring points within radius_miles of a site.
+
+    Args:
+        latitude, longitude (float): Candidate site.
+        radius_miles (float): Search radius.
+        top_k (int): Number of locations to return.
+        step_miles (float): Lattice spacing for the exact pass.
+        workers (int): Processes for the exact pass; 1 scores in this process (use 1 inside
+            a web server, where forking is unsafe).
+        chunk (int): Points per batch; the pruning threshold is shared between batches.
+
+    Returns:
+        dict with "sites" (top_k dicts of lat, lon, distance_miles and the score keys,
+        best first) and "stats" (candidates, scored, pruned, scorer_calls, and skipped:
+        points whose scoring failed, with the first failure in skip_reason).
+    """
+    candidates = coarse_candidates(latitude, longitude, radius_miles, step_miles)
+    points = [(lat, lon) for _, lat, lon in candidates]
+    batches = [points[i:i + chunk] for i in range(0, len(points), chunk)]
+
+    best = []  # min-heap of (total_score, lat, lon, scores)
+    stats = {"candidates": len(points), "scored": 0, "pruned": 0, "scorer_calls": 0, "skipped": 0, "skip_reason": None}
+
+    def threshold():
+        return best[0][0] if len(best) >= top_k else -np.inf
+
+    def collect(outcome):
+        results, pruned, calls, skipped, error = outcome
+        stats["pruned"] += pruned
+        stats["scorer_calls"] += calls
+        stats["skipped"] += skipped
+        stats["skip_reason"] = stats["skip_reason"] or error
+        for lat, lon, scores in results:
+            stats["scored"] += 1
+            heapq.heappush(best, (scores["total_score"], lat, lon, scores))
+            if len(best) > top_k:
+                heapq.heappop(best)
+
+    if workers > 1:
+        engine.get_scorer_kwargs()
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            # One wave of batches per worker at a time, so later waves get the tighter threshold
+            for i in range(0, len(batches), workers):
+                futures = [pool.submit(_evaluate_chunk, batch, threshold(), top_k) for batch in batches[i:i + workers]]
+                for future in futures:
+                    collect(future.result())
+    else:
+        for batch in batches:
+            collect(_evaluate_chunk(batch, threshold(), top_k))
+
+    sites = [
+        dict(scores, lat=lat, lon=lon, distance_miles=float(miles_between(latitude, longitude, lat, lon)))
+        for _, lat, lon, scores in sorted(best, key=lambda b: -b[0])
+    ]
+    return {"sites": sites, "stats": stats}
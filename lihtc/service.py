@@ -0,0 +1,309 @@
+"""
+Local HTTP scoring service
+==========================
+
+Serves the scoring engine over HTTP for other local tools. Datasets are loaded once at
+startup and inherited by a pool of worker processes that do the CPU-bound scoring, so the
+event loop stays free to answer requests.
+
+    python -m lihtc.service [--host 127.0.0.1] [--port 8765] [--workers 4] [--max-batch 500]
+
+Endpoints (JSON in, JSON out):
+
+    GET  /health        the process is up
+    GET  /ready         200 once the datasets are loaded and the workers are started, else 503
+    POST /score         {"lat": 33.75, "lon": -84.39}
+                        (or GET /score?lat=33.75&lon=-84.39)
+    POST /score/batch   {"sites": [{"id": "A", "lat": 33.75, "lon": -84.39}, ...]}
+
+Every score result carries ct_score, du_score, qe_score, sc_score and total_score plus
+timings in milliseconds; a site that fails to score gets an "error" instead.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from lihtc import engine
+from lihtc.coalesce import AsyncCoalescer, site_key
+from lihtc.timing import configure_logging
+
+DEFAULT_MAX_BATCH = 500
+
+# Most sites per task sent to a worker; large enough to amortize the round trip
+BATCH_CHUNK_SIZE = 25
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+logger = logging.getLogger("lihtc.service")
+
+
+class RequestError(Exception):
+    """A client error, reported with its HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+#################################################################################################
+# Worker side - runs in the pool processes
+def _warm_worker():
+    # With fork the datasets are inherited from the parent; otherwise this loads them
+    engine.get_scorer_kwargs()
+
+
+def _score_chunk(sites):
+    kwargs = engine.get_scorer_kwargs()
+    results = []
+    for site in sites:
+        start = time.perf_counter()
+        try:
+            result = engine.score_site(site["lat"], site["lon"], kwargs)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        result["timings"] = {"score_ms": (time.perf_counter() - start) * 1000}
+        results.append(result)
+    return results
+
+#################################################################################################
+# Request parsing
+def parse_site(site):
+    """Validate one {"lat", "lon"[, "id"]} object; returns a clean copy."""
+    if not isinstance(site, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Each site must be an object with lat and lon")
+    try:
+        lat, lon = float(site["lat"]), float(site["lon"])
+    except (KeyError, TypeError, ValueError):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Each site needs numeric lat and lon")
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        raise RequestError(HTTPStatus.BAD_REQUEST, f"Coordinates out of range: {lat}, {lon}")
+    clean = {"lat": lat, "lon": lon}
+    if "id" in site:
+        clean["id"] = site["id"]
+    return clean
+
+
+def parse_json(body):
+    """The request body as a JSON object."""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Request body is not valid JSON")
+    if not isinstance(payload, dict):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "Request body must be a JSON object")
+    return payload
+
+#################################################################################################
+# Service
+class ScoringService:
+    """
+    Args:
+        workers (int): Worker processes for scoring.
+        max_batch (int): Largest number of sites accepted by /score/batch.
+    """
+
+    def __init__(self, workers=os.cpu_count(), max_batch=DEFAULT_MAX_BATCH):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.pool = None
+        self.ready = False
+        self.started = time.time()
+        self.startup_error = None
+        # Identical sites requested while one is being scored share its computation
+        self.coalescer = AsyncCoalescer()
+
+    def start(self):
+        """
+        Load the datasets once in this process, then fork the workers from it.
+
+        Call before the event loop starts: forking a process that already runs threads (the
+        loop's executor, the pool's manager) can leave a worker holding a lock no thread will
+        release, so the load and the fork happen while this is the only thread.
+        """
+        try:
+            start = time.perf_counter()
+            engine.get_scorer_kwargs()
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=context, initializer=_warm_worker)
+            # Start every worker now rather than on the first request
+            for future in [self.pool.submit(_warm_worker) for _ in range(self.workers)]:
+                future.result()
+            self.ready = True
+            logger.info("Scoring service ready in %.1fs with %d workers", time.perf_counter() - start, self.workers,
+                        extra={"fields": {"event": "ready", "workers": self.workers}})
+        except Exception as e:
+            self.startup_error = f"{type(e).__name__}: {e}"
+            logger.error("Scoring service failed to load data: %s", self.startup_error, extra={"fields": {"event": "startup_error"}})
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    async def score_on_pool(self, sites):
+        """Score sites on the worker pool, in order, with per-site timings."""
+        loop = asyncio.get_running_loop()
+        # Spread small batches over every worker; cap chunks for large ones
+        size = max(1, min(BATCH_CHUNK_SIZE, math.ceil(len(sites) / self.workers)))
+        chunks = [sites[i:i + size] for i in range(0, len(sites), size)]
+        chunk_results = await asyncio.gather(*[loop.run_in_executor(self.pool, _score_chunk, chunk) for chunk in chunks])
+        return [result for chunk in chunk_results for result in chunk]
+
+    async def score(self, sites):
+        """Score sites, coalescing with identical sites already being scored; returns (results, ms)."""
+        start = time.perf_counter()
+        version = engine.engine_data_version()
+        results = await self.coalescer.run_many(
+            [{"lat": site["lat"], "lon": site["lon"]} for site in sites],
+            lambda site: site_key(site["lat"], site["lon"], version),
+            self.score_on_pool
+        )
+        for site, result in zip(sites, results):
+            if "id" in site:
+                result["id"] = site["id"]
+        return results, (time.perf_counter() - start) * 1000
+
+    async def handle(self, method, path, body):
+        """Route one request; returns (status, JSON-serializable payload)."""
+        url = urlsplit(path)
+
+        if url.path == "/health":
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "uptime_s": time.time() - self.started,
+                "coalescing": self.coalescer.stats(),
+            }
+
+        if url.path == "/ready":
+            payload = {
+                "ready": self.ready,
+                "workers": self.workers,
+                "data_version": engine.engine_data_version(),
+                "error": self.startup_error,
+            }
+            return (HTTPStatus.OK if self.ready else HTTPStatus.SERVICE_UNAVAILABLE), payload
+
+        if url.path not in ("/score", "/score/batch"):
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No endpoint {url.path}")
+        if not self.ready:
+            raise RequestError(HTTPStatus.SERVICE_UNAVAILABLE, self.startup_error or "Datasets are still loading")
+
+        if url.path == "/score":
+            if method == "GET":
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            elif method == "POST":
+                query = parse_json(body)
+            else:
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET or POST")
+            [result], elapsed_ms = await self.score([parse_site(query)])
+            result["timings"]["total_ms"] = elapsed_ms
+            return HTTPStatus.OK, result
+
+        if method != "POST":
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST")
+        sites = parse_json(body).get("sites")
+        if not isinstance(sites, list) or not sites:
+            raise RequestError(HTTPStatus.BAD_REQUEST, "Body must be {\"sites\": [...]} with at least one site")
+        if len(sites) > self.max_batch:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {self.max_batch} sites per batch")
+        results, elapsed_ms = await self.score([parse_site(site) for site in sites])
+        return HTTPStatus.OK, {
+            "results": results,
+            "timings": {"total_ms": elapsed_ms, "per_site_ms": elapsed_ms / len(results)},
+        }
+
+    async def serve_connection(self, reader, writer):
+        """Minimal HTTP/1.1: one JSON request/response at a time, with keep-alive."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    try:
+                        length = int(headers.get("content-length", 0) or 0)
+                    except ValueError:
+                        length = None
+                    if length is None or length < 0:
+                        raise RequestError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+                    if length > MAX_BODY_BYTES:
+                        raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self.handle(method, path, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+
+                # An unread body leaves the connection unusable for another request
+                body_unread = length is None or length < 0 or length > MAX_BODY_BYTES
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1" and not body_unread
+                data = json.dumps(payload).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, host="127.0.0.1", port=8765):
+    server = await asyncio.start_server(service.serve_connection, host, port)
+    logger.info("Scoring service listening on http://%s:%d", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    args = parser.parse_args()
+    configure_logging()
+    # Startup status is always shown; LIHTC_LOG_LEVEL still controls the span and memory logs
+    if not logger.isEnabledFor(logging.INFO):
+        logger.setLevel(logging.INFO)
+    service = ScoringService(args.workers, args.max_batch)
+    logger.info("Loading datasets and starting %d workers...", args.workers)
+    # Before asyncio.run, so the workers are forked while this process has no other threads;
+    # if loading fails the service still starts and /ready reports the error
+    service.start()
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+#################################################################################################
+# Timing spans
+#
+# span() times a block of code and logs it as one JSON line on the "lihtc.timing" logger at
+# INFO. Spans opened while a trace is active (the app starts one per rerun) are also kept on
+# the trace in the order they started, with their nesting depth, so a page can show where a
+# rerun spent its time. With no trace and logging below INFO a span costs two clock reads.
+#
+# LIHTC_LOG_LEVEL=INFO turns the span log on; WARNING (the default) keeps only warnings.
+LOG_LEVEL = os.environ.get("LIHTC_LOG_LEVEL", "WARNING").upper()
+
+# Package loggers that write JSON lines (both packages log under their module names)
+LOGGERS = ["lihtc", "map_layers"]
+
+logger = logging.getLogger("lihtc.timing")
+
+_current_trace = contextvars.ContextVar("lihtc_trace", default=None)
+_current_span = contextvars.ContextVar("lihtc_span", default=None)
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed as extra={"fields": {...}} are merged in."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, stream=None):
+    """
+    Send the package loggers to stderr (or stream) as JSON lines. Only the first call in a
+    process has an effect, so the app can call it on every rerun.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        for name in LOGGERS:
+            package_logger = logging.getLogger(name)
+            package_logger.addHandler(handler)
+            package_logger.setLevel(level)
+            package_logger.propagate = False
+        _configured = True
+
+
+class Trace:
+    """
+    Spans recorded during one unit of work (e.g. a Streamlit rerun).
+
+    Args:
+        name (str): What is being traced, e.g. the page.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = datetime.now(timezone.utc)
+        self.spans = []
+        self.seconds = None
+        self._start = time.perf_counter()
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self._start
+        return self
+
+    def rows(self):
+        """Span table: name indented by depth, details, and milliseconds (None if unfinished)."""
+        return [
+            {
+                "span": "  " * span["depth"] + span["name"],
+                "detail": ", ".join(f"{k}={v}" for k, v in span.items() if k not in ("name", "depth", "ms")),
+                "ms": span.get("ms"),
+            }
+            for span in self.spans
+        ]
+
+    def slowest(self):
+        """The longest top-level span, or None."""
+        top_level = [span for span in self.spans if span["depth"] == 0 and "ms" in span]
+        return max(top_level, key=lambda span: span["ms"], default=None)
+
+
+def start_trace(name):
+    """Collect the spans of this thread/context on a new Trace until finish_trace()."""
+    trace = Trace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace():
+    """
+    Stop collecting and log the trace's total.
+
+    Returns:
+        The finished Trace, or None if none was started.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    _current_trace.set(None)
+    trace.finish()
+    slowest = trace.slowest()
+    logger.info(trace.name, extra={"fields": {
+        "event": "trace",
+        "ms": round(trace.seconds * 1000, 3),
+        "spans": len(trace.spans),
+        "slowest": slowest["name"] if slowest else None,
+    }})
+    return trace
+
+
+@contextmanager
+def span(name, **fields):
+    """
+    Time the block; fields (e.g. layer=..., path=...) are logged and kept with the span.
+
+    Yields:
+        The span's dict, to which the block may add fields.
+    """
+    parent = _current_span.get()
+    record = dict(fields, name=name, depth=parent["depth"] + 1 if parent else 0)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append(record)
+    token = _current_span.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _current_span.reset(token)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(name, extra={"fields": dict(record, event="span", trace=trace.name if trace else None)})
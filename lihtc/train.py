@@ -0,0 +1,452 @@
+"""
+Selection model training.
+
+    python -m lihtc.train [--features deal_inputs.csv] [--deal mixed_income=1 ...]
+                          [--workers 8] [--seed 42] [--folds 5] [--promote]
+
+Builds the model inputs for every past application (location criteria scored by the engine,
+deal criteria from --features), runs a cross-validated hyperparameter search in parallel,
+and writes the refitted model as a new version under pages/models/versions. With --promote
+the new version also replaces final_model.pkl, its exported trees and final_model.json, the
+metadata the prediction page checks when it loads the model; a version in which any input is
+the same for every application (a --deal constant, or a column that never varies) is never
+promoted.
+
+Training needs scikit-learn and xgboost; the app only needs read_metadata/check_metadata.
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import pickle
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from lihtc.prediction import DEAL_FEATURES, FEATURES, LOCATION_SCORE_KEYS, MODEL_PATH, feature_columns, prepare_features, snap
+from lihtc.trees import PARITY_TOLERANCE, TREES_PATH, check_parity, export_trees, load_trees, write_trees
+
+#################################################################################################
+# Training setup
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+APPLICANTS_PATH = "data/maps/application_list_2022_2023_2024_v2.geojson"
+METADATA_PATH = "pages/models/final_model.json"
+VERSIONS_DIR = "pages/models/versions"
+
+# Every combination is searched; kept small because the applicant list is only a few rounds long
+PARAM_GRID = {
+    "max_depth": [2, 3, 4, 6],
+    "n_estimators": [50, 100, 200],
+    "learning_rate": [0.05, 0.1, 0.3],
+    "subsample": [0.8, 1.0],
+}
+
+# Cross-validation metrics (scikit-learn scorer names); the best model minimises log loss
+SCORING = {
+    "log_loss": "neg_log_loss",
+    "brier": "neg_brier_score",
+    "roc_auc": "roc_auc",
+    "accuracy": "accuracy",
+}
+REFIT_METRIC = "log_loss"
+
+SEED = 42
+FOLDS = 5
+
+
+def file_sha256(path):
+    return hashlib.sha256((REPO_ROOT / path).read_bytes()).hexdigest()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+#################################################################################################
+# Feature matrix
+def load_applicants(path=APPLICANTS_PATH):
+    """
+    Past applications with a location and a decision.
+
+    Returns:
+        DataFrame with the applicant list columns and "selected" (1 for status Select),
+        one row per development_id.
+    """
+    gdf = gpd.read_file(REPO_ROOT / path)
+    gdf = gdf[gdf["lat"].notnull() & gdf["lon"].notnull() & gdf["status"].notnull()]
+    # The list repeats a few applications verbatim; each is one training example
+    gdf = gdf.drop_duplicates("development_id")
+    df = pd.DataFrame(gdf.drop(columns="geometry")).reset_index(drop=True)
+    df["selected"] = (df["status"] == "Select").astype(int)
+    df["geographic_pool"] = df["geographic_pool"].fillna("Unknown")
+    return df
+
+
+def score_locations(df, workers=1, chunk=16):
+    """
+    Score every application's location with the engine, on a pool of worker processes
+    forked after the scoring data is loaded (as in lihtc.batch).
+
+    Returns:
+        (scores, stats): {LOCATION_SCORE_KEYS key: array snapped to the input's step and
+        range, NaN where scoring failed} and
+        sites, errors, data_load_s, seconds and sites_per_second.
+    """
+    from lihtc import engine
+    from lihtc.batch import score_frame
+
+    start = time.perf_counter()
+    engine.get_scorer_kwargs()
+    load_s = time.perf_counter() - start
+
+    sites = df[["lat", "lon"]]
+    start = time.perf_counter()
+    if workers > 1 and len(sites) > chunk:
+        chunks = [sites[i:i + chunk] for i in range(0, len(sites), chunk)]
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            scored = pd.concat(pool.map(score_frame, chunks, ["lat"] * len(chunks), ["lon"] * len(chunks)))
+    else:
+        scored = score_frame(sites, "lat", "lon")
+    seconds = time.perf_counter() - start
+
+    scores = {feature: snap(feature, scored[score_key].to_numpy(dtype=float)) for feature, score_key in LOCATION_SCORE_KEYS.items()}
+    return scores, {
+        "sites": len(df),
+        "errors": int(scored["error"].notna().sum()),
+        "data_load_s": load_s,
+        "seconds": seconds,
+        "sites_per_second": len(df) / seconds if seconds > 0 else None,
+    }
+
+
+def build_features(df, features_csv=None, deal=None, workers=1):
+    """
+    Model inputs for each application, in FEATURES order.
+
+    Args:
+        df (DataFrame): Applications, as from load_applicants().
+        features_csv (str): CSV keyed by development_id with input columns named like the
+            prediction page inputs; location inputs it lacks are scored by the engine.
+        deal (dict): Values for deal inputs the CSV lacks (default 0).
+        workers (int): Processes for location scoring.
+
+    Returns:
+        (X, stats): the (applications, 7) input matrix, NaN in rows with a missing,
+        off-step or out-of-range input, and where each input came from, the first few
+        input errors and the location scoring throughput.
+    """
+    if features_csv:
+        extra = pd.read_csv(features_csv, dtype={"development_id": str})
+        repeated = extra.loc[extra["development_id"].duplicated(), "development_id"].unique()
+        if len(repeated):
+            raise ValueError(f"{features_csv} has more than one row for development_id {', '.join(repeated[:5])}")
+        df = df.merge(extra, on="development_id", how="left", suffixes=("", "_input"))
+    mapping, _ = feature_columns(df.columns)
+
+    inputs = pd.DataFrame(index=df.index)
+    sources = {}
+    stats = {}
+    if any(feature not in mapping for feature in LOCATION_SCORE_KEYS):
+        scores, stats["location_scoring"] = score_locations(df, workers)
+    for feature in FEATURES:
+        if feature in mapping:
+            inputs[feature], sources[feature] = df[mapping[feature]], f"column {mapping[feature]}"
+        elif feature in LOCATION_SCORE_KEYS:
+            inputs[feature], sources[feature] = scores[feature], "scoring engine"
+        else:
+            value = (deal or {}).get(feature, 0.0)
+            inputs[feature], sources[feature] = value, f"constant {value}"
+
+    X, errors = prepare_features(inputs, {feature: feature for feature in FEATURES})
+    stats.update({
+        "sources": sources,
+        "rows": len(df),
+        "complete_rows": int(errors.isna().sum()),
+        "input_errors": errors.dropna().head(5).tolist(),
+    })
+    return X, stats
+
+
+def data_hash(X, y, ids):
+    """Digest of exactly what the model was fitted on: inputs, labels and row identity."""
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+    digest.update(np.ascontiguousarray(y, dtype=np.int64).tobytes())
+    digest.update("\n".join(map(str, ids)).encode())
+    return digest.hexdigest()
+
+#################################################################################################
+# Search
+def fit_model(X, y, workers=1, seed=SEED, folds=FOLDS, param_grid=PARAM_GRID):
+    """
+    Grid search over param_grid with stratified k-fold cross-validation, one fit per
+    process; each XGBoost fit is single-threaded so the pool does not oversubscribe cores.
+    With the same inputs and seed the result is the same however many workers run it.
+
+    Returns:
+        (model, search): the XGBClassifier refitted on all rows with the best parameters
+        and a summary of the search (best parameters, cross-validated metrics, fit time).
+    """
+    from sklearn.model_selection import GridSearchCV, StratifiedKFold
+    from xgboost import XGBClassifier
+
+    # Named like the prediction page inputs, so batch CSVs match on the model's own names
+    X = pd.DataFrame(X, columns=[spec["label"] for spec in FEATURES.values()])
+    folds = min(folds, int(np.bincount(y).min()))
+    if folds < 2:
+        raise ValueError("Both selected and non-selected applications are needed to train")
+
+    estimator = XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        tree_method="hist",
+        random_state=seed,
+        n_jobs=1
+    )
+    search = GridSearchCV(
+        estimator,
+        param_grid,
+        scoring=SCORING,
+        refit=REFIT_METRIC,
+        cv=StratifiedKFold(folds, shuffle=True, random_state=seed),
+        n_jobs=workers
+    )
+    start = time.perf_counter()
+    search.fit(X, y)
+    seconds = time.perf_counter() - start
+
+    best = search.best_index_
+    cv_metrics = {}
+    for name, scorer in SCORING.items():
+        mean, std = search.cv_results_[f"mean_test_{name}"][best], search.cv_results_[f"std_test_{name}"][best]
+        # scikit-learn negates losses so that higher is better; report them as losses
+        sign = -1.0 if scorer.startswith("neg_") else 1.0
+        cv_metrics[name] = {"mean": float(sign * mean), "std": float(std)}
+
+    return search.best_estimator_, {
+        "best_params": {key: value.item() if hasattr(value, "item") else value for key, value in search.best_params_.items()},
+        "param_grid": param_grid,
+        "candidates": len(search.cv_results_["params"]),
+        "folds": folds,
+        "seed": seed,
+        "workers": workers,
+        "cv_metrics": cv_metrics,
+        "search_seconds": seconds,
+    }
+
+
+def training_metrics(model, X, y):
+    p = model.predict_proba(X)[:, 1]
+    p_clipped = np.clip(p, 1e-7, 1 - 1e-7)
+    return {
+        "accuracy": float(((p >= 0.5) == y).mean()),
+        "brier": float(np.mean((p - y) ** 2)),
+        "log_loss": float(-np.mean(y * np.log(p_clipped) + (1 - y) * np.log(1 - p_clipped))),
+    }
+
+#################################################################################################
+# Versioned artifacts
+def read_metadata(path=METADATA_PATH):
+    """The metadata of the promoted model, or None for a model that predates lihtc.train."""
+    path = REPO_ROOT / path
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def check_metadata(model, trees_path=TREES_PATH, path=METADATA_PATH):
+    """
+    Check loaded trees against the metadata written when they were trained.
+
+    Returns:
+        The metadata, or None if there is none.
+
+    Raises:
+        ValueError: the trees file is not the one trained, or its inputs are not the
+            ones (or not in the order) the app supplies.
+    """
+    metadata = read_metadata(path)
+    if metadata is None:
+        return None
+    if metadata["inputs"] != list(FEATURES):
+        raise ValueError(f"Model v{metadata['version']} was trained on inputs {metadata['inputs']}, the app supplies {list(FEATURES)}")
+    if list(model.feature_names_in_) != metadata["feature_names"]:
+        raise ValueError(f"Model features {list(model.feature_names_in_)} do not match model v{metadata['version']}")
+    if file_sha256(trees_path) != metadata["artifacts"]["trees"]["sha256"]:
+        raise ValueError(f"{trees_path} is not the file trained as model v{metadata['version']}; re-run python -m lihtc.train")
+    return metadata
+
+
+def next_version():
+    versions = [
+        int(path.stem.rsplit("_v", 1)[1])
+        for path in (REPO_ROOT / VERSIONS_DIR).glob("final_model_v*.json")
+    ]
+    return max(versions, default=0) + 1
+
+
+def write_version(model, metadata, promote=False):
+    """
+    Write model version metadata["version"]: its pickle, exported trees and metadata under
+    VERSIONS_DIR and, if promote, over the live MODEL_PATH, TREES_PATH and METADATA_PATH.
+
+    Raises:
+        ValueError: the exported trees do not reproduce the model.
+    """
+    version = metadata["version"]
+    (REPO_ROOT / VERSIONS_DIR).mkdir(parents=True, exist_ok=True)
+    model_path = f"{VERSIONS_DIR}/final_model_v{version}.pkl"
+    trees_path = f"{VERSIONS_DIR}/final_model_v{version}_trees.npz"
+
+    with open(REPO_ROOT / model_path, "wb") as f:
+        pickle.dump(model, f)
+    write_trees(export_trees(model), trees_path)
+    parity = check_parity(model, load_trees(trees_path), rows=10_000)
+    if parity["max_abs_diff"] > PARITY_TOLERANCE:
+        raise ValueError(f"Exported trees differ from the model by {parity['max_abs_diff']:.2e}")
+
+    # path is the versioned file the sha256 is of; live_path is where a promoted copy went
+    metadata["artifacts"] = {
+        "model": {"path": model_path, "sha256": file_sha256(model_path)},
+        "trees": {"path": trees_path, "sha256": file_sha256(trees_path), "max_abs_diff": parity["max_abs_diff"]},
+    }
+    if promote:
+        metadata["artifacts"]["model"]["live_path"] = MODEL_PATH
+        metadata["artifacts"]["trees"]["live_path"] = TREES_PATH
+    (REPO_ROOT / VERSIONS_DIR / f"final_model_v{version}.json").write_text(json.dumps(metadata, indent=2))
+
+    if promote:
+        shutil.copyfile(REPO_ROOT / model_path, REPO_ROOT / MODEL_PATH)
+        shutil.copyfile(REPO_ROOT / trees_path, REPO_ROOT / TREES_PATH)
+        (REPO_ROOT / METADATA_PATH).write_text(json.dumps(metadata, indent=2))
+    return metadata
+
+
+def constant_inputs(X, sources):
+    """Labels of the inputs that are the same for every application (NaN rows excluded)."""
+    return [
+        FEATURES[feature]["label"]
+        for column, (feature, source) in enumerate(sources.items())
+        if source.startswith("constant") or len(np.unique(X[:, column])) <= 1
+    ]
+
+
+def train(features_csv=None, deal=None, workers=1, seed=SEED, folds=FOLDS, promote=False, progress=sys.stderr):
+    """
+    Build the inputs, search, and write a new model version.
+
+    Returns:
+        The new version's metadata.
+
+    Raises:
+        ValueError: promote was asked for but an input is constant across applications, so
+            the model could not have learned from it.
+    """
+    def report(message):
+        if progress is not None:
+            print(message, file=progress, flush=True)
+
+    applicants = load_applicants()
+    report(f"Building inputs for {len(applicants)} applications with {workers} workers...")
+    X, feature_stats = build_features(applicants, features_csv, deal, workers)
+
+    valid = ~np.isnan(X).any(axis=1)
+    if not valid.all():
+        report(f"Dropping {int((~valid).sum())} applications with missing or invalid inputs, e.g. {feature_stats['input_errors'][0]}")
+    X, applicants = X[valid], applicants[valid].reset_index(drop=True)
+    y = applicants["selected"].to_numpy()
+
+    constant = constant_inputs(X, feature_stats["sources"])
+    if constant and promote:
+        raise ValueError(
+            f"Not promoting a model with inputs that are the same for every application: "
+            f"{', '.join(constant)}. Pass them with --features, or train without --promote"
+        )
+    for label in constant:
+        report(f"{label} is the same for every application; pass it with --features")
+
+    report(f"Searching {int(np.prod([len(v) for v in PARAM_GRID.values()]))} parameter sets on {len(y)} applications...")
+    model, search = fit_model(X, y, workers, seed, folds)
+    report(f"Best {search['best_params']}, CV log loss {search['cv_metrics']['log_loss']['mean']:.4f}")
+
+    import sklearn
+    import xgboost
+
+    metadata = {
+        "version": next_version(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "inputs": list(FEATURES),
+        "feature_names": [spec["label"] for spec in FEATURES.values()],
+        "data": {
+            "applicants": {"path": APPLICANTS_PATH, "sha256": file_sha256(APPLICANTS_PATH)},
+            "features_csv": {"path": str(features_csv), "sha256": hashlib.sha256(Path(features_csv).read_bytes()).hexdigest()} if features_csv else None,
+            "sha256": data_hash(X, y, applicants["development_id"]),
+            "rows": int(len(y)),
+            "selected": int(y.sum()),
+            "dropped_rows": int((~valid).sum()),
+            "sources": feature_stats["sources"],
+        },
+        "search": search,
+        "training_metrics": training_metrics(model, pd.DataFrame(X, columns=model.feature_names_in_), y),
+        "versions": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scikit-learn": sklearn.__version__,
+            "xgboost": xgboost.__version__,
+        },
+    }
+    metadata = write_version(model, metadata, promote)
+    report(f"Wrote model v{metadata['version']}" + (" and promoted it" if promote else ""))
+    return metadata
+
+
+def parse_deal(items):
+    deal = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        if key not in DEAL_FEATURES:
+            raise SystemExit(f"--deal keys are {', '.join(DEAL_FEATURES)}")
+        deal[key] = float(value)
+    return deal
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lihtc.train", description="Selection model training")
+    parser.add_argument("--features", help="CSV of model inputs keyed by development_id")
+    parser.add_argument("--deal", nargs="+", default=[], metavar="KEY=VALUE", help="Deal inputs missing from --features")
+    parser.add_argument("--workers", type=int, default=None, help="Processes for scoring and search (default: all CPUs)")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--folds", type=int, default=FOLDS)
+    parser.add_argument("--promote", action="store_true", help="Also make the new version the live model")
+    args = parser.parse_args(argv)
+
+    metadata = train(
+        features_csv=Path(args.features).resolve() if args.features else None,
+        deal=parse_deal(args.deal),
+        workers=args.workers or multiprocessing.cpu_count(),
+        seed=args.seed,
+        folds=args.folds,
+        promote=args.promote
+    )
+    print(json.dumps({key: metadata[key] for key in ["version", "data", "search", "training_metrics", "artifacts"]}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
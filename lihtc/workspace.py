@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from lihtc import engine
+from lihtc.batch import LAT_COLUMNS, LON_COLUMNS, find_column
+from lihtc.coalesce import site_key
+from lihtc.prediction import FEATURES, LOCATION_SCORE_KEYS, feature_columns, predict_frame, snap
+
+#################################################################################################
+# Multi-site comparison
+#
+# Pinned sites are scored through a process-wide result cache keyed like the coalescer
+# (quantized coordinates + data version), so pinning a site scores only that site and
+# sites pinned by several analysts are scored once. A site whose scoring fails gets empty
+# scores and the reason in "error", like a row of lihtc.batch, and is not cached, so the next
+# request tries it again.
+MAX_PINNED_SITES = 50
+
+SCORE_COLUMNS = list(engine.SCORERS) + ["total_score"]
+
+
+class ScoreCache:
+    """
+    Thread-safe LRU cache of site scores.
+
+    Args:
+        max_entries (int): Sites kept before the least recently used are dropped.
+    """
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            scores = self._entries.get(key)
+            if scores is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(scores)
+
+    def put(self, key, scores):
+        scores = {column: scores[column] for column in SCORE_COLUMNS}
+        with self._lock:
+            self._entries[key] = scores
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# One cache per server process, shared by the app's pages
+SCORE_CACHE = ScoreCache()
+
+
+def parse_sites(text):
+    """
+    Parse pasted sites, one per line as "lat, lon" or "lat, lon, label".
+
+    Returns:
+        (sites, errors): site dicts with lat, lon and label, and one message per bad line.
+    """
+    sites, errors = [], []
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = [part.strip() for part in line.replace("\t", ",").split(",")]
+        try:
+            lat, lon = float(parts[0]), float(parts[1])
+        except (IndexError, ValueError):
+            errors.append(f"Line {number}: expected \"latitude, longitude[, label]\"")
+            continue
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            errors.append(f"Line {number}: coordinates out of range")
+            continue
+        label = ",".join(parts[2:]).strip() or f"{lat:.6f}, {lon:.6f}"
+        sites.append({"lat": lat, "lon": lon, "label": label})
+    return sites, errors
+
+
+def score_sites(sites, cache, coalescer=None):
+    """
+    Score sites in one batch, computing only those missing from the cache.
+
+    Args:
+        sites (list): Dicts with lat and lon.
+        cache (ScoreCache): Shared result cache.
+        coalescer (Coalescer): Optional; shares computations with concurrent callers.
+
+    Returns:
+        (results, computed): one dict of the score columns and "error" (None, or why the
+        site could not be scored) per site in order, and how many were computed.
+    """
+    version = engine.engine_data_version()
+    keys = [site_key(site["lat"], site["lon"], version) for site in sites]
+    results = [cache.get(key) for key in keys]
+    for scores in results:
+        if scores is not None:
+            scores["error"] = None
+
+    missing = [i for i, scores in enumerate(results) if scores is None]
+    if missing:
+        kwargs = engine.get_scorer_kwargs()
+        for i in missing:
+            lat, lon = sites[i]["lat"], sites[i]["lon"]
+            try:
+                if coalescer is not None:
+                    scores = coalescer.run(keys[i], engine.score_site, lat, lon, kwargs)
+                else:
+                    scores = engine.score_site(lat, lon, kwargs)
+            except Exception as e:
+                results[i] = dict(dict.fromkeys(SCORE_COLUMNS, np.nan), error=f"{type(e).__name__}: {e}")
+                continue
+            cache.put(keys[i], scores)
+            results[i] = dict({column: scores[column] for column in SCORE_COLUMNS}, error=None)
+    return results, len(missing)
+
+
+def predict_sites(model, frame, cache, deal=None, lat_col=None, lon_col=None, coalescer=None):
+    """
+    Score each site's location and predict its selection probability in one pass: the
+    location inputs of the model come from the site scores, the deal inputs from the
+    frame's columns where it has them and from deal otherwise.
+
+    Args:
+        model: Selection model (see lihtc.prediction).
+        frame (DataFrame): One site per row.
+        cache (ScoreCache): Shared result cache; only uncached sites are scored.
+        deal (dict): Default values of the deal inputs, keyed like FEATURES.
+        lat_col, lon_col (str): Coordinate columns (default: detected).
+        coalescer (Coalescer): Optional; shares computations with concurrent callers.
+
+    Returns:
+        (result, stats): frame with the score columns, "probability_of_selection" and
+        "error" appended (scores and probability are empty, and "error" says why, for rows
+        without valid coordinates, whose scoring failed, or whose deal inputs are missing,
+        off-step or out of range), and rows, scored, errors,
+        computed, cached, seconds and rows_per_second.
+    """
+    start = time.perf_counter()
+    lat_col = lat_col or find_column(frame.columns, LAT_COLUMNS, "lat")
+    lon_col = lon_col or find_column(frame.columns, LON_COLUMNS, "lon")
+    latitudes = pd.to_numeric(frame[lat_col], errors="coerce")
+    longitudes = pd.to_numeric(frame[lon_col], errors="coerce")
+    valid = (latitudes.notna() & longitudes.notna()).to_numpy()
+
+    sites = [{"lat": lat, "lon": lon} for lat, lon in zip(latitudes[valid], longitudes[valid])]
+    results, computed = score_sites(sites, cache, coalescer)
+    scores = pd.DataFrame(np.nan, index=frame.index, columns=SCORE_COLUMNS)
+    errors = pd.Series("missing or non-numeric coordinates", index=frame.index, dtype="string")
+    if results:
+        results = pd.DataFrame(results, columns=SCORE_COLUMNS + ["error"])
+        scores.loc[valid] = results[SCORE_COLUMNS].to_numpy(dtype=float)
+        errors[valid] = results["error"].astype("string").to_numpy()
+
+    mapping, _ = feature_columns(frame.columns, model)
+    inputs = pd.DataFrame(index=frame.index)
+    for key, spec in FEATURES.items():
+        if key in LOCATION_SCORE_KEYS:
+            # Engine scores are snapped to the form's steps; values from the CSV are checked
+            inputs[spec["label"]] = snap(key, scores[LOCATION_SCORE_KEYS[key]].to_numpy())
+        elif key in mapping:
+            inputs[spec["label"]] = frame[mapping[key]]
+        else:
+            inputs[spec["label"]] = (deal or {}).get(key, 0.0)
+    predicted, _ = predict_frame(model, inputs)
+
+    result = pd.concat([frame, scores], axis=1)
+    result["probability_of_selection"] = predicted["probability_of_selection"].to_numpy()
+    # A scoring failure explains the row before any input it left empty
+    result["error"] = errors.fillna(predicted["error"])
+    seconds = time.perf_counter() - start
+    return result, {
+        "rows": len(frame),
+        "scored": int(result["probability_of_selection"].notna().sum()),
+        "errors": int(result["error"].notna().sum()),
+        "computed": computed,
+        "cached": len(sites) - computed,
+        "seconds": seconds,
+        "rows_per_second": len(frame) / seconds if seconds > 0 else float("inf"),
+    }
@@ -1,15 +1,25 @@
+import logging
+
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point
 import folium
-from folium import CircleMarker, GeoJson, GeoJsonTooltip, FeatureGroup, LayerControl
-from folium.plugins import MarkerCluster
+from folium import CircleMarker, GeoJson, GeoJsonPopup, GeoJsonTooltip, FeatureGroup, LayerControl
+from folium.plugins import HeatMap, MarkerCluster
 import branca.colormap as cm
 from branca.colormap import linear
+from branca.element import MacroElement
+from folium.template import Template
+from html import escape
+
+from map_layers.payload import DEFAULT_PRECISION, optimize_layer_payload
+
+logger = logging.getLogger(__name__)
 
 #################################################################################################
 # Build circle layer for lat/lon points - WITH max_points parameter for user control
-def add_lat_lon_score_layer(gdf, layer_name, score_column="score", palette=None, radius=3, max_points=800):
+def add_lat_lon_score_layer(gdf, layer_name, score_column="score", palette=None, radius=3, max_points=800, value_range=None, overlay=False):
     """
     Args:
         gdf (GeoDataFrame): Must contain geometry and a numeric score column.
@@ -18,6 +28,9 @@ def add_lat_lon_score_layer(gdf, layer_name, score_column="score", palette=None,
         palette (list): List of hex colours (e.g., YlGnBu_20).
         radius (int): Circle radius in pixels.
         max_points (int): Maximum points to render (user controllable).
+        value_range (tuple): (vmin, vmax) for the colourmap; defaults to the range of the
+            points drawn. Pass the whole layer's range when drawing a subset of it.
+        overlay (bool): The layer is a viewport overlay (see optimize_layer_payload).
 
     Returns:
         A tuple: (FeatureGroup layer, colourmap)
@@ -35,32 +48,36 @@ def add_lat_lon_score_layer(gdf, layer_name, score_column="score", palette=None,
         valid_gdf = valid_gdf.sample(n=max_points, random_state=42)
 
     # Create colourmap using the score range and your custom palette
+    vmin, vmax = value_range or (valid_gdf[score_column].min(), valid_gdf[score_column].max())
     colourmap = cm.LinearColormap(
         colors=palette,
-        vmin=valid_gdf[score_column].min(),
-        vmax=valid_gdf[score_column].max(),
+        vmin=vmin,
+        vmax=vmax,
         caption=layer_name
     )
 
-    # Create a FeatureGroup to hold the markers
-    layer = folium.FeatureGroup(name=layer_name)
+    # Keep only the score and rounded coordinates in the embedded GeoJSON
+    valid_gdf[score_column] = valid_gdf[score_column].round(2)
+    slim_gdf = optimize_layer_payload(valid_gdf, [score_column], layer_name, overlay=overlay)
+
+    # Colour each distinct score once, then emit one GeoJSON per colour so the
+    # marker style is shared by its points instead of repeated for every marker
+    colours = slim_gdf[score_column].map({score: colourmap(score) for score in slim_gdf[score_column].unique()})
 
-    # Add each point as a circle marker 
-    for _, row in valid_gdf.iterrows():
-        lat = row.geometry.y
-        lon = row.geometry.x
-        score = row[score_column]
-        colour = colourmap(score)
-
-        CircleMarker(
-            location=[lat, lon],
-            radius=radius,
-            color=colour,
-            weight=0.1,
-            fill=True,
-            fill_color=colour,
-            fill_opacity=0.4,
-            popup=f"{score_column.title()}: {score:.2f}"
+    layer = folium.FeatureGroup(name=layer_name)
+    for colour, group in slim_gdf.groupby(colours, sort=False):
+        GeoJson(
+            group.to_geo_dict(drop_id=True),
+            marker=CircleMarker(
+                radius=radius,
+                color=colour,
+                weight=0.1,
+                fill=True,
+                fill_color=colour,
+                fill_opacity=0.4
+            ),
+            popup=GeoJsonPopup(fields=[score_column], aliases=[score_column.title()]),
+            control=False
         ).add_to(layer)
 
     return layer, colourmap
@@ -84,19 +101,14 @@ def add_tract_score_layer_stable(folium_map, gdf, score_column, layer_name, colo
     # Ensure CRS is EPSG:4326 for folium compatibility
     gdf = gdf.to_crs("EPSG:4326")
     gdf[score_column] = pd.to_numeric(gdf[score_column], errors="coerce")
-    print(gdf[score_column].head())
+    logger.debug("%s: first values of %s: %s", layer_name, score_column, gdf[score_column].head().tolist())
     
     # Get colour scale
     vals = gdf[score_column].dropna()
     if vals.empty:
-        print(f"No valid numeric values for '{score_column}' — skipping layer: {layer_name}")
-        return
-
-    # Check if there are any valid numeric values
-    if len(vals) == 0:
-        print(f"No valid numeric values for '{score_column}' — skipping layer: {layer_name}")
+        logger.warning("No valid numeric values for '%s' — skipping layer: %s", score_column, layer_name)
         return
-    print("Unique geometry types →", gdf.geom_type.unique())
+    logger.debug("%s: geometry types %s", layer_name, list(gdf.geom_type.unique()))
 
     # Simplify geometries for better performance
     if simplify_tolerance > 0:
@@ -106,15 +118,18 @@ def add_tract_score_layer_stable(folium_map, gdf, score_column, layer_name, colo
     
     # Check if we still have data after filtering
     if gdf.empty:
-        print(f"No valid geometries after simplification for layer: {layer_name}")
+        logger.warning("No valid geometries after simplification for layer: %s", layer_name)
         return
 
     cmap = getattr(linear, colour_scheme).scale(vals.min(), vals.max())
     cmap.caption = layer_name
 
+    # Keep only the tooltip/style fields and rounded coordinates in the embedded GeoJSON
+    gdf = optimize_layer_payload(gdf, ["GEOID", score_column], layer_name)
+
     # Add GeoJSON layer
     folium.GeoJson(
-        gdf,
+        gdf.to_geo_dict(drop_id=True),
         name=layer_name,
         style_function=lambda feature: {
             "fillColor": cmap(feature["properties"][score_column]) if feature["properties"][score_column] is not None else "#d3d3d3",
@@ -133,10 +148,196 @@ def add_tract_score_layer_stable(folium_map, gdf, score_column, layer_name, colo
     # Add legend
     cmap.add_to(folium_map)
 
+##################################################################################################
+# Build heat map layer from points or polygon centroids (grid scores and tract indicators)
+def compute_heat_data(gdf, score_column, precision=DEFAULT_PRECISION):
+    """
+    Vectorized heatmap input: one [lat, lon, intensity] row per feature, with the
+    score min-max normalized to 0-1. Polygons are reduced to centroids computed in a
+    projected CRS. The input GeoDataFrame is not modified.
+
+    Args:
+        gdf: GeoDataFrame with point or polygon geometry and a score column
+        score_column: name of the column to use for heat values
+        precision: decimal places kept in coordinates
+
+    Returns:
+        A tuple: (heat_data array of shape (n, 3), min score, max score),
+        or None if there are no valid scores
+    """
+
+    scores = pd.to_numeric(gdf[score_column], errors="coerce")
+    valid = scores.notna() & gdf.geometry.notna() & ~gdf.geometry.is_empty
+    if not valid.any():
+        return None
+
+    geometry = gdf.geometry[valid]
+    if gdf.crs is not None and gdf.crs != "EPSG:4326":
+        geometry = geometry.to_crs("EPSG:4326")
+    if not (geometry.geom_type == "Point").all():
+        geometry = geometry.to_crs("EPSG:3857").centroid.to_crs("EPSG:4326")
+
+    values = scores[valid].to_numpy(dtype=float)
+    vmin, vmax = values.min(), values.max()
+    if vmax == vmin:
+        # Handle case where all scores are identical
+        intensity = np.full(len(values), 0.5)
+    else:
+        intensity = (values - vmin) / (vmax - vmin)
+
+    heat_data = np.column_stack([
+        geometry.y.to_numpy().round(precision),
+        geometry.x.to_numpy().round(precision),
+        intensity.round(3)
+    ])
+    return heat_data, vmin, vmax
+
+
+def add_heatmap_layer(folium_map, heat_data, vmin, vmax, layer_name, gradient, radius=25, blur=15):
+    """
+    Adds a smoothed heatmap layer and a matching colourmap legend to a Folium map.
+
+    Args:
+        folium_map: folium.Map object
+        heat_data: array of [lat, lon, intensity] rows from compute_heat_data
+        vmin, vmax: score range the intensities were normalized from (for the legend)
+        layer_name: name of the layer shown in the layer control
+        gradient: dict mapping intensity stops (0-1) to colours (see colours.heatmap_gradients)
+        radius: radius of each heat point in pixels (default: 25)
+        blur: blur factor for smoothing effect (default: 15)
+    """
+
+    HeatMap(
+        heat_data.tolist(),
+        name=layer_name,
+        radius=radius,
+        blur=blur,
+        gradient=gradient,
+        min_opacity=0.3,
+        max_zoom=18
+    ).add_to(folium_map)
+
+    # Legend in the same style as the other score layers
+    if vmax > vmin:
+        stops = sorted(gradient)
+        cm.LinearColormap(
+            colors=[gradient[stop] for stop in stops],
+            index=[vmin + stop * (vmax - vmin) for stop in stops],
+            vmin=vmin,
+            vmax=vmax,
+            caption=layer_name
+        ).add_to(folium_map)
+
 #----------------------------------------------------------------------------#
 
 ##################################################################################################
 # Add point layers (applicants)
+APPLICANT_TOOLTIP_FIELDS = {
+    "development_name": "Development",
+    "ownership_entity_name": "Owner",
+    "year": "Year",
+    "status": "Status",
+    "activity_type": "Activity",
+    "dca_score": "DCA Score",
+}
+
+APPLICANT_FILTER_LABELS = {
+    "year": "Year",
+    "geographic_pool": "Pool",
+    "status": "Status",
+    "activity_type": "Activity",
+}
+
+
+class ApplicantFilterControl(MacroElement):
+    """
+    Leaflet control with one checkbox per value of each filter field. Unticking a
+    value hides the matching markers in the browser, without a Streamlit rerun or
+    a map rebuild.
+
+    Args:
+        layer: the FeatureGroup holding the marker GeoJSON layers
+        filters: dict mapping field name -> list of values present in the data
+    """
+
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function() {
+            var fields = {{ this.filters.keys() | list | tojson }};
+            var markers = [];
+            function collect(layer, parent) {
+                if (layer.feature) {
+                    markers.push({layer: layer, parent: parent});
+                } else if (layer.eachLayer) {
+                    layer.eachLayer(function(child) { collect(child, layer); });
+                }
+            }
+            collect({{ this.layer.get_name() }}, null);
+
+            var control = L.control({position: "topright"});
+            control.onAdd = function() {
+                var div = L.DomUtil.create("div", "leaflet-bar");
+                div.style.background = "white";
+                div.style.padding = "6px 8px";
+                div.style.fontSize = "12px";
+                div.style.maxHeight = "320px";
+                div.style.overflowY = "auto";
+                div.innerHTML = {{ this.html | tojson }};
+                L.DomEvent.disableClickPropagation(div);
+                L.DomEvent.disableScrollPropagation(div);
+                div.addEventListener("change", function() {
+                    var selected = {};
+                    fields.forEach(function(field) {
+                        selected[field] = new Set(Array.from(
+                            div.querySelectorAll('input[data-field="' + field + '"]:checked')
+                        ).map(function(input) { return input.value; }));
+                    });
+                    markers.forEach(function(marker) {
+                        var props = marker.layer.feature.properties;
+                        var show = fields.every(function(field) {
+                            return selected[field].has(String(props[field]));
+                        });
+                        if (show && !marker.parent.hasLayer(marker.layer)) {
+                            marker.parent.addLayer(marker.layer);
+                        } else if (!show && marker.parent.hasLayer(marker.layer)) {
+                            marker.parent.removeLayer(marker.layer);
+                        }
+                    });
+                });
+                return div;
+            };
+            control.addTo({{ this._parent.get_name() }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, layer, filters):
+        super().__init__()
+        self._name = "ApplicantFilterControl"
+        self.layer = layer
+        self.filters = filters
+
+        sections = []
+        for field, values in filters.items():
+            boxes = "".join(
+                f'<label style="display: block; margin: 0;">'
+                f'<input type="checkbox" data-field="{field}" value="{escape(_js_string(value))}" checked> '
+                f'{escape(str(value)) if value is not None else "Unspecified"}</label>'
+                for value in values
+            )
+            sections.append(f"<b>{escape(APPLICANT_FILTER_LABELS.get(field, field))}</b>{boxes}")
+        self.html = "<br>".join(sections)
+
+
+def _js_string(value):
+    """The String() of a JSON property value as the browser sees it."""
+    if value is None:
+        return "null"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
 def add_coloured_markers_to_map(
     folium_map,
     gdf,
@@ -147,18 +348,20 @@ def add_coloured_markers_to_map(
     layer_name="Markers",
     clustered=False, 
     categorical_colours=None,
+    filter_fields=None,
 ):
     """
     Args:
-        folium_map: folium.Map object
+        folium_map: folium.Map object (or a viewport FeatureGroup overlay, drawn without the filter control)
         gdf: GeoDataFrame or DataFrame
         lat_col: column for latitude
         lon_col: column for longitude
         colour_by: column with categorical values to colour by
-        popup_fields: list of columns to include in popup
+        popup_fields: dict of column -> label for the tooltip (default: APPLICANT_TOOLTIP_FIELDS)
         layer_name: name of the feature group
         clustered: whether to use MarkerCluster 
         categorical_colours: dict mapping category to colour (optional)
+        filter_fields: columns to filter by in the browser (adds an ApplicantFilterControl)
     """
 
     feature_group = folium.FeatureGroup(name=layer_name)
@@ -175,42 +378,84 @@ def add_coloured_markers_to_map(
             for i, val in enumerate(sorted(unique_vals))
         }
 
-    for _, row in gdf.iterrows():
-        lat = row[lat_col]
-        lon = row[lon_col]
-
-        if pd.isnull(lat) or pd.isnull(lon):
-            continue  
-
-        colour = "red"
-        if colour_by:
-            value = row.get(colour_by)
-            colour = categorical_colours.get(value, "red")
-
-        year = row.get("year", "")
-        dev_name = row.get("development_name", "")
-        owner_name = row.get("ownership_entity_name", "")
-        status = row.get("status", "Unknown")
-        dca_score = row.get("dca_score", "")
-
-        tooltip_text = (
-            f"<b>{dev_name}</b><br>"
-            f"Owner: {owner_name}<br>"
-            f"Year: {year}<br>"
-            f"Status: {status}<br>"
-            f"DCA Score: {dca_score}"
-        )
-
-        folium.CircleMarker(
-            location=(lat, lon),
-            radius=2,
-            color='black',
-            fill=True,
-            fill_color=colour,
-            fill_opacity=1,
-            weight=0.8,
-            tooltip=folium.Tooltip(tooltip_text, sticky=True)  
+    tooltip_fields = {
+        col: label for col, label in (popup_fields or APPLICANT_TOOLTIP_FIELDS).items() if col in gdf.columns
+    }
+    filter_fields = [col for col in (filter_fields or []) if col in gdf.columns]
+
+    # Point geometry from the lat/lon columns, dropping rows without coordinates
+    points = gdf[gdf[lat_col].notnull() & gdf[lon_col].notnull()]
+    points = gpd.GeoDataFrame(
+        points.drop(columns="geometry", errors="ignore"),
+        geometry=gpd.points_from_xy(points[lon_col], points[lat_col]),
+        crs="EPSG:4326"
+    )
+    keep = list(tooltip_fields) + filter_fields + ([colour_by] if colour_by else [])
+    points = optimize_layer_payload(points, keep, layer_name, overlay=not isinstance(folium_map, folium.Map))
+
+    # Colour every marker at once, then emit one GeoJSON per colour
+    if colour_by:
+        colours = points[colour_by].map(categorical_colours).fillna("red")
+    else:
+        colours = pd.Series("red", index=points.index)
+
+    for colour, group in points.groupby(colours, sort=False):
+        GeoJson(
+            group.to_geo_dict(drop_id=True),
+            marker=CircleMarker(
+                radius=2,
+                color="black",
+                fill=True,
+                fill_color=colour,
+                fill_opacity=1,
+                weight=0.8
+            ),
+            tooltip=GeoJsonTooltip(
+                fields=list(tooltip_fields),
+                aliases=[f"{label}:" for label in tooltip_fields.values()],
+                sticky=True
+            ),
+            control=False
         ).add_to(marker_layer)
 
     marker_layer.add_to(feature_group)
     feature_group.add_to(folium_map)
+
+    # The control needs a map to sit on; overlay feature groups are drawn unfiltered
+    if filter_fields and isinstance(folium_map, folium.Map):
+        filters = {
+            field: sorted(points[field].dropna().unique().tolist()) + ([None] if points[field].isnull().any() else [])
+            for field in filter_fields
+        }
+        ApplicantFilterControl(feature_group, filters).add_to(folium_map)
+
+##################################################################################################
+# Site overlay (user sites drawn on top of a cached base map)
+def build_site_overlay(sites, layer_name="Sites"):
+    """
+    Builds the per-session overlay passed to st_folium's feature_group_to_add, so the
+    cached base map is never modified and only this small group is sent on change.
+
+    Args:
+        sites: list of dicts with "lat" and "lon", and optional "label" (tooltip),
+               "popup" text, "icon" (Font Awesome name) and "icon_colour"
+        layer_name: name of the feature group
+
+    Returns:
+        folium.FeatureGroup with one marker per site (a gold star by default)
+    """
+
+    overlay = folium.FeatureGroup(name=layer_name)
+    for site in sites:
+        folium.Marker(
+            [site["lat"], site["lon"]],
+            tooltip=site.get("label", "Your Site"),
+            popup=site.get("popup"),
+            icon=folium.Icon(
+                color="white",
+                icon_color=site.get("icon_colour", "#B8860B"),
+                icon=site.get("icon", "fa-star"),
+                prefix="fa"
+            )
+        ).add_to(overlay)
+    return overlay
@@ -8,4 +8,39 @@ YlGnBu_5 = ['#ffffd9', '#d9efb2', '#94d6a8', '#2ba5b4', '#0d0575']
 status_colours = {
     "Select": "#7CFC00",
     "Non-select": "red"
-}
\ No newline at end of file
+}
+
+# Heatmap gradients (intensity stop -> colour), keyed by preset name
+heatmap_gradients = {
+    "default": {
+        0.0: "blue",
+        0.2: "cyan",
+        0.4: "lime",
+        0.6: "yellow",
+        0.8: "orange",
+        1.0: "red"
+    },
+    "stable_communities": {
+        0.0: "red",      # Poor stability
+        0.5: "yellow",   # Moderate stability
+        1.0: "green"     # High stability
+    },
+    "environmental_health": {
+        0.0: "purple",   # Poor environmental health
+        0.3: "blue",
+        0.6: "cyan",
+        1.0: "white"     # Excellent environmental health
+    },
+    "income": {
+        0.0: "darkred",  # Low income
+        0.25: "red",
+        0.5: "orange",
+        0.75: "yellow",
+        1.0: "green"     # High income
+    },
+    "poverty": {
+        0.0: "green",    # Low poverty (good)
+        0.5: "yellow",
+        1.0: "red"       # High poverty (concerning)
+    }
+}
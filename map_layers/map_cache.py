@@ -0,0 +1,146 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+#################################################################################################
+# Process-wide cache of rendered maps, shared by every Streamlit session
+DEFAULT_MAX_BYTES = int(float(os.environ.get("LIHTC_MAP_CACHE_MB", "256")) * 1024 * 1024)
+
+
+def data_version(paths):
+    """
+    Args:
+        paths (iterable): Data files a map is built from.
+
+    Returns:
+        A short hash of the paths, sizes and modification times, so cached maps
+        go stale as soon as any source file changes on disk.
+    """
+    digest = hashlib.sha1()
+    for path in sorted(str(p) for p in paths):
+        try:
+            stat = Path(path).stat()
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            digest.update(f"{path}:missing".encode())
+    return digest.hexdigest()[:12]
+
+
+class RenderedMapCache:
+    """
+    LRU cache of rendered maps bounded by a byte budget.
+
+    Entries are maps rendered once to the component arguments st_folium sends
+    (map_layers.map_render.RenderedMap), each charged its nbytes. Least recently used maps are
+    evicted once the budget is exceeded, and a map larger than the whole budget is returned
+    without being cached.
+
+    Args:
+        max_bytes (int): Memory budget for all cached maps (default: LIHTC_MAP_CACHE_MB, 256 MB).
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def lock(self, key):
+        """Per-key lock; held while a map is built, and dropped again unless the map is stored."""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.RLock())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, rendered):
+        nbytes = rendered.nbytes
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                self.rejected += 1
+                self._key_locks.pop(key, None)
+                return rendered
+            self._entries[key] = (rendered, nbytes)
+            self.current_bytes += nbytes
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted_key, None)
+                self.current_bytes -= evicted_bytes
+                self.evictions += 1
+        return rendered
+
+    def get_or_build(self, key, build):
+        """
+        Return the rendered map for key, calling build() on a miss. Concurrent sessions
+        asking for the same key wait for the first build instead of repeating it.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        with self.lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+            try:
+                return self.put(key, build())
+            finally:
+                # A build that failed or was refused leaves nothing to guard
+                with self._lock:
+                    if key not in self._entries:
+                        self._key_locks.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._key_locks.clear()
+            self.current_bytes = 0
+
+    def entries(self):
+        """(key, bytes) of every cached map, least recently used first."""
+        with self._lock:
+            return [(key, nbytes) for key, (_, nbytes) in self._entries.items()]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+# One cache per server process, shared by every session and page
+MAP_CACHE = RenderedMapCache()
@@ -0,0 +1,170 @@
+import logging
+import threading
+
+import folium
+import streamlit as st
+from branca.colormap import ColorMap
+from folium.elements import JSCSSMixin
+from streamlit_folium import st_folium
+
+from lihtc.timing import span
+
+logger = logging.getLogger(__name__)
+
+try:
+    from streamlit_folium import (
+        _component_func,
+        _get_feature_group_string,
+        _get_header,
+        _get_html,
+        _get_map_string,
+        generate_js_hash,
+        get_full_id,
+    )
+except ImportError as e:
+    _component_func = None
+    logger.warning("streamlit_folium internals unavailable (%s); maps are rendered by st_folium on every run", e)
+
+#################################################################################################
+# Maps rendered once and shared by every session
+#
+# st_folium renders the whole map to HTML and JavaScript on every call, and does so by
+# rewriting the element ids of the map it is given, so a map shared between sessions costs a
+# full render per rerun and can only be rendered under a lock. RenderedMap does that work once,
+# when the map is cached, and keeps only the strings the st_folium component needs;
+# st_rendered_map() sends them with the session's overlays, which are rendered against a
+# throwaway map. The streamlit_folium helpers are the ones st_folium itself calls; they are
+# private, so requirements.txt pins the streamlit-folium release they were read from, and if
+# another release lacks them RenderedMap keeps the map and st_rendered_map() falls back to
+# st_folium under a lock.
+
+# Values st_folium returns before the browser reports anything
+RETURNED_DEFAULTS = [
+    "last_clicked", "last_object_clicked", "last_object_clicked_count", "last_object_clicked_tooltip",
+    "last_object_clicked_popup", "all_drawings", "last_active_drawing", "last_circle_radius",
+    "last_circle_polygon", "selected_layers", "selected_tags", "last_geocoder_result",
+]
+
+
+def asset_links(folium_map):
+    """(css_links, js_links) every element of the map needs, in st_folium's order."""
+    css_links, js_links = [], []
+
+    def walk(element):
+        if isinstance(element, ColorMap):
+            js_links.insert(0, "https://cdnjs.cloudflare.com/ajax/libs/d3/3.5.5/d3.min.js")
+            js_links.insert(0, "https://d3js.org/d3.v4.min.js")
+        if isinstance(element, (ColorMap, JSCSSMixin)):
+            css_links.extend(href for _, href in getattr(element, "default_css", []))
+            js_links.extend(src for _, src in getattr(element, "default_js", []))
+        for child in getattr(element, "_children", {}).values():
+            walk(child)
+
+    walk(folium_map)
+    return list(dict.fromkeys(css_links)), list(dict.fromkeys(js_links))
+
+
+class RenderedMap:
+    """
+    The st_folium component arguments of one folium map. Holds strings only, so it can be
+    shared between sessions without locking; nbytes is what the map costs to keep and send.
+    Without the streamlit_folium internals it holds the map itself (folium_map) instead.
+
+    Args:
+        folium_map (folium.Map): Map to render. Rendering renames its elements, so the map
+            should not be rendered again afterwards.
+    """
+
+    def __init__(self, folium_map):
+        self.folium_map = None
+        if _component_func is None:
+            self.folium_map = folium_map
+            self._lock = threading.Lock()
+            with span("render_html"):
+                self.nbytes = len(folium_map.get_root().render().encode("utf-8"))
+            return
+        with span("render_html"):
+            folium_map.get_root().render()
+            self.html = _get_html(folium_map)
+            self.header = _get_header(folium_map)
+            self.script = _get_map_string(folium_map)
+        self.map_id = get_full_id(folium_map)
+        try:
+            self.bounds = folium_map.get_bounds()
+        except AttributeError:
+            self.bounds = [[None, None], [None, None]]
+        self.zoom = folium_map.options.get("zoom")
+        self.css_links, self.js_links = asset_links(folium_map)
+        self.nbytes = sum(len(text.encode("utf-8")) for text in [self.html, self.header, self.script])
+        self._component_keys = {}
+
+    def component_key(self, key):
+        # The component is keyed by a hash of the whole script; compute it once per widget key
+        if key not in self._component_keys:
+            self._component_keys[key] = generate_js_hash(self.script, key, False)
+        return self._component_keys[key]
+
+    def defaults(self, returned_objects):
+        (south, west), (north, east) = self.bounds
+        values = dict.fromkeys(RETURNED_DEFAULTS)
+        values["bounds"] = {"_southWest": {"lat": south, "lng": west}, "_northEast": {"lat": north, "lng": east}}
+        values["zoom"] = self.zoom
+        return {name: value for name, value in values.items() if name in returned_objects}
+
+
+def overlay_script(overlays):
+    """JavaScript adding the overlay feature groups to the shown map, as st_folium writes it."""
+    stand_in = folium.Map(tiles=None)
+    return "".join(
+        _get_feature_group_string(overlay, map=stand_in, idx=idx) for idx, overlay in enumerate(overlays)
+    )
+
+
+def st_rendered_map(rendered, overlays=None, key=None, width=700, height=600, returned_objects=()):
+    """
+    st_folium for a RenderedMap: the stored map plus this session's overlays.
+
+    Args:
+        rendered (RenderedMap): Shared base map.
+        overlays (list): folium.FeatureGroup overlays for this session only.
+        key (str): Widget key; the last returned value is kept in st.session_state[key].
+        returned_objects (iterable): Values the browser reports back (e.g. "bounds", "zoom").
+
+    Returns:
+        dict of the returned_objects, as st_folium returns them.
+    """
+    returned_objects = list(returned_objects)
+    if rendered.folium_map is not None:
+        # st_folium renames the elements of the map it renders, so one session at a time
+        with rendered._lock:
+            return st_folium(
+                rendered.folium_map, key=key, width=width, height=height,
+                returned_objects=returned_objects, feature_group_to_add=overlays
+            )
+    component_key = rendered.component_key(key)
+
+    def on_change():
+        if key is not None:
+            st.session_state[key] = st.session_state.get(component_key, {})
+
+    return _component_func(
+        script=rendered.script,
+        header=rendered.header,
+        html=rendered.html,
+        id=rendered.map_id,
+        key=component_key,
+        height=height,
+        width=width,
+        returned_objects=returned_objects,
+        default=rendered.defaults(returned_objects),
+        zoom=None,
+        center=None,
+        feature_group=overlay_script(overlays) if overlays is not None else None,
+        return_on_hover=False,
+        layer_control=None,
+        pixelated=False,
+        css_links=rendered.css_links,
+        js_links=rendered.js_links,
+        on_change=on_change,
+        wrap_longitude=False,
+    )
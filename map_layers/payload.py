@@ -0,0 +1,76 @@
+import json
+import os
+
+import numpy as np
+import shapely
+
+#################################################################################################
+# GeoJSON payload optimization for layers embedded in the map HTML
+#
+# 5 decimal places is ~1.1 m at Georgia's latitude, well below what a metro-scale map can show.
+DEFAULT_PRECISION = int(os.environ.get("LIHTC_COORD_PRECISION", "5"))
+
+# layer name -> {"features", "bytes_before", "bytes_after"} for the most recent base map
+# build. Viewport overlays are rebuilt on every rerun, so they are not measured unpruned:
+# they report under "<layer name> (viewport)" with bytes_before None.
+PAYLOAD_REPORT = {}
+
+OVERLAY_SUFFIX = " (viewport)"
+
+
+def geojson_bytes(geo_dict):
+    """Size in bytes of a GeoJSON dict as folium embeds it."""
+    return len(json.dumps(geo_dict).encode("utf-8"))
+
+
+def quantize_coordinates(gdf, precision=DEFAULT_PRECISION):
+    """
+    Args:
+        gdf (GeoDataFrame): Any geometry type.
+        precision (int): Decimal places to keep.
+
+    Returns:
+        A copy of gdf with every coordinate rounded to `precision` decimal places.
+    """
+    gdf = gdf.copy()
+    rounded = shapely.transform(gdf.geometry.to_numpy(), lambda coords: np.round(coords, precision))
+    gdf = gdf.set_geometry(rounded, crs=gdf.crs)
+    return gdf[~gdf.geometry.is_empty & gdf.geometry.notnull()]
+
+
+def optimize_layer_payload(gdf, properties, layer_name, precision=DEFAULT_PRECISION, overlay=False):
+    """
+    Prunes a layer to the properties its tooltip/popup and styling use and rounds its
+    coordinates, recording the embedded size before and after in PAYLOAD_REPORT.
+
+    Args:
+        gdf (GeoDataFrame): Layer data as loaded.
+        properties (list): Columns used by tooltips, popups or styling.
+        layer_name (str): Key for PAYLOAD_REPORT.
+        precision (int): Decimal places kept in coordinates.
+        overlay (bool): gdf is a viewport overlay's points; only the pruned size is
+            recorded, under layer_name + OVERLAY_SUFFIX.
+
+    Returns:
+        GeoDataFrame with only `properties` and geometry; serialize it with
+        to_geo_dict(drop_id=True) so the row index is not embedded either.
+    """
+    bytes_before = None if overlay else geojson_bytes(gdf.to_geo_dict())
+
+    keep = [col for col in dict.fromkeys(properties) if col in gdf.columns]
+    slim_gdf = quantize_coordinates(gdf[keep + [gdf.geometry.name]], precision)
+
+    PAYLOAD_REPORT[layer_name + OVERLAY_SUFFIX if overlay else layer_name] = {
+        "features": len(slim_gdf),
+        "bytes_before": bytes_before,
+        "bytes_after": geojson_bytes(slim_gdf.to_geo_dict(drop_id=True)),
+    }
+    return slim_gdf
+
+
+def payload_report():
+    """Per-layer payload sizes from the most recent builds, with the saved fraction (None for overlays)."""
+    return {
+        layer_name: dict(stats, saved=1 - stats["bytes_after"] / stats["bytes_before"] if stats["bytes_before"] else None)
+        for layer_name, stats in PAYLOAD_REPORT.items()
+    }
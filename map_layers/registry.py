@@ -0,0 +1,392 @@
+import branca.colormap as cm
+import folium
+import geopandas as gpd
+import pandas as pd
+
+from lihtc.memory import LAYER_CACHE_MB, SizedCache
+from lihtc.prediction import deal_key, predict_surface
+from lihtc.timing import span
+from lihtc.trees import TREES_PATH, load_trees
+
+from map_layers.build_layers import (
+    add_coloured_markers_to_map,
+    add_heatmap_layer,
+    add_lat_lon_score_layer,
+    add_tract_score_layer_stable,
+    compute_heat_data
+)
+from map_layers.colours import YlGnBu_20, YlGnBu_5, heatmap_gradients, status_colours
+from map_layers.map_cache import data_version
+
+MAP_CENTER = [33.886297, -84.362697]
+MAP_ZOOM = 9
+HOUSING_NEEDS_SOURCE = "data/maps/housing_need_characteristics/housing_need_indicators_metro_atl.geojson"
+MAP_STYLES = ["Standard", "Heatmap"]
+
+# Heat point sizes: grid points are ~1 km apart, tract centroids several km
+GRID_HEATMAP = {"radius": 12, "blur": 10}
+TRACT_HEATMAP = {"radius": 30, "blur": 20}
+
+# (layer name, source data version) -> compute_heat_data result
+HEAT_DATA_CACHE = SizedCache("Heatmap data", int(LAYER_CACHE_MB * 1024 ** 2))
+
+# Selection model inputs read from the score grids (prediction feature -> grid layer)
+SELECTION_GRID_LAYERS = {
+    "desirable_undesirable": "Desirable/Undesirable Activities Score",
+    "community_transportation": "Community Transportation Score",
+}
+
+# (deal_key, data version) -> selection probability grid, least recently used first.
+# Every deal structure analysts try gets its own surface, so only the latest few are kept,
+# within LIHTC_LAYER_CACHE_MB.
+SELECTION_SURFACE_CACHE_SIZE = 16
+SELECTION_SURFACE_CACHE = SizedCache("Selection surfaces", int(LAYER_CACHE_MB * 1024 ** 2), SELECTION_SURFACE_CACHE_SIZE)
+
+#################################################################################################
+# Layer builders - every builder takes (folium_map, gdf, layer_name, spec, max_points)
+# (folium_map may also be a FeatureGroup overlay; legends and controls are only added to maps)
+def build_point_layer(folium_map, gdf, layer_name, spec, max_points):
+    layer, legend = add_lat_lon_score_layer(
+        gdf, layer_name, spec["column"], spec["palette"], spec.get("radius", 4), max_points,
+        value_range=spec.get("value_range"), overlay=not isinstance(folium_map, folium.Map)
+    )
+    layer.add_to(folium_map)
+    if legend and isinstance(folium_map, folium.Map):
+        legend.add_to(folium_map)
+
+
+def build_tract_layer(folium_map, gdf, layer_name, spec, max_points):
+    add_tract_score_layer_stable(
+        folium_map, gdf, spec["column"], layer_name, colour_scheme=spec["palette"], simplify_tolerance=0.005
+    )
+
+
+def build_applicant_layer(folium_map, gdf, layer_name, spec, max_points):
+    add_coloured_markers_to_map(
+        folium_map=folium_map,
+        gdf=gdf,
+        lat_col="lat",
+        lon_col="lon",
+        colour_by=spec["column"],
+        layer_name=layer_name,
+        clustered=False,
+        categorical_colours=spec["palette"],
+        filter_fields=spec.get("filters")
+    )
+
+
+def build_heatmap_layer(folium_map, gdf, layer_name, spec, max_points):
+    key = (layer_name, data_version([spec["source"]]))
+    heat = HEAT_DATA_CACHE.get_or_build(key, lambda: compute_heat_data(gdf, spec["column"]))
+    if heat is None:
+        return
+    heat_data, vmin, vmax = heat
+    heatmap = spec["heatmap"]
+    add_heatmap_layer(
+        folium_map, heat_data, vmin, vmax, layer_name,
+        gradient=heatmap_gradients[heatmap["gradient"]],
+        radius=heatmap["radius"],
+        blur=heatmap["blur"]
+    )
+
+#################################################################################################
+# Derived layers - every surface function takes (load_layer, deal) and returns a GeoDataFrame
+def load_selection_surface(load_layer, deal=None):
+    """
+    Probability of selection at every grid point for one deal structure: the grid's
+    Desirable/Undesirable and Community Transportation scores plus the fixed deal inputs,
+    scored by the selection model in one call.
+    """
+    spec = LAYER_REGISTRY["Selection Probability"]
+    key = (deal_key(deal), data_version([spec["source"]] + spec["inputs"]))
+
+    def build():
+        grids = {feature: load_layer(layer_name) for feature, layer_name in SELECTION_GRID_LAYERS.items()}
+        surface = None
+        for feature, grid in grids.items():
+            grid = grid[["lat", "lon", "GEOID", "geometry", "score"]].rename(columns={"score": feature})
+            surface = grid if surface is None else surface.merge(grid.drop(columns=["GEOID", "geometry"]), on=["lat", "lon"])
+
+        probability = predict_surface(load_trees(), {feature: surface[feature].to_numpy() for feature in grids}, deal)
+        return surface.assign(probability=(probability * 100).round(1))
+
+    return SELECTION_SURFACE_CACHE.get_or_build(key, build)
+
+#################################################################################################
+# Layer registry
+#
+# Each layer declares:
+#   source    - GeoJSON file the layer is read from
+#   column    - property the layer is coloured by
+#   builder   - function that adds the layer to a folium map
+#   palette   - colour list, branca colour scheme name, or category -> colour dict
+#   groups    - map tabs offering the layer
+#   cache_key - build parameters that change the rendered layer (besides its source data)
+#   heatmap   - gradient preset and point size for the "Heatmap" map style (omit if unsupported)
+#   scale     - optional multiplier applied to the column when the data is loaded
+#   filters   - optional columns the browser can filter the layer by
+#   viewport  - optional; the layer's points can be loaded for the visible extent only
+#               (see map_layers/viewport.py). "thin" drops points closer than a few pixels
+#               apart when zoomed out, "legend" keeps the colour legend on the base map
+#   surface   - optional; the layer is computed by this function (see Derived layers) rather
+#               than read from source, and its cache key includes the deal structure
+#   inputs    - optional further files the layer depends on, for its data version
+#   value_range - optional fixed (min, max) for the colour scale
+LAYER_REGISTRY = {
+    "Total Score": {
+        "source": "data/maps/total_location_score/total_score_metro_atl.geojson",
+        "column": "score",
+        "builder": build_point_layer,
+        "palette": YlGnBu_20,
+        "groups": ("location",),
+        "cache_key": ("max_points", "display"),
+        "heatmap": dict(GRID_HEATMAP, gradient="default"),
+        "viewport": {"thin": True, "legend": True},
+    },
+    "Desirable/Undesirable Activities Score": {
+        "source": "data/maps/desirable_undesirable_activities/desirable_undesirable_score_metro_atl.geojson",
+        "column": "score",
+        "builder": build_point_layer,
+        "palette": YlGnBu_20,
+        "groups": ("location",),
+        "cache_key": ("max_points", "display"),
+        "heatmap": dict(GRID_HEATMAP, gradient="default"),
+        "viewport": {"thin": True, "legend": True},
+    },
+    "Community Transportation Score": {
+        "source": "data/maps/community_transportation_options/transportation_options_score_metro_atl.geojson",
+        "column": "score",
+        "builder": build_point_layer,
+        "palette": YlGnBu_5,
+        "groups": ("location",),
+        "cache_key": ("max_points", "display"),
+        "heatmap": dict(GRID_HEATMAP, gradient="default"),
+        "viewport": {"thin": True, "legend": True},
+    },
+    "Selection Probability": {
+        "source": "data/maps/desirable_undesirable_activities/desirable_undesirable_score_metro_atl.geojson",
+        "inputs": [
+            "data/maps/community_transportation_options/transportation_options_score_metro_atl.geojson",
+            TREES_PATH,
+        ],
+        "surface": load_selection_surface,
+        "column": "probability",
+        "builder": build_point_layer,
+        "palette": YlGnBu_20,
+        "groups": ("location",),
+        "cache_key": ("max_points", "deal"),
+        "value_range": (0, 100),
+    },
+    "Stable Communities Score": {
+        "source": "data/maps/stable_communities/stable_communities_score_metro_atl.geojson",
+        "column": "score",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("location", "stable"),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="stable_communities"),
+    },
+    "Quality Education Score": {
+        "source": "data/maps/quality_education_areas/education_score_metro_atl_point_with_scores.geojson",
+        "column": "score",
+        "builder": build_point_layer,
+        "palette": YlGnBu_5,
+        "groups": ("location",),
+        "cache_key": ("max_points", "display"),
+        "heatmap": dict(GRID_HEATMAP, gradient="default"),
+        "viewport": {"thin": True, "legend": True},
+    },
+    "Environmental Health Index": {
+        "source": "data/maps/stable_communities/environmental_health_index_metro_atl.geojson",
+        "column": "Environmental Health Index",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("stable",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="environmental_health"),
+    },
+    "Jobs Proximity Index": {
+        "source": "data/maps/stable_communities/jobs_proximity_index_metro_atl.geojson",
+        "column": "Jobs Proximity Index",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("stable",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="default"),
+    },
+    "Median Income": {
+        "source": "data/maps/stable_communities/median_income_metro_atl.geojson",
+        "column": "Median Income",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("stable",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="income"),
+    },
+    "Percent Population Above Poverty Level": {
+        "source": "data/maps/stable_communities/above_poverty_level_metro_atl.geojson",
+        "column": "Percent of Population Above the Poverty Level",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("stable",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="stable_communities"),
+    },
+    "Transit Access Index": {
+        "source": "data/maps/stable_communities/transit_access_index_metro_atl.geojson",
+        "column": "Transit Access Index",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("stable",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="default"),
+    },
+    "Severe Housing Problems (% of Renters ≤80% AMI)": {
+        "source": HOUSING_NEEDS_SOURCE,
+        "column": "% of rental units occupied by 80% AMI and below with Severe Housing Problems",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("housing",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="poverty"),
+        "scale": 100,
+    },
+    "YoY Population Growth (2018-2022)": {
+        "source": HOUSING_NEEDS_SOURCE,
+        "column": "avg_pop_yoy_growth_2018_2021",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("housing",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="default"),
+        "scale": 100,
+    },
+    "Employment Growth Rate (2020-2022)": {
+        "source": HOUSING_NEEDS_SOURCE,
+        "column": "avg_emp_growth_2020_2022",
+        "builder": build_tract_layer,
+        "palette": "YlGnBu_09",
+        "groups": ("housing",),
+        "cache_key": ("display",),
+        "heatmap": dict(TRACT_HEATMAP, gradient="default"),
+        "scale": 100,
+    },
+    "Past Applicant Locations": {
+        "source": "data/maps/application_list_2022_2023_2024_metro_atl.geojson",
+        "column": "status",
+        "builder": build_applicant_layer,
+        "palette": status_colours,
+        "groups": (),
+        "cache_key": (),
+        "filters": ["year", "geographic_pool", "status", "activity_type"],
+        "viewport": {"thin": False},
+    },
+}
+
+#################################################################################################
+# Registry helpers
+def layers_in_group(group):
+    """Layer names offered by a map tab, in registry order."""
+    return [name for name, spec in LAYER_REGISTRY.items() if group in spec["groups"]]
+
+
+def is_viewport_layer(layer_name, display="Standard", viewport=False):
+    """Whether the layer's points go in the viewport overlay rather than the base map."""
+    spec = LAYER_REGISTRY[layer_name]
+    if not viewport or "viewport" not in spec:
+        return False
+    return not (display == "Heatmap" and "heatmap" in spec)
+
+
+def layer_cache_key(layer_name, max_points=None, display="Standard", viewport=False, deal=None):
+    """
+    Args:
+        layer_name (str): Registered layer name.
+        max_points (int): Point budget for sampled layers.
+        display (str): Map style, one of MAP_STYLES.
+        viewport (bool): Whether viewport layers are left to the viewport overlay.
+        deal (dict): Deal structure inputs for surface layers.
+
+    Returns:
+        A tuple identifying the rendered layer: its name, the version of its source
+        file and the values of the build parameters the layer declares in cache_key.
+    """
+    spec = LAYER_REGISTRY[layer_name]
+    key = (layer_name, data_version([spec["source"]] + spec.get("inputs", [])))
+    if is_viewport_layer(layer_name, display, viewport):
+        return key + ("viewport",)
+    params = {"max_points": max_points, "display": display, "deal": deal_key(deal)}
+    return key + tuple(params[p] for p in spec["cache_key"])
+
+
+def map_cache_key(layer_names, max_points=None, display="Standard", viewport=False, deal=None):
+    """Cache key for a whole map; layer order does not matter."""
+    return tuple(sorted(layer_cache_key(name, max_points, display, viewport, deal) for name in layer_names))
+
+
+def layer_value_range(gdf, layer_name):
+    """(min, max) of the layer's column over the whole dataset."""
+    values = pd.to_numeric(gdf[LAYER_REGISTRY[layer_name]["column"]], errors="coerce")
+    return values.min(), values.max()
+
+
+def prepare_layer_data(gdf, layer_name):
+    """Reproject a raw layer to EPSG:4326 and apply the registry's column scaling."""
+    spec = LAYER_REGISTRY[layer_name]
+    if gdf.crs != "EPSG:4326":
+        gdf = gdf.to_crs("EPSG:4326")
+    gdf.columns = gdf.columns.str.strip()
+    if "scale" in spec and spec["column"] in gdf.columns:
+        gdf[spec["column"]] = (pd.to_numeric(gdf[spec["column"]], errors="coerce") * spec["scale"]).round(1)
+    return gdf
+
+
+def read_layer_data(layer_name):
+    """Read a registered layer straight from disk (no Streamlit caching)."""
+    return prepare_layer_data(gpd.read_file(LAYER_REGISTRY[layer_name]["source"]), layer_name)
+
+
+def build_map(layer_names, load_layer=read_layer_data, max_points=6000, display="Standard", warn=print, viewport=False, deal=None):
+    """
+    Build a folium map from registered layers.
+
+    Args:
+        layer_names (list): Registered layer names, drawn in order.
+        load_layer (callable): layer_name -> GeoDataFrame (e.g. a cached loader).
+        max_points (int): Point budget for sampled layers.
+        display (str): "Standard" (points/polygons) or "Heatmap"; layers without
+            heatmap support are always drawn in the standard style.
+        warn (callable): Called with a message when a layer's column is missing.
+        viewport (bool): Leave the points of viewport layers out (only their legend is
+            drawn); they are sent with map_layers.viewport.build_viewport_overlay instead.
+        deal (dict): Deal structure inputs for surface layers (see lihtc.prediction.deal_key).
+
+    Returns:
+        folium.Map
+    """
+    m = folium.Map(
+        location=MAP_CENTER,
+        zoom_start=MAP_ZOOM,
+        tiles="cartodbpositron",
+        prefer_canvas=True
+    )
+    for layer_name in layer_names:
+        spec = LAYER_REGISTRY[layer_name]
+        with span("load_layer", layer=layer_name):
+            gdf = spec["surface"](load_layer, deal) if "surface" in spec else load_layer(layer_name)
+        if gdf is None or gdf.empty:
+            continue
+        if spec["column"] not in gdf.columns:
+            warn(f"Field '{spec['column']}' not found in dataset.")
+            continue
+        if is_viewport_layer(layer_name, display, viewport):
+            if spec["viewport"].get("legend"):
+                vmin, vmax = layer_value_range(gdf, layer_name)
+                cm.LinearColormap(colors=spec["palette"], vmin=vmin, vmax=vmax, caption=layer_name).add_to(m)
+        elif display == "Heatmap" and "heatmap" in spec:
+            with span("build_layer", layer=layer_name, builder="build_heatmap_layer", rows=len(gdf)):
+                build_heatmap_layer(m, gdf, layer_name, spec, max_points)
+        else:
+            with span("build_layer", layer=layer_name, builder=spec["builder"].__name__, rows=len(gdf)):
+                spec["builder"](m, gdf, layer_name, spec, max_points)
+    return m
@@ -0,0 +1,133 @@
+import math
+import os
+import threading
+
+import folium
+import numpy as np
+import pandas as pd
+import shapely
+
+from map_layers.map_cache import data_version
+from map_layers.registry import LAYER_REGISTRY, MAP_CENTER, MAP_ZOOM, is_viewport_layer, layer_value_range, read_layer_data
+
+#################################################################################################
+# Viewport-driven point loading
+#
+# In viewport mode the base map carries only polygons and legends; the points of layers that
+# declare "viewport" in the registry are queried for the visible extent on every pan/zoom and
+# sent as a small st_folium overlay, so a grid of any size never goes to the browser whole.
+
+# Minimum on-screen spacing between points of a thinned layer, in pixels
+MIN_POINT_SPACING_PX = int(os.environ.get("LIHTC_VIEWPORT_SPACING_PX", "6"))
+
+# (layer name, source data version) -> STRtree over the layer's geometries. Shared by every
+# session, so built under a lock; only the current version of each layer is kept, as in
+# lihtc.engine.cached.
+SPATIAL_INDEXES = {}
+_SPATIAL_INDEXES_LOCK = threading.RLock()
+
+
+def parse_bounds(returned):
+    """
+    Args:
+        returned (dict): Value returned by st_folium with "bounds" in returned_objects.
+
+    Returns:
+        (min_lon, min_lat, max_lon, max_lat), or None before the map has reported its extent.
+    """
+    bounds = (returned or {}).get("bounds") or {}
+    south_west, north_east = bounds.get("_southWest") or {}, bounds.get("_northEast") or {}
+    extent = (south_west.get("lng"), south_west.get("lat"), north_east.get("lng"), north_east.get("lat"))
+    if any(value is None for value in extent):
+        return None
+    return extent
+
+
+def spatial_index(gdf, layer_name):
+    """STRtree over a layer's geometries, built once per version of its source file."""
+    key = (layer_name, data_version([LAYER_REGISTRY[layer_name]["source"]]))
+    with _SPATIAL_INDEXES_LOCK:
+        if key not in SPATIAL_INDEXES:
+            for stale_key in [k for k in SPATIAL_INDEXES if k[0] == layer_name]:
+                del SPATIAL_INDEXES[stale_key]
+            SPATIAL_INDEXES[key] = shapely.STRtree(gdf.geometry.to_numpy())
+        return SPATIAL_INDEXES[key]
+
+
+def visible_points(gdf, layer_name, extent):
+    """Rows of gdf whose geometry intersects the (min_lon, min_lat, max_lon, max_lat) extent."""
+    hits = spatial_index(gdf, layer_name).query(shapely.box(*extent), predicate="intersects")
+    return gdf.iloc[np.sort(hits)]
+
+
+def thin_points(gdf, zoom, spacing_px=MIN_POINT_SPACING_PX):
+    """
+    Keeps one point per screen cell of spacing_px pixels at this zoom level.
+
+    Cells are anchored to fixed coordinates rather than to the viewport, so panning
+    does not change which points are kept; once the grid is sparser than the cells
+    (zoomed in) every point survives.
+
+    Args:
+        gdf (GeoDataFrame): Point layer in EPSG:4326.
+        zoom (int): Leaflet zoom level.
+        spacing_px (int): Minimum spacing between kept points, in pixels.
+
+    Returns:
+        GeoDataFrame subset of gdf.
+    """
+    if gdf.empty:
+        return gdf
+
+    # Web Mercator: a 256 px tile spans 360 / 2**zoom degrees of longitude, and a
+    # degree of latitude is 1 / cos(lat) times longer on screen (taken at the map
+    # centre so the cells stay fixed while panning)
+    cell_lon = 360 / 2 ** zoom / 256 * spacing_px
+    cell_lat = cell_lon * math.cos(math.radians(MAP_CENTER[0]))
+
+    cells = pd.DataFrame({
+        "x": np.floor(gdf.geometry.x.to_numpy() / cell_lon),
+        "y": np.floor(gdf.geometry.y.to_numpy() / cell_lat)
+    })
+    return gdf[~cells.duplicated().to_numpy()]
+
+
+def build_viewport_overlay(layer_names, returned, load_layer=read_layer_data, max_points=6000,
+                           display="Standard", layer_name="Visible Points"):
+    """
+    Build the overlay of points visible in the current map view.
+
+    Args:
+        layer_names (list): Registered layer names selected for the map; only the
+            viewport layers among them are drawn.
+        returned (dict): Last value returned by st_folium (bounds and zoom), or None
+            before the first render, in which case the initial map view is used.
+        load_layer (callable): layer_name -> GeoDataFrame (e.g. a cached loader).
+        max_points (int): Point budget per layer after thinning.
+        display (str): Map style, one of MAP_STYLES.
+        layer_name (str): Name of the overlay feature group.
+
+    Returns:
+        folium.FeatureGroup to pass to st_folium's feature_group_to_add.
+    """
+    overlay = folium.FeatureGroup(name=layer_name)
+
+    extent = parse_bounds(returned)
+    zoom = (returned or {}).get("zoom") or MAP_ZOOM
+
+    for name in layer_names:
+        if not is_viewport_layer(name, display, viewport=True):
+            continue
+        spec = LAYER_REGISTRY[name]
+        gdf = load_layer(name)
+        if gdf is None or gdf.empty or spec["column"] not in gdf.columns:
+            continue
+
+        visible = visible_points(gdf, name, extent) if extent else gdf
+        if spec["viewport"].get("thin"):
+            visible = thin_points(visible, zoom)
+
+        # Colour by the whole layer's range so colours do not shift as the view moves
+        spec["builder"](overlay, visible, name, dict(spec, value_range=layer_value_range(gdf, name)), max_points)
+
+    return overlay
@@ -0,0 +1,132 @@
+import streamlit as st
+import pandas as pd
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from lihtc import engine
+from lihtc.memory import LAYER_CACHE_MB, SESSION_MB, SESSION_SIZES, deep_size, log_report, process_memory
+from lihtc.timing import configure_logging
+from lihtc.workspace import SCORE_CACHE
+from map_layers.map_cache import MAP_CACHE
+from map_layers.registry import HEAT_DATA_CACHE, SELECTION_SURFACE_CACHE
+
+#######################################################################################################################################
+# Page Configuration
+#######################################################################################################################################
+
+st.set_page_config(
+    page_title="LIHTC Diagnostics",
+    layout="wide"
+)
+configure_logging()
+
+def megabytes(nbytes):
+    return round(nbytes / 1024 ** 2, 2) if nbytes is not None else None
+
+#######################################################################################################################################
+# Memory Accounting
+#######################################################################################################################################
+
+st.title("Diagnostics")
+st.markdown("*Estimated memory held by this server process, by structure*")
+
+# Sizes are estimates (see lihtc/memory.py): pandas and NumPy buffers are exact, geometries
+# are charged per shape and coordinate, and Streamlit's own st.cache_data copies of the map
+# layers are not visible here
+process = process_memory()
+rendered_maps = MAP_CACHE.entries()
+map_stats = MAP_CACHE.stats()
+layer_caches = [HEAT_DATA_CACHE, SELECTION_SURFACE_CACHE]
+
+with st.spinner("Measuring loaded datasets..."):
+    data_rows = engine.cache_report()
+data_bytes = sum(row["bytes"] for row in data_rows)
+score_cache_bytes = deep_size(SCORE_CACHE)
+
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Process Memory (RSS)", f"{megabytes(process['rss_bytes']) or 0:,.0f} MB",
+            help=f"Peak: {megabytes(process['peak_rss_bytes']) or 0:,.0f} MB")
+col2.metric("Scoring Data", f"{megabytes(data_bytes):,.0f} MB",
+            help=f"Budget: {engine.DATA_MB:,.0f} MB (warning only)" if engine.DATA_MB else "No budget set (LIHTC_DATA_MB)")
+col3.metric("Rendered Maps", f"{megabytes(map_stats['bytes']):,.0f} MB",
+            help=f"Budget: {megabytes(map_stats['max_bytes']):,.0f} MB (LIHTC_MAP_CACHE_MB)")
+col4.metric("Layer Caches", f"{megabytes(sum(cache.current_bytes for cache in layer_caches)):,.1f} MB",
+            help=f"Budget: {LAYER_CACHE_MB:,.0f} MB each (LIHTC_LAYER_CACHE_MB)")
+
+# Datasets loaded by the scoring engine, largest first
+st.subheader("Scoring Data")
+if data_rows:
+    data_table = pd.DataFrame([
+        {"Cache": row["cache"], "Dataset": "" if row["item"] is None else str(row["item"]), "MB": megabytes(row["bytes"])}
+        for row in data_rows
+    ])
+    st.dataframe(data_table.sort_values("MB", ascending=False), hide_index=True, use_container_width=True)
+    st.caption("Data shared between caches (the scorer arguments hold the core datasets) is counted once, under the first cache.")
+else:
+    st.info("No scoring data loaded yet. Score a site to load it.")
+
+# Maps shared by every session, least recently used (next to be evicted) first
+st.subheader("Rendered Maps")
+st.caption(
+    f"{map_stats['entries']} maps · Hits: {map_stats['hits']} · Misses: {map_stats['misses']} · "
+    f"Evictions: {map_stats['evictions']} · Refused (over budget): {map_stats['rejected']}"
+)
+if rendered_maps:
+    st.dataframe(pd.DataFrame([
+        {"Layers": ", ".join(str(layer_key[0]) for layer_key in key), "MB": megabytes(nbytes)}
+        for key, nbytes in rendered_maps
+    ]), hide_index=True, use_container_width=True)
+
+# Derived layer data and site scores
+st.subheader("Other Caches")
+other_rows = []
+for cache in layer_caches:
+    stats = cache.stats()
+    other_rows.append({
+        "Cache": cache.name, "Entries": stats["entries"], "MB": megabytes(stats["bytes"]),
+        "Budget (MB)": megabytes(stats["max_bytes"]), "Evictions": stats["evictions"], "Refused": stats["rejected"]
+    })
+score_cache_stats = SCORE_CACHE.stats()
+other_rows.append({
+    "Cache": "Site scores", "Entries": score_cache_stats["entries"], "MB": megabytes(score_cache_bytes),
+    "Budget (MB)": None, "Evictions": None, "Refused": None
+})
+st.dataframe(pd.DataFrame(other_rows), hide_index=True, use_container_width=True)
+st.caption(f"Site scores are capped at {SCORE_CACHE.max_entries:,} sites rather than by size.")
+
+# Sessions measure themselves at the end of each rerun of the main page
+st.subheader("Sessions")
+ctx = get_script_run_ctx()
+if ctx is not None:
+    SESSION_SIZES.record(ctx.session_id, st.session_state.to_dict())
+sessions = SESSION_SIZES.report()
+if sessions:
+    session_table = pd.DataFrame([
+        {
+            "Session": ("This session · " if ctx is not None and session_id == ctx.session_id else "") + session_id[:8],
+            "MB": megabytes(usage["bytes"]),
+            "Largest Key": next(iter(usage["keys"]), ""),
+            "Last Seen (UTC)": pd.Timestamp(usage["updated"], unit="s").strftime("%H:%M:%S"),
+        }
+        for session_id, usage in sessions.items()
+    ])
+    st.dataframe(session_table.sort_values("MB", ascending=False), hide_index=True, use_container_width=True)
+    st.caption(
+        f"{len(sessions)} sessions active in the last hour, {megabytes(sum(u['bytes'] for u in sessions.values())):,.2f} MB in total. "
+        + (f"Sessions over {SESSION_MB:,.0f} MB (LIHTC_SESSION_MB) drop their rerun timings." if SESSION_MB else "")
+    )
+
+    if ctx is not None and ctx.session_id in sessions:
+        with st.expander("This Session by Key"):
+            st.dataframe(pd.DataFrame([
+                {"Key": key, "KB": round(nbytes / 1024, 1)} for key, nbytes in sessions[ctx.session_id]["keys"].items()
+            ]), hide_index=True, use_container_width=True)
+
+# The same figures as JSON lines on the lihtc.memory logger (LIHTC_LOG_LEVEL=INFO)
+if st.button("Write Report to Log"):
+    log_report("process", [process])
+    log_report("engine", data_rows)
+    log_report("rendered_maps", [{"layers": [layer_key[0] for layer_key in key], "bytes": nbytes} for key, nbytes in rendered_maps])
+    log_report("caches", [dict(cache.stats(), cache=cache.name) for cache in layer_caches]
+               + [dict(score_cache_stats, cache="Site scores", bytes=score_cache_bytes)])
+    log_report("sessions", [{"session": session_id, "bytes": usage["bytes"]} for session_id, usage in sessions.items()])
+    st.success("Report written to the server log.")
@@ -1,10 +1,14 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import joblib
-import pickle
+import time
 from pathlib import Path
 
+from lihtc.prediction import DEAL_FEATURES, FEATURES, LOCATION_SCORE_KEYS, predict_frame, snap
+from lihtc.train import check_metadata, read_metadata
+from lihtc.trees import TREES_PATH, load_trees
+from lihtc.workspace import SCORE_CACHE, predict_sites, score_sites
+
 # Configure page
 st.set_page_config(layout="wide", page_title="LIHTC Prediction Model")
 
@@ -48,13 +52,17 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Load model function
+# The trees exported from final_model.pkl (python -m lihtc.trees export) are evaluated with
+# NumPy alone, so the page does not need xgboost. A model trained with python -m lihtc.train
+# is refused if its file or inputs do not match the metadata written with it.
 @st.cache_resource
 def load_model():
     try:
-        model_path = Path("pages/models/final_model.pkl")
+        model_path = Path(TREES_PATH)
         if model_path.exists():
-            with open(model_path, 'rb') as f:
-                return pickle.load(f)
+            model = load_trees(model_path)
+            check_metadata(model)
+            return model
         else:
             st.error(f"Model file not found at {model_path}")
             return None
@@ -62,8 +70,36 @@ def load_model():
         st.error(f"Error loading model: {str(e)}")
         return None
 
+def run_prediction(input_features):
+    """
+    Run the model on one application and keep the result for display.
+
+    Args:
+        input_features (dict): Criterion label -> value, in the model's input order.
+    """
+    model = load_model()
+    if model is None:
+        st.error("Model could not be loaded. Please check the model file.")
+        return
+    try:
+        features = np.array([list(input_features.values())])
+        st.session_state.prediction_result = model.predict(features)[0]
+        st.session_state.prediction_confidence = model.predict_proba(features)[0]
+        st.session_state.input_features = input_features
+        st.session_state.prediction_made = True
+    except Exception as e:
+        st.error(f"Error making prediction: {str(e)}")
+
 # Page header
 st.title("LIHTC Scoring Prediction Model")
+model_metadata = read_metadata()
+if model_metadata is not None:
+    cv_metrics = model_metadata["search"]["cv_metrics"]
+    st.caption(
+        f"Model v{model_metadata['version']}, trained {model_metadata['created'][:10]} on "
+        f"{model_metadata['data']['rows']} applications · cross-validated accuracy "
+        f"{cv_metrics['accuracy']['mean']:.0%}, log loss {cv_metrics['log_loss']['mean']:.3f}"
+    )
 
 # Create main layout
 col1, col2 = st.columns([1, 2])
@@ -71,7 +107,54 @@ col1, col2 = st.columns([1, 2])
 with col1:
     st.subheader("Model Inputs")
     st.markdown("*Enter values for each scoring criterion*")
-    
+
+    # Location criteria from the scoring engine, for the site scored on the main page, a
+    # pinned site or any coordinates; scores already computed in this server are reused
+    with st.expander("Fill Location Scores from a Site"):
+        site_sources = ["Coordinates"]
+        if st.session_state.get("scores_calculated", False):
+            site_sources.insert(0, "Scored Site")
+        if st.session_state.get("pinned_sites"):
+            site_sources.append("Pinned Site")
+        site_source = st.radio("Site", site_sources, horizontal=True, key="fill_site_source")
+
+        if site_source == "Scored Site":
+            fill_site = {"lat": st.session_state.latitude, "lon": st.session_state.longitude}
+            st.caption(f"Site scored on the main page: {fill_site['lat']:.6f}, {fill_site['lon']:.6f}")
+        elif site_source == "Pinned Site":
+            fill_site = st.selectbox(
+                "Pinned Site",
+                st.session_state.pinned_sites,
+                format_func=lambda site: site["label"],
+                key="fill_pinned_site"
+            )
+        else:
+            fill_lat = st.text_input("Latitude", key="fill_lat")
+            fill_lon = st.text_input("Longitude", key="fill_lon")
+            try:
+                fill_site = {"lat": float(fill_lat), "lon": float(fill_lon)}
+            except ValueError:
+                fill_site = None
+
+        st.caption("The other criteria keep the values last submitted with the form below.")
+        fill_button = st.button("Fill and Predict", disabled=fill_site is None, use_container_width=True)
+
+    if fill_button:
+        try:
+            with st.spinner("Scoring location..."):
+                site_scores = score_sites([fill_site], SCORE_CACHE)[0][0]
+        except Exception as e:
+            site_scores = {"error": str(e)}
+        if site_scores["error"]:
+            st.error(f"Error scoring location: {site_scores['error']}")
+        else:
+            # Set before the form below is drawn, so its inputs show the filled values
+            for feature, score_key in LOCATION_SCORE_KEYS.items():
+                st.session_state[f"input_{feature}"] = snap(feature, site_scores[score_key])
+            run_prediction({
+                spec["label"]: st.session_state.get(f"input_{feature}", 0.0) for feature, spec in FEATURES.items()
+            })
+
     # Prediction form with your specific features
     with st.form("prediction_form"):
         st.markdown("### Scoring Criteria")
@@ -81,9 +164,9 @@ with col1:
             "Extended Affordability Commitment",
             min_value=0.0,
             max_value=6.0,
-            value=0.0,
             step=1.0,
-            help="Range: 0.0 - 6.0"
+            help="Range: 0.0 - 6.0",
+            key="input_extended_affordability"
         )
         if extended_affordability % 1.0 != 0:
             extended_affordability = round(extended_affordability)
@@ -95,9 +178,9 @@ with col1:
             "Desirable/Undesirable Activities",
             min_value=0.0,
             max_value=20.0,
-            value=0.0,
             step=1.0,
-            help="Range: 0.0 - 20.0"
+            help="Range: 0.0 - 20.0",
+            key="input_desirable_undesirable"
         )
         if desirable_undesirable % 1.0 != 0:
             desirable_undesirable = round(desirable_undesirable)
@@ -109,9 +192,9 @@ with col1:
             "Mixed Income Development",
             min_value=0.0,
             max_value=1.0,
-            value=0.0,
             step=1.0,
-            help="Range: 0.0 - 1.0"
+            help="Range: 0.0 - 1.0",
+            key="input_mixed_income"
         )
         if mixed_income % 1.0 != 0:
             mixed_income = round(mixed_income)
@@ -123,9 +206,9 @@ with col1:
             "Revitalization/Redevelopment Plans",
             min_value=0.0,
             max_value=10.0,
-            value=0.0,
             step=1.0,
-            help="Range: 0.0 - 10.0"
+            help="Range: 0.0 - 10.0",
+            key="input_revitalization"
         )
         if revitalization % 1.0 != 0:
             revitalization = round(revitalization)
@@ -137,9 +220,9 @@ with col1:
             "Deeper Targeting/Rent/Income Restrictions",
             min_value=0.0,
             max_value=3.0,
-            value=0.0,
             step=1.0,
-            help="Range: 0.0 - 3.0"
+            help="Range: 0.0 - 3.0",
+            key="input_deeper_targeting"
         )
         if deeper_targeting % 1.0 != 0:
             deeper_targeting = round(deeper_targeting)
@@ -151,9 +234,9 @@ with col1:
             "Favorable Financing",
             min_value=0.0,
             max_value=5.0,
-            value=0.0,
             step=0.5,
-            help="Range: 0.0 - 5.0"
+            help="Range: 0.0 - 5.0",
+            key="input_favorable_financing"
         )
         if favorable_financing % 0.5 != 0:
             favorable_financing = round(favorable_financing * 2) / 2.0
@@ -165,9 +248,9 @@ with col1:
             "Community Transportation Options",
             min_value=0.0,
             max_value=6.0,
-            value=0.0,
             step=0.5,
-            help="Range: 0.0 - 6.0"
+            help="Range: 0.0 - 6.0",
+            key="input_community_transportation"
         )
         if community_transportation % 0.5 != 0:
             community_transportation = round(community_transportation * 2) / 2.0
@@ -179,44 +262,15 @@ with col1:
     # Handle prediction
     if predict_button:
         with st.spinner("Running XGBoost prediction..."):
-            # Load the model
-            model = load_model()
-            
-            if model is not None:
-                try:
-                    # Prepare input features
-                    features = np.array([[
-                        extended_affordability,
-                        desirable_undesirable,
-                        mixed_income,
-                        revitalization,
-                        deeper_targeting,
-                        favorable_financing,
-                        community_transportation
-                    ]])
-                    
-                    # Make prediction
-                    prediction = model.predict(features)[0]
-                    confidence = model.predict_proba(features)[0]
-
-                    # Store results in session state
-                    st.session_state.prediction_result = prediction
-                    st.session_state.prediction_confidence = confidence
-                    st.session_state.input_features = {
-                        "Extended Affordability Commitment": extended_affordability,
-                        "Desirable/Undesirable Activities": desirable_undesirable,
-                        "Mixed Income Development": mixed_income,
-                        "Revitalization/Redevelopment Plans": revitalization,
-                        "Deeper Targeting/Rent/Income Restrictions": deeper_targeting,
-                        "Favorable Financing": favorable_financing,
-                        "Community Transportation Options": community_transportation
-                    }
-                    st.session_state.prediction_made = True
-                    
-                except Exception as e:
-                    st.error(f"Error making prediction: {str(e)}")
-            else:
-                st.error("Model could not be loaded. Please check the model file.")
+            run_prediction({
+                "Extended Affordability Commitment": extended_affordability,
+                "Desirable/Undesirable Activities": desirable_undesirable,
+                "Mixed Income Development": mixed_income,
+                "Revitalization/Redevelopment Plans": revitalization,
+                "Deeper Targeting/Rent/Income Restrictions": deeper_targeting,
+                "Favorable Financing": favorable_financing,
+                "Community Transportation Options": community_transportation
+            })
 
 with col2:
     st.subheader("Prediction Results")
@@ -230,9 +284,9 @@ with col2:
 
         # Calculate probability of selection based on prediction result
         if result == 1.0:
-            probability_of_selection = float(confidence[prediction])
+            probability_of_selection = float(confidence[int(result)])
         elif result == 0.0:
-            probability_of_selection = 1-float(confidence[prediction])
+            probability_of_selection = 1-float(confidence[int(result)])
         else:
             probability_of_selection = 0.0  # Default for unexpected values
 
@@ -272,6 +326,100 @@ with col2:
             with st.expander(criterion):
                 st.write(description)
 
+# Batch prediction: every row of an uploaded CSV is scored in one model call
+st.markdown("---")
+st.subheader("Batch Prediction")
+st.markdown("*Upload a CSV with one application per row to compare scenarios*")
+
+batch_col1, batch_col2 = st.columns([1, 2])
+
+with batch_col1:
+    batch_input = st.radio(
+        "Each Row Is",
+        ["Criteria Scores", "Site Location"],
+        horizontal=True,
+        help="Site Location rows need latitude and longitude columns. Their location criteria come from the scoring engine; other criteria come from matching columns if the CSV has them, otherwise from the form above.",
+        key="batch_input"
+    )
+    batch_file = st.file_uploader(
+        "Applications CSV",
+        type="csv",
+        help="One column per scoring criterion, named as in the form (e.g. \"Favorable Financing\" or favorable_financing), with values the form accepts. Other columns are kept in the results."
+    )
+    if batch_input == "Site Location":
+        template = pd.DataFrame([dict({"latitude": 33.749, "longitude": -84.388}, **{FEATURES[key]["label"]: 0.0 for key in DEAL_FEATURES})])
+    else:
+        template = pd.DataFrame([{spec["label"]: 0.0 for spec in FEATURES.values()}])
+    st.download_button(
+        "Download CSV Template",
+        data=template.to_csv(index=False),
+        file_name="lihtc_applications_template.csv",
+        mime="text/csv",
+        use_container_width=True
+    )
+
+with batch_col2:
+    if batch_file is not None:
+        model = load_model()
+        if model is not None:
+            try:
+                applications = pd.read_csv(batch_file)
+                start = time.perf_counter()
+                if batch_input == "Site Location":
+                    # Location scores and predictions in one pass; sites scored before are not rescored
+                    with st.spinner("Scoring site locations..."):
+                        batch_result, batch_stats = predict_sites(
+                            model,
+                            applications,
+                            SCORE_CACHE,
+                            deal={key: st.session_state.get(f"input_{key}", 0.0) for key in DEAL_FEATURES}
+                        )
+                else:
+                    batch_result, batch_stats = predict_frame(model, applications)
+                total_seconds = time.perf_counter() - start
+            except Exception as e:
+                st.error(f"Error scoring applications: {str(e)}")
+            else:
+                metric_col1, metric_col2, metric_col3 = st.columns(3)
+                metric_col1.metric("Applications Scored", f"{batch_stats['scored']:,} of {batch_stats['rows']:,}")
+                if batch_input == "Site Location":
+                    metric_col2.metric(
+                        "Locations Scored",
+                        f"{batch_stats['computed']:,} new",
+                        help=f"{batch_stats['cached']:,} sites reused scores already computed on this server."
+                    )
+                else:
+                    metric_col2.metric("Model Time", f"{batch_stats['seconds'] * 1000:.1f} ms")
+                metric_col3.metric(
+                    "Throughput",
+                    f"{batch_stats['rows'] / total_seconds:,.0f} rows/s" if total_seconds > 0 else "-",
+                    help="Rows per second for the whole upload, including input validation and any location scoring."
+                )
+                if batch_stats["errors"]:
+                    st.warning(
+                        f"{batch_stats['errors']} rows were not scored; the error column says why "
+                        "(e.g. a missing value, or one outside a criterion's range or steps)."
+                    )
+
+                st.dataframe(
+                    batch_result.sort_values("probability_of_selection", ascending=False),
+                    use_container_width=True,
+                    hide_index=True,
+                    column_config={
+                        "probability_of_selection": st.column_config.ProgressColumn(
+                            "Probability of Selection", format="%.2f", min_value=0.0, max_value=1.0
+                        )
+                    }
+                )
+                st.download_button(
+                    "Download Results",
+                    data=batch_result.to_csv(index=False),
+                    file_name="lihtc_predictions.csv",
+                    mime="text/csv"
+                )
+    else:
+        st.info("Upload a CSV of applications to score them all at once.")
+
 # Add model information section
 st.markdown("---")
 st.subheader("About the Model")
@@ -289,6 +437,8 @@ with st.expander("How to Use"):
     st.write("""
     1. **Enter Scores**: Input values for each of the 7 scoring criteria using the number inputs on the left
     2. **Generate Prediction**: Click the "Generate Prediction" button to run the model
+    3. **Fill from a Site**: Instead of typing the location criteria, fill them from the scoring engine for the site scored on the main page, a pinned site or any coordinates
+    4. **Batch Prediction**: Upload a CSV with one row per application to score many scenarios at once, then download the results with their probabilities. Rows can be criteria scores or site locations, which are scored by the engine first
     """)
 
 with st.expander("Score Ranges Reference"):
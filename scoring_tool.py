@@ -5,18 +5,25 @@
 import streamlit as st
 import pandas as pd
 import geopandas as gpd
-from streamlit_folium import st_folium
 import folium
+from collections import deque
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 from pathlib import Path
 
-from aggregate_scoring import (
-    CommunityTransportationOptions,
-    DesirableUndesirableActivities,
-    QualityEducation,
-    StableCommunities
-)
+from lihtc import engine
+from lihtc.breakdown import score_site_with_breakdown
+from lihtc.coalesce import Coalescer, site_key
+from lihtc.memory import SESSION_MB, SESSION_SIZES, log_report
+from lihtc.prediction import DEAL_FEATURES, FEATURES
+from lihtc.search import find_best_sites
+from lihtc.timing import configure_logging, finish_trace, span, start_trace
+from lihtc.workspace import MAX_PINNED_SITES, SCORE_CACHE, parse_sites, score_sites
 from map_layers.build_layers import *
-from map_layers.colours import YlGnBu_20, YlGnBu_5, status_colours
+from map_layers.map_cache import MAP_CACHE
+from map_layers.map_render import RenderedMap, st_rendered_map
+from map_layers.payload import payload_report
+from map_layers.registry import LAYER_REGISTRY, MAP_STYLES, build_map, layers_in_group, map_cache_key, prepare_layer_data
+from map_layers.viewport import build_viewport_overlay
 
 #######################################################################################################################################
 # Cached data loading functions
@@ -24,98 +31,123 @@ from map_layers.colours import YlGnBu_20, YlGnBu_5, status_colours
 
 @st.cache_data(persist="disk")
 def load_gdf(path):
-    return gpd.read_file(path)
-
-@st.cache_data(persist="disk")
-def load_csv(path, **kwargs):
-    return pd.read_csv(path, **kwargs)
-
-@st.cache_data
-def get_core_data():
-    return {
-        'df_transit': load_csv("data/community_transportation_options/georgia_transit_locations_with_hub.csv"),
-        'rural_gdf': load_gdf("data/shapefiles/usda_rural_tracts.geojson").to_crs("EPSG:4326"),
-        'csv_desirable': load_csv("data/desirable_undesirable_activities/desirable_activities_google_places_v3.csv"),
-        'csv_usda': load_csv("data/desirable_undesirable_activities/food_access_research_atlas.csv", dtype={'CensusTract': str}),
-        'tract_shape': load_gdf("data/shapefiles/tl_2024_13_tract/tl_2024_13_tract.shp"),
-        'csv_undesirable': load_csv("data/desirable_undesirable_activities/undesirable_hsi_tri_cdr_rcra_frs_google_places.csv"),
-        'df_school': load_csv("data/quality_education_areas/Option_C_Scores_Eligibility_with_BTO.csv"),
-        'df_indicators': load_csv("data/stable_communities/stable_communities_2024_processed_v3.csv")
-    }
-
-@st.cache_data
-def get_school_boundaries():
-    return [
-        load_gdf(f"data/quality_education_areas/{name}").to_crs("EPSG:4326")
-        for name in ["Administrative.geojson", "APSBoundaries.json", "DKE.json", "DKM.json", "DKBHS.json"]
-    ]
+    with span("load_gdf", path=path):
+        return gpd.read_file(path)
 
 @st.cache_data
 def get_map_layer_data(layer_name):
-    layer_paths = {
-        "Total Score": "data/maps/total_location_score/total_score_metro_atl.geojson",
-        "Community Transportation Score": "data/maps/community_transportation_options/transportation_options_score_metro_atl.geojson",
-        "Desirable/Undesirable Activities Score": "data/maps/desirable_undesirable_activities/desirable_undesirable_score_metro_atl.geojson",
-        "Quality Education Score": "data/maps/quality_education_areas/education_score_metro_atl_point_with_scores.geojson",
-        "Stable Communities Score": "data/maps/stable_communities/stable_communities_score_metro_atl.geojson",
-        "Past Applicant Locations": "data/maps/application_list_2022_2023_2024_metro_atl.geojson",
-        "Housing Needs": "data/maps/housing_need_characteristics/housing_need_indicators_metro_atl.geojson",
-        "Environmental Health Index": "data/maps/stable_communities/environmental_health_index_metro_atl.geojson",
-        "Jobs Proximity Index": "data/maps/stable_communities/jobs_proximity_index_metro_atl.geojson",
-        "Median Income": "data/maps/stable_communities/median_income_metro_atl.geojson",
-        "Percent Population Above Poverty Level": "data/maps/stable_communities/above_poverty_level_metro_atl.geojson",
-        "Transit Access Index": "data/maps/stable_communities/transit_access_index_metro_atl.geojson",
-    }
-    
-    if layer_name in layer_paths:
-        gdf = load_gdf(layer_paths[layer_name])
-        if gdf.crs != "EPSG:4326":
-            gdf = gdf.to_crs("EPSG:4326")
-        return gdf
+    if layer_name in LAYER_REGISTRY:
+        return prepare_layer_data(load_gdf(LAYER_REGISTRY[layer_name]["source"]), layer_name)
     return None
 
+def get_rendered_map_cache():
+    """One map cache per server process, shared by every session (and the Diagnostics page)."""
+    return MAP_CACHE
+
+@st.cache_resource
+def get_score_coalescer():
+    """Sessions scoring the same site at the same time share one computation."""
+    return Coalescer()
+
+def get_score_cache():
+    """Site scores shared by every session and page, so a site is scored once."""
+    return SCORE_CACHE
+
+def session_sites(show_site):
+    """Sites of the current session to draw in the map overlay."""
+    sites = []
+    if show_site and st.session_state.get("scores_calculated", False):
+        sites.append({
+            "lat": st.session_state.latitude,
+            "lon": st.session_state.longitude,
+            "label": "Your Site",
+            "popup": f"Total Score: {st.session_state.total_score:.2f}",
+        })
+        for rank, site in enumerate(st.session_state.get("best_sites", []), start=1):
+            sites.append({
+                "lat": site["lat"],
+                "lon": site["lon"],
+                "label": f"Best Nearby Site #{rank}",
+                "popup": f"Total Score: {site['total_score']:.2f} ({site['distance_miles']:.2f} mi away)",
+                "icon": "fa-flag",
+                "icon_colour": "#2E7D32",
+            })
+    if st.session_state.get("show_pinned_sites", True):
+        for site in st.session_state.get("pinned_sites", []):
+            sites.append({
+                "lat": site["lat"],
+                "lon": site["lon"],
+                "label": site["label"],
+                "popup": f"Not scored: {site['error']}" if site.get("error") else f"Total Score: {site['total_score']:.2f}",
+                "icon": "fa-thumb-tack",
+                "icon_colour": "#1565C0",
+            })
+    return sites
+
+def pin_sites(sites):
+    """Add sites to the comparison workspace, scoring only those not already cached."""
+    pinned = st.session_state.pinned_sites
+    pinned_keys = {(round(site["lat"], 6), round(site["lon"], 6)) for site in pinned}
+    new_sites = []
+    for site in sites:
+        site_coords = (round(site["lat"], 6), round(site["lon"], 6))
+        if site_coords not in pinned_keys:
+            pinned_keys.add(site_coords)
+            new_sites.append(site)
+    new_sites = new_sites[:MAX_PINNED_SITES - len(pinned)]
+    results, computed = score_sites(new_sites, get_score_cache(), get_score_coalescer())
+    pinned.extend(dict(site, **scores) for site, scores in zip(new_sites, results))
+    failed = sum(scores["error"] is not None for scores in results)
+    return len(new_sites), computed, failed
+
+def record_session_memory():
+    """
+    Measure this session's state for the Diagnostics page and the log, and log the shared map
+    cache's size after this rerun. Over LIHTC_SESSION_MB the session's rerun timings, the only
+    history it keeps, are dropped.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    usage = SESSION_SIZES.record(ctx.session_id, st.session_state.to_dict())
+    if SESSION_MB and usage["bytes"] > SESSION_MB * 1024 ** 2 and st.session_state.perf_history:
+        st.session_state.perf_history.clear()
+        usage = SESSION_SIZES.record(ctx.session_id, st.session_state.to_dict())
+    log_report("session", [{"session": ctx.session_id, "bytes": usage["bytes"], "largest": next(iter(usage["keys"]), None)}])
+    log_report("map_cache", [dict(get_rendered_map_cache().stats(), session=ctx.session_id)])
+    return usage
+
+def render_shared_map(cached_map, overlays, key, returned_objects=()):
+    """
+    Show a shared, already rendered base map with this session's overlays. The base map is
+    never rendered again and the overlays are rendered on their own, so sessions showing the
+    same map do not wait for each other.
+    """
+    with span("st_folium", map=key):
+        return st_rendered_map(
+            cached_map,
+            overlays,
+            key=key,
+            width=700,
+            height=600,
+            returned_objects=returned_objects
+        )
+
 #######################################################################################################################################
 # Score Calculation Function
 #######################################################################################################################################
 
 def calculate_scores_if_needed(latitude, longitude):
     """Calculate scores only when button is clicked"""
-    core_data = get_core_data()
-    school_boundaries = get_school_boundaries()
-    
-    kwargs = {
-        # --- CommunityTransportationOptions ---
-        "transit_df": core_data['df_transit'],
-
-        # --- DesirableUndesirableActivities ---
-        "rural_gdf_unary_union": core_data['rural_gdf'].geometry.union_all(),
-        "desirable_csv": core_data['csv_desirable'], 
-        "grocery_csv": core_data['csv_desirable'],
-        "usda_csv": core_data['csv_usda'],
-        "tract_shapefile": core_data['tract_shape'],
-        "undesirable_csv": core_data['csv_undesirable'],
-
-        # --- QualityEducation ---
-        "school_df": core_data['df_school'],
-        "school_boundary_gdfs": school_boundaries,       
-        "state_avg_by_year": {
-            "elementary": {2018: 77.8, 2019: 79.9},
-            "middle": {2018: 76.2, 2019: 77},
-            "high": {2018: 75.3, 2019: 78.8}
-        },
-
-        # --- StableCommunities ---
-        "indicators_df": core_data['df_indicators'],
-        "tracts_shp": core_data['tract_shape'],
-    }
-
-    # Calculate scores
-    ct_score = CommunityTransportationOptions(latitude, longitude, **kwargs).calculate_score()
-    du_score = DesirableUndesirableActivities(latitude, longitude, **kwargs).calculate_score()
-    qe_score = QualityEducation(latitude, longitude, **kwargs).calculate_score()
-    sc_score = StableCommunities(latitude, longitude, **kwargs).calculate_score()
-
-    return ct_score, du_score, qe_score, sc_score
+    # Scoring data is loaded once per server process by the engine and shared by every session
+    key = site_key(latitude, longitude, engine.engine_data_version())
+    # One span per scorer is recorded inside (lihtc.engine.run_scorers)
+    with span("calculate_scores"):
+        # Keyed apart from plain score_site calls (pinning), whose results have no breakdown
+        scores = get_score_coalescer().run(("breakdown",) + key, score_site_with_breakdown, latitude, longitude)
+    # Pinning the site or predicting from it (prediction page) then reuses these scores
+    get_score_cache().put(key, scores)
+    return scores
 
 #######################################################################################################################################
 # Main Page Configuration and Formatting
@@ -123,6 +155,11 @@ def calculate_scores_if_needed(latitude, longitude):
 
 st.set_page_config(layout="wide")
 
+# Spans of this rerun are collected for the sidebar Performance panel (and logged as JSON
+# lines when LIHTC_LOG_LEVEL=INFO); the trace is finished at the end of the script
+configure_logging()
+start_trace("scoring_tool")
+
 st.markdown("""
     <style>
         /* === Global Defaults === */
@@ -178,11 +215,20 @@ if 'lat_main' not in st.session_state:
 if 'lon_main' not in st.session_state:
     st.session_state.lon_main = ""
 
-if 'map_cache' not in st.session_state:
-    st.session_state.map_cache = {}
 if 'last_layer_selection' not in st.session_state:
     st.session_state.last_layer_selection = []
 
+if 'pinned_sites' not in st.session_state:
+    st.session_state.pinned_sites = []
+
+# Timings of this session's most recent reruns, for the Performance panel
+PERFORMANCE_RERUNS = 10
+if 'perf_history' not in st.session_state:
+    st.session_state.perf_history = deque(maxlen=PERFORMANCE_RERUNS)
+
+# Rendered maps live in a process-wide cache rather than in each session
+map_cache = get_rendered_map_cache()
+
 #######################################################################################################################################
 # Sidebar - Theme Selection
 #######################################################################################################################################
@@ -345,7 +391,66 @@ with st.sidebar:
         }
         </style>
         """, unsafe_allow_html=True)
-    
+
+    # Shared map cache statistics
+    with st.expander("Map Cache"):
+        cache_stats = map_cache.stats()
+        st.caption(
+            f"{cache_stats['entries']} maps, "
+            f"{cache_stats['bytes'] / 1024 ** 2:.1f} of {cache_stats['max_bytes'] / 1024 ** 2:.0f} MB"
+        )
+        st.caption(
+            f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · "
+            f"Evictions: {cache_stats['evictions']}"
+        )
+
+    # Embedded GeoJSON size per layer, before and after pruning/rounding
+    with st.expander("Map Payload"):
+        layer_payloads = payload_report()
+        if not layer_payloads:
+            st.caption("No layers built yet.")
+        for layer_name, stats in layer_payloads.items():
+            if stats["bytes_before"] is None:
+                st.caption(f"{layer_name}: {stats['features']:,} points, {stats['bytes_after'] / 1024:,.0f} KB")
+                continue
+            st.caption(
+                f"{layer_name}: {stats['bytes_before'] / 1024:,.0f} KB → "
+                f"{stats['bytes_after'] / 1024:,.0f} KB ({stats['saved']:.0%} smaller)"
+            )
+
+    # Site scores computed vs. shared with a concurrent identical request
+    with st.expander("Score Coalescing"):
+        coalescer_stats = get_score_coalescer().stats()
+        st.caption(
+            f"Computed: {coalescer_stats['computed']} · Shared: {coalescer_stats['coalesced']} · "
+            f"In progress: {coalescer_stats['in_flight']}"
+        )
+        score_cache_stats = get_score_cache().stats()
+        st.caption(
+            f"Site score cache: {score_cache_stats['entries']} sites · "
+            f"Hits: {score_cache_stats['hits']} · Misses: {score_cache_stats['misses']}"
+        )
+
+    # Where this session's recent reruns spent their time (lihtc.timing spans)
+    with st.expander("Performance"):
+        perf_history = st.session_state.perf_history
+        if not perf_history:
+            st.caption("Timings appear after the first rerun.")
+        else:
+            rerun_rows = []
+            for trace in reversed(perf_history):
+                slowest = trace.slowest()
+                rerun_rows.append({
+                    "Rerun": trace.started.astimezone().strftime("%H:%M:%S"),
+                    "Total (ms)": round(trace.seconds * 1000),
+                    "Slowest": slowest["name"] if slowest else "",
+                    "Slowest (ms)": round(slowest["ms"]) if slowest else None,
+                })
+            st.caption(f"Last {len(perf_history)} reruns, newest first")
+            st.dataframe(pd.DataFrame(rerun_rows), hide_index=True, use_container_width=True)
+            st.caption("Spans of the latest rerun")
+            st.dataframe(pd.DataFrame(perf_history[-1].rows()), hide_index=True, use_container_width=True)
+
     # Navigation Section
     # st.markdown("---")
     # st.header("Pages")
@@ -414,17 +519,18 @@ with main_col1:
                 st.warning("Please enter valid numeric coordinates.")
             else:
                 with st.spinner("Calculating scores..."):
-                    ct_score, du_score, qe_score, sc_score = calculate_scores_if_needed(latitude, longitude)
-                    total_score = ct_score + du_score + qe_score + sc_score
+                    scores = calculate_scores_if_needed(latitude, longitude)
 
                 st.session_state.scores_calculated = True
                 st.session_state.latitude = latitude
                 st.session_state.longitude = longitude
-                st.session_state.ct_score = ct_score
-                st.session_state.du_score = du_score
-                st.session_state.qe_score = qe_score
-                st.session_state.sc_score = sc_score
-                st.session_state.total_score = total_score
+                st.session_state.ct_score = scores["ct_score"]
+                st.session_state.du_score = scores["du_score"]
+                st.session_state.qe_score = scores["qe_score"]
+                st.session_state.sc_score = scores["sc_score"]
+                st.session_state.total_score = scores["total_score"]
+                st.session_state.score_breakdown = scores["breakdown"]
+                st.session_state.best_sites = []
 
     # Score display
     if hasattr(st.session_state, 'scores_calculated') and st.session_state.scores_calculated:
@@ -474,6 +580,164 @@ with main_col1:
                     unsafe_allow_html=True
                 )
 
+        # What each category found for this site, collected while scoring it
+        breakdown = st.session_state.get("score_breakdown")
+        if breakdown:
+            with st.expander("Score Details"):
+                # Sections the scorers did not record (see lihtc.breakdown) say so, rather than
+                # reading as "nothing found"
+                not_reported = breakdown.get("not_reported", {})
+
+                def note_not_reported(section):
+                    if section in not_reported:
+                        st.caption(f"Not reported by the scorer: {', '.join(not_reported[section])}.")
+
+                for category, components in breakdown["categories"].items():
+                    st.markdown(f"**{category}**")
+                    note_not_reported(category)
+                    if not components and category not in not_reported:
+                        st.caption("No components reported.")
+                    for label, value in components.items():
+                        if isinstance(value, (list, dict)):
+                            st.caption(label)
+                            st.json(value, expanded=False)
+                        else:
+                            st.markdown(f"{label}: {value}")
+
+                st.markdown("**Census Tract**")
+                note_not_reported("Census Tract")
+                if breakdown["tract"]:
+                    st.caption(f"GEOID {breakdown['tract']['GEOID']}")
+                    st.json(breakdown["tract"], expanded=False)
+                elif "Census Tract" not in not_reported:
+                    st.caption("The scorer found no census tract for the site.")
+
+                st.markdown("**School Attendance Zones**")
+                note_not_reported("School Attendance Zones")
+                if breakdown["attendance_zones"]:
+                    st.dataframe(pd.DataFrame(breakdown["attendance_zones"]), hide_index=True)
+                elif "School Attendance Zones" not in not_reported:
+                    st.caption("The scorer found no attendance zone for the site.")
+
+        # Highest-scoring points within a radius of the site, drawn on the map as flags
+        with st.expander("Find Best Nearby Site"):
+            with st.form(key="best_site_form"):
+                search_radius = st.slider("Search Radius (miles)", min_value=0.1, max_value=2.0, value=0.5, step=0.1)
+                search_top_k = st.slider("Number of Locations", min_value=1, max_value=10, value=3)
+                search_button = st.form_submit_button("Search")
+
+            if search_button:
+                try:
+                    with st.spinner("Searching nearby locations..."):
+                        # About 40 lattice points across the search diameter, roughly one per block at 0.5 miles
+                        search = find_best_sites(
+                            st.session_state.latitude,
+                            st.session_state.longitude,
+                            radius_miles=search_radius,
+                            top_k=search_top_k,
+                            step_miles=max(0.025, search_radius / 20)
+                        )
+                except Exception as e:
+                    st.error(f"Error searching nearby locations: {str(e)}")
+                else:
+                    st.session_state.best_sites = search["sites"]
+                    st.session_state.best_site_stats = search["stats"]
+                    if search["stats"]["skipped"]:
+                        st.warning(
+                            f"{search['stats']['skipped']} locations could not be scored and were skipped "
+                            f"(first error: {search['stats']['skip_reason']})."
+                        )
+
+            if st.session_state.get("best_sites"):
+                best_sites = pd.DataFrame(st.session_state.best_sites)
+                best_sites = best_sites[["lat", "lon", "distance_miles", "total_score", "ct_score", "du_score", "qe_score", "sc_score"]]
+                best_sites.columns = ["Latitude", "Longitude", "Miles Away", "Total", "Transport", "Desirable/Undesirable", "Education", "Stable"]
+                st.dataframe(best_sites.round(4), hide_index=True)
+                stats = st.session_state.best_site_stats
+                st.caption(
+                    f"{stats['candidates']} locations considered, {stats['scored']} fully scored, "
+                    f"{stats['pruned']} ruled out early. Enable \"Show Site on Map\" to see them."
+                )
+
+    # Site comparison workspace: pinned sites are scored together and drawn as one map overlay
+    st.markdown("---")
+    with st.expander("Compare Sites"):
+        with st.form(key="pin_sites_form"):
+            pin_text = st.text_area(
+                "Sites to Pin",
+                placeholder="33.7490, -84.3880, Downtown\n33.7701, -84.3870",
+                help="One site per line: latitude, longitude and an optional label. Sites already pinned are skipped."
+            )
+            pin_button = st.form_submit_button("Pin Sites")
+
+        pin_col1, pin_col2 = st.columns(2)
+        with pin_col1:
+            pin_current_button = st.button(
+                "Pin Current Site",
+                disabled=not st.session_state.get("scores_calculated", False),
+                use_container_width=True
+            )
+        with pin_col2:
+            clear_pinned_button = st.button(
+                "Clear All",
+                disabled=not st.session_state.pinned_sites,
+                use_container_width=True
+            )
+
+        if pin_button:
+            new_sites, errors = parse_sites(pin_text)
+            for error in errors:
+                st.warning(error)
+            if new_sites:
+                with st.spinner("Scoring sites..."):
+                    added, computed, failed = pin_sites(new_sites)
+                st.caption(f"Pinned {added} sites; {computed - failed} newly scored, {added - computed} from cache.")
+                if failed:
+                    st.warning(f"{failed} sites could not be scored; see the Error column.")
+                if added < len(new_sites):
+                    st.caption(f"Skipped {len(new_sites) - added} sites already pinned or over the {MAX_PINNED_SITES}-site limit.")
+
+        if pin_current_button:
+            latitude, longitude = st.session_state.latitude, st.session_state.longitude
+            _, _, failed = pin_sites([{"lat": latitude, "lon": longitude, "label": f"{latitude:.6f}, {longitude:.6f}"}])
+            if failed:
+                st.warning("The site could not be scored; see the Error column.")
+
+        if clear_pinned_button:
+            st.session_state.pinned_sites = []
+            st.session_state.pop("remove_pinned_sites", None)
+
+        if st.session_state.pinned_sites:
+            st.caption(f"{len(st.session_state.pinned_sites)} of {MAX_PINNED_SITES} sites pinned. Click a column header to sort.")
+            pinned_sites = pd.DataFrame(st.session_state.pinned_sites)
+            pinned_sites = pinned_sites.reindex(columns=["label", "lat", "lon", "total_score", "ct_score", "du_score", "qe_score", "sc_score", "error"])
+            pinned_sites.columns = ["Site", "Latitude", "Longitude", "Total", "Transport", "Desirable/Undesirable", "Education", "Stable", "Error"]
+            if pinned_sites["Error"].isna().all():
+                pinned_sites = pinned_sites.drop(columns="Error")
+            st.dataframe(pinned_sites.sort_values("Total", ascending=False).round(4), hide_index=True)
+
+            pinned_labels = [site["label"] for site in st.session_state.pinned_sites]
+            remove_indices = st.multiselect(
+                "Remove Sites",
+                options=range(len(pinned_labels)),
+                format_func=lambda i: pinned_labels[i],
+                key="remove_pinned_sites"
+            )
+            if st.button("Remove Selected", disabled=not remove_indices):
+                st.session_state.pinned_sites = [
+                    site for i, site in enumerate(st.session_state.pinned_sites) if i not in remove_indices
+                ]
+                st.session_state.pop("remove_pinned_sites", None)
+                st.rerun()
+
+            st.checkbox(
+                "Show Pinned Sites on Maps",
+                value=st.session_state.get("show_pinned_sites", True),
+                key="show_pinned_sites"
+            )
+        else:
+            st.caption("No sites pinned yet.")
+
 
 #######################################################################################################################################
 # Right Column: Interactive Map Display
@@ -493,17 +757,20 @@ with main_col2:
         with st.form(key="map_layer_form"):
             selected_score_layer = st.selectbox(
                 "Choose one score layer to display:",
-                options=[
-                    "Total Score", 
-                    "Desirable/Undesirable Activities Score", 
-                    "Community Transportation Score",
-                    "Stable Communities Score",
-                    "Quality Education Score"
-                ],
+                options=layers_in_group("location"),
                 index=0,
                 key="score_layer_selection"
             )
 
+            # Standard points/polygons or a smoothed heatmap of the same scores
+            map_style = st.radio(
+                "Map Style",
+                options=MAP_STYLES,
+                horizontal=True,
+                help="Heatmaps draw every point or tract centroid as a smoothed gradient and load faster than the standard layers.",
+                key="map_style_selection"
+            )
+
             # Checkbox for showing past applicant locations
             show_applicants = st.checkbox(
                 "Overlay Past Applicant Locations",
@@ -522,6 +789,27 @@ with main_col2:
                 key="max_points_slider"
             )
 
+            # Fixed non-location model inputs for the Selection Probability layer
+            with st.expander("Deal Structure (Selection Probability layer)"):
+                st.caption("The grid supplies the Desirable/Undesirable and Community Transportation scores; these inputs are the same everywhere.")
+                for feature in DEAL_FEATURES:
+                    st.number_input(
+                        FEATURES[feature]["label"],
+                        min_value=0.0,
+                        max_value=FEATURES[feature]["max"],
+                        value=st.session_state.get(f"deal_{feature}", 0.0),
+                        step=FEATURES[feature]["step"],
+                        key=f"deal_{feature}"
+                    )
+
+            # Only send the points inside the current map view
+            viewport_mode = st.checkbox(
+                "Load Points for Visible Area Only",
+                value=st.session_state.get("viewport_mode", False),
+                help="Points are loaded for the part of the map you are looking at, thinned when zoomed out and at full resolution when zoomed in. Panning or zooming reloads them. The applicant filters on the map are not available in this mode.",
+                key="viewport_mode"
+            )
+
             # Checkbox for showing user point on map
             show_user_point = st.checkbox(
                 "Show Site on Map",
@@ -577,116 +865,48 @@ with main_col2:
             )
 
         # Map rendering logic
-        # Create a cache key based on selected layers and max points
-        cache_key = f"{'-'.join(sorted(selected_layers))}_{max_points}"
-        def all_layers_present(cached_map, selected_layers):
-            return all(any(layer_name in str(child) for child in cached_map._children.values()) for layer_name in selected_layers)
-
-        # Check if the map already exists in the cache
-        map_exists = cache_key in st.session_state.map_cache
-        cached_map = st.session_state.map_cache.get(cache_key) if map_exists else None
-
-        # Determine if need to rebuild the map
-        should_rebuild = (
-            not map_exists
-            or selected_layers != st.session_state.get("last_layer_selection", [])
-            or not all_layers_present(cached_map, selected_layers)
-        )
+        # Cache key from the layer registry: layer set, max points and each layer's data version
+        map_style = st.session_state.get("map_style_selection", MAP_STYLES[0])
+        viewport_mode = st.session_state.get("viewport_mode", False)
+        deal = {feature: st.session_state.get(f"deal_{feature}", 0.0) for feature in DEAL_FEATURES}
+        cache_key = map_cache_key(selected_layers, max_points, map_style, viewport_mode, deal)
+
+        def build_location_map():
+            return RenderedMap(build_map(selected_layers, get_map_layer_data, max_points, map_style, warn=st.warning, viewport=viewport_mode, deal=deal))
 
-        # If selected layers are provided, build or update the map
+        # If selected layers are provided, build the map or reuse the shared one
         if selected_layers:
-            if should_rebuild:
-                with st.spinner("Loading map layers..."):
-                    try:
-                        m = folium.Map(
-                            location=[33.886297, -84.362697],
-                            zoom_start=9,
-                            tiles="cartodbpositron",
-                            prefer_canvas=True
-                        )
-                        for layer_name in selected_layers:
-                            gdf = get_map_layer_data(layer_name)
-                            if gdf is None or gdf.empty:
-                                continue
-                            if layer_name == "Past Applicant Locations":
-                                add_coloured_markers_to_map(
-                                    folium_map=m,
-                                    gdf=gdf,
-                                    lat_col="lat",
-                                    lon_col="lon",
-                                    colour_by="status",
-                                    layer_name="Past Applicant Locations",
-                                    clustered=False,
-                                    categorical_colours=status_colours
-                                )
-                            elif layer_name == "Total Score":
-                                layer, legend = add_lat_lon_score_layer(
-                                    gdf, "Total Score", "score", YlGnBu_20, 4, max_points
-                                )
-                                layer.add_to(m)
-                                if legend:
-                                    legend.add_to(m)
-                            elif layer_name == "Desirable/Undesirable Activities Score":
-                                layer, legend = add_lat_lon_score_layer(
-                                    gdf, layer_name, "score", YlGnBu_20, 4, max_points
-                                )
-                                layer.add_to(m)
-                                if legend:
-                                    legend.add_to(m)
-                            elif layer_name == "Community Transportation Score":
-                                layer, legend = add_lat_lon_score_layer(
-                                    gdf, layer_name, "score", YlGnBu_5, 4, max_points
-                                )
-                                layer.add_to(m)
-                                if legend:
-                                    legend.add_to(m)
-                            elif layer_name == "Stable Communities Score":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "score", layer_name, simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Quality Education Score":
-                                layer, legend = add_lat_lon_score_layer(
-                                    gdf, layer_name, "score", YlGnBu_5, 4, max_points
-                                )
-                                layer.add_to(m)
-                                if legend:
-                                    legend.add_to(m)
-
-                        st.session_state.map_cache[cache_key] = m
-
-                    except Exception as e:
-                        st.error(f"Error creating map: {str(e)}")
-                        st.stop()
+            try:
+                if cache_key in map_cache:
+                    cached_map = map_cache.get_or_build(cache_key, build_location_map)
+                else:
+                    with st.spinner("Loading map layers..."):
+                        cached_map = map_cache.get_or_build(cache_key, build_location_map)
+            except Exception as e:
+                st.error(f"Error creating map: {str(e)}")
+                st.stop()
 
             st.session_state.last_layer_selection = selected_layers.copy()
 
-            cached_map = st.session_state.map_cache[cache_key]
-
-            # If user point should be shown, add it to the map
-            if show_user_point and st.session_state.get("scores_calculated", False):
-                #import copy
-                #display_map = copy.deepcopy(cached_map)
-                display_map = cached_map
-                folium.Marker(
-                    [st.session_state.latitude, st.session_state.longitude],
-                    tooltip="Your Site",
-                    popup=f"Total Score: {st.session_state.total_score:.2f}",
-                    icon=folium.Icon(
-                    color="white",         
-                    icon_color="#B8860B",  
-                    icon="star"
-                    )   
-                ).add_to(display_map)
-            else:
-                display_map = cached_map
-
-            # Render the map using st_folium
-            st_folium(
-                display_map,
-                width=700,
-                height=600,
-                returned_objects=[],
-                key=f"main_map_{hash(tuple(sorted(selected_layers)))}"
+            # The site marker is a separate overlay, so the base map stays cached client-side
+            map_key = f"main_map_{hash(tuple(sorted(selected_layers)))}"
+            overlays = [build_site_overlay(session_sites(show_user_point))]
+
+            # In viewport mode the points visible at the last reported bounds/zoom are a second overlay
+            if viewport_mode:
+                overlays.append(build_viewport_overlay(
+                    selected_layers,
+                    st.session_state.get(map_key),
+                    get_map_layer_data,
+                    max_points,
+                    map_style
+                ))
+
+            render_shared_map(
+                cached_map,
+                overlays,
+                key=map_key,
+                returned_objects=["bounds", "zoom"] if viewport_mode else ()
             )
 
         else:
@@ -697,18 +917,20 @@ with main_col2:
         with st.form(key="stable_map_layer_form"):
             stable_score_layer = st.selectbox(
                 "Choose one Stable Communities layer to display:",
-                options=[
-                    "Stable Communities Score",
-                    "Environmental Health Index",
-                    "Jobs Proximity Index",
-                    "Median Income",
-                    "Percent Population Above Poverty Level",
-                    "Transit Access Index"
-                ],
+                options=layers_in_group("stable"),
                 index=0,
                 key="stable_score_layer_selection"
             )
 
+            # Standard points/polygons or a smoothed heatmap of the same scores
+            map_style = st.radio(
+                "Map Style",
+                options=MAP_STYLES,
+                horizontal=True,
+                help="Heatmaps draw every point or tract centroid as a smoothed gradient and load faster than the standard layers.",
+                key="stable_map_style_selection"
+            )
+
             # Checkbox for showing past applicant locations
             stable_show_applicants = st.checkbox(
                 "Overlay Past Applicant Locations",
@@ -762,107 +984,29 @@ with main_col2:
             )
 
         # Map rendering logic
-        stable_cache_key = f"stable-{'-'.join(sorted(stable_selected_layers))}"
-
-        def stable_layers_present(cached_map, selected_layers):
-            return all(any(layer_name in str(child) for child in cached_map._children.values()) for layer_name in selected_layers)
+        stable_map_style = st.session_state.get("stable_map_style_selection", MAP_STYLES[0])
+        stable_cache_key = map_cache_key(stable_selected_layers, display=stable_map_style)
 
-        # Check if the map already exists in the cache
-        map_exists = stable_cache_key in st.session_state.map_cache
-        cached_map = st.session_state.map_cache.get(stable_cache_key) if map_exists else None
+        def build_stable_map():
+            return RenderedMap(build_map(stable_selected_layers, get_map_layer_data, display=stable_map_style, warn=st.warning))
 
-        # Determine if need to rebuild the map
-        should_rebuild = (
-            not map_exists
-            or stable_selected_layers != st.session_state.get("stable_layer_selection", [])
-            or not stable_layers_present(cached_map, stable_selected_layers)
-        )
-
-        # If selected layers are provided, build or update the map
+        # If selected layers are provided, build the map or reuse the shared one
         if stable_selected_layers:
-            if should_rebuild:
-                with st.spinner("Loading stable community layers..."):
-                    try:
-                        m = folium.Map(
-                            location=[33.886297, -84.362697],
-                            zoom_start=9,
-                            tiles="cartodbpositron",
-                            prefer_canvas=True
-                        )
-                        for layer_name in stable_selected_layers:
-                            gdf = get_map_layer_data(layer_name)
-
-                            if gdf is None or gdf.empty:
-                                continue
-                            if layer_name == "Past Applicant Locations":
-                                add_coloured_markers_to_map(
-                                    folium_map=m,
-                                    gdf=gdf,
-                                    lat_col="lat",
-                                    lon_col="lon",
-                                    colour_by="status",
-                                    layer_name="Past Applicant Locations",
-                                    clustered=False,
-                                    categorical_colours=status_colours
-                                )
-                            elif layer_name == "Stable Communities Score":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "score", "Stable Communities Score", simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Environmental Health Index":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "Environmental Health Index", layer_name, simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Jobs Proximity Index":
-                                add_tract_score_layer(
-                                    m, gdf, "Jobs Proximity Index", layer_name, simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Median Income":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "Median Income", layer_name, simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Percent Population Above Poverty Level":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "Percent of Population Above the Poverty Level", layer_name, simplify_tolerance=0.005
-                                )
-                            elif layer_name == "Transit Access Index":
-                                add_tract_score_layer_stable(
-                                    m, gdf, "Transit Access Index", layer_name, simplify_tolerance=0.005
-                                )
-
-                        st.session_state.map_cache[stable_cache_key] = m
-
-                    except Exception as e:
-                        st.error(f"Error creating map: {str(e)}")
-                        st.stop()
-
-            cached_map = st.session_state.map_cache[stable_cache_key]
-
-            # If user point should be shown, add it to the map
-            if stable_show_user_point and st.session_state.get("scores_calculated", False):
-                #import copy
-                #display_map = copy.deepcopy(cached_map)
-                display_map = cached_map
-                folium.Marker(
-                    [st.session_state.latitude, st.session_state.longitude],
-                    tooltip="Your Site",
-                    popup=f"Total Score: {st.session_state.total_score:.2f}",
-                    icon=folium.Icon(
-                        color="white",
-                        icon_color="#B8860B",
-                        icon="fa-star",
-                        prefix="fa"
-                    )
-                ).add_to(display_map)
-            else:
-                display_map = cached_map
-
-            # Render the map using st_folium
-            st_folium(
-                display_map,
-                width=700,
-                height=600,
-                returned_objects=[],
+            try:
+                if stable_cache_key in map_cache:
+                    cached_map = map_cache.get_or_build(stable_cache_key, build_stable_map)
+                else:
+                    with st.spinner("Loading stable community layers..."):
+                        cached_map = map_cache.get_or_build(stable_cache_key, build_stable_map)
+            except Exception as e:
+                st.error(f"Error creating map: {str(e)}")
+                st.stop()
+
+            # The site marker is a separate overlay, so the base map stays cached client-side
+            site_overlay = build_site_overlay(session_sites(stable_show_user_point))
+            render_shared_map(
+                cached_map,
+                [site_overlay],
                 key=f"stable_map_{hash(tuple(sorted(stable_selected_layers)))}"
             )
         else:
@@ -873,15 +1017,20 @@ with main_col2:
         with st.form(key="housing_needs_map_layer_form"):
             housing_needs_layer = st.selectbox(
                 "Choose one Housing Needs indicator layer to display:",
-                options=[
-                    "Severe Housing Problems (% of Renters ≤80% AMI)",
-                    "YoY Population Growth (2018-2022)",
-                    "Employment Growth Rate (2020-2022)",
-                ],
+                options=layers_in_group("housing"),
                 index=0,
                 key="housing_needs_layer_selection"
             )
 
+            # Standard points/polygons or a smoothed heatmap of the same scores
+            map_style = st.radio(
+                "Map Style",
+                options=MAP_STYLES,
+                horizontal=True,
+                help="Heatmaps draw every point or tract centroid as a smoothed gradient and load faster than the standard layers.",
+                key="housing_needs_map_style_selection"
+            )
+
             # Checkbox for showing past applicant locations
             housing_needs_show_applicants = st.checkbox(
                 "Overlay Past Applicant Locations",
@@ -901,7 +1050,7 @@ with main_col2:
             housing_needs_update_button = st.form_submit_button("Update Map")
 
         #  Handle form submission
-        housing_needs_layer = st.session_state.get("housing_needs_layer_selection", "Percent of Population with Severe Housing Needs")
+        housing_needs_layer = st.session_state.get("housing_needs_layer_selection", layers_in_group("housing")[0])
         housing_needs_show_applicants = st.session_state.get("housing_needs_show_applicants", True)
 
         housing_needs_selected_layers = [housing_needs_layer]
@@ -934,112 +1083,40 @@ with main_col2:
             )
 
         # Map rendering logic
-        housing_needs_cache_key = f"housing-needs-{'-'.join(sorted(housing_needs_selected_layers))}"
-        def housing_needs_layers_present(cached_map, selected_layers):
-            return all(any(layer_name in str(child) for child in cached_map._children.values()) for layer_name in selected_layers)
-
-        # Check if the map already exists in the cache
-        map_exists = housing_needs_cache_key in st.session_state.map_cache
-        cached_map = st.session_state.map_cache.get(housing_needs_cache_key) if map_exists else None
-
-        # Determine if need to rebuild the map
-        should_rebuild = (
-            not map_exists
-            or housing_needs_selected_layers != st.session_state.get("housing_needs_layer_selection", [])
-            or not housing_needs_layers_present(cached_map, housing_needs_selected_layers)
-        )
+        housing_needs_map_style = st.session_state.get("housing_needs_map_style_selection", MAP_STYLES[0])
+        housing_needs_cache_key = map_cache_key(housing_needs_selected_layers, display=housing_needs_map_style)
 
-        # If selected layers are provided, build or update the map
-        if housing_needs_selected_layers:
-            if should_rebuild:
-                with st.spinner("Loading housing needs layers..."):
-                    try:
-                        m = folium.Map(
-                            location=[33.886297, -84.362697],
-                            zoom_start=9,
-                            tiles="cartodbpositron",
-                            prefer_canvas=True
-                        )
+        def build_housing_needs_map():
+            return RenderedMap(build_map(housing_needs_selected_layers, get_map_layer_data, display=housing_needs_map_style, warn=st.warning))
 
-                        housing_needs_gdf = get_map_layer_data("Housing Needs")
-                        applicants_gdf = get_map_layer_data("Past Applicant Locations")
-
-                        housing_needs_field_map = {
-                            "Severe Housing Problems (% of Renters ≤80% AMI)": "% of rental units occupied by 80% AMI and below with Severe Housing Problems",
-                            "YoY Population Growth (2018-2022)": "avg_pop_yoy_growth_2018_2021",
-                            "Employment Growth Rate (2020-2022)": "avg_emp_growth_2020_2022"
-                        }
-
-                        for layer_name in housing_needs_selected_layers:
-                            if layer_name == "Past Applicant Locations":
-                                gdf = applicants_gdf
-                            else:
-                                gdf = housing_needs_gdf
-                            if gdf is None or gdf.empty:
-                                continue
-
-                            if layer_name == "Past Applicant Locations":
-                                add_coloured_markers_to_map(
-                                    folium_map=m,
-                                    gdf=gdf,
-                                    lat_col="lat",
-                                    lon_col="lon",
-                                    colour_by="status",
-                                    layer_name="Past Applicant Locations",
-                                    clustered=False,
-                                    categorical_colours=status_colours
-                                )
-                            else:
-                                gdf.columns = gdf.columns.str.strip()
-                                data_field = housing_needs_field_map.get(layer_name)
-                                if data_field and data_field in gdf.columns:
-                                    gdf[data_field] = pd.to_numeric(gdf[data_field], errors="coerce") * 100
-                                    gdf[data_field] = gdf[data_field].round(1)
-                                    add_tract_score_layer_stable(
-                                        m, gdf, data_field, layer_name, simplify_tolerance=0.005
-                                    )
-                                    print(gdf[data_field].max(), gdf[data_field].min())
-                                else:
-                                    st.warning(f"Field '{data_field}' not found in dataset.")
-
-                        st.session_state.map_cache[housing_needs_cache_key] = m
-
-                    except Exception as e:
-                        st.error(f"Error creating map: {str(e)}")
-                        st.stop()
-
-            cached_map = st.session_state.map_cache[housing_needs_cache_key]
-
-            # If user point should be shown, add it to the map
-            if housing_needs_show_user_point and st.session_state.get("scores_calculated", False):
-                #import copy
-                #display_map = copy.deepcopy(cached_map)
-                display_map = cached_map
-                folium.Marker(
-                    [st.session_state.latitude, st.session_state.longitude],
-                    tooltip="Your Site",
-                    popup=f"Total Score: {st.session_state.total_score:.2f}",
-                    icon=folium.Icon(
-                        color="white",
-                        icon_color="#B8860B",
-                        icon="fa-star",
-                        prefix="fa"
-                    )
-                ).add_to(display_map)
-            else:
-                display_map = cached_map
-
-            # Render the map using st_folium
-            st_folium(
-                display_map,
-                width=700,
-                height=600,
-                returned_objects=[],
+        # If selected layers are provided, build the map or reuse the shared one
+        if housing_needs_selected_layers:
+            try:
+                if housing_needs_cache_key in map_cache:
+                    cached_map = map_cache.get_or_build(housing_needs_cache_key, build_housing_needs_map)
+                else:
+                    with st.spinner("Loading housing needs layers..."):
+                        cached_map = map_cache.get_or_build(housing_needs_cache_key, build_housing_needs_map)
+            except Exception as e:
+                st.error(f"Error creating map: {str(e)}")
+                st.stop()
+
+            # The site marker is a separate overlay, so the base map stays cached client-side
+            site_overlay = build_site_overlay(session_sites(housing_needs_show_user_point))
+            render_shared_map(
+                cached_map,
+                [site_overlay],
                 key=f"housing_needs_map_{hash(tuple(sorted(housing_needs_selected_layers)))}"
             )
 
         else:
             st.info("Select a layer to display the map.")
 
+#######################################################################################################################################
+# Rerun timing and session memory
+#######################################################################################################################################
 
-
+rerun_trace = finish_trace()
+if rerun_trace is not None:
+    st.session_state.perf_history.append(rerun_trace)
+record_session_memory()